@@ -0,0 +1,317 @@
+import threading
+import time
+from datetime import datetime
+
+import analytics
+import rollups
+from slot_registry import SlotRegistry, parse_code
+from timeutil import from_epoch, to_epoch, to_text
+
+
+# A session still holding its slot: not paid, and not let out by a gate exit (which records exit_ts)
+_OPEN = "p.slot = slots.code AND p.paid = 0 AND p.exit_ts IS NULL"
+
+# Mark free slots holding an open session occupied by the newest one
+OCCUPY_OPEN_SQL = (
+    "UPDATE slots SET status='occupied', version=?, parking_id=("
+    f"  SELECT MAX(p.id) FROM parkings p WHERE {_OPEN}) "
+    f"WHERE status='free' AND EXISTS (SELECT 1 FROM parkings p WHERE {_OPEN})"
+)
+
+
+def _record_change(db, *timestamps):
+    """Let occupancy caches know about a session write that reaches into past days"""
+    analytics.record_change(db, timestamps, to_epoch(datetime.now()))
+
+
+class SlotAllocator:
+    """Slot occupancy backed by the `slots` table, shared by every worker.
+
+    Claims and releases are single conditional UPDATEs committed together with
+    the matching `parkings` write, so two workers can never hand out the same
+    slot. Each worker keeps a SlotRegistry as a read cache. Every state change
+    bumps `app_state.slots_version` and stamps the slot row with it, so a
+    worker catches up by re-reading only the rows newer than its cached version.
+    """
+
+    def __init__(self):
+        self.registry = None
+        self.version = None
+        self.refreshed_at = None  # time.monotonic() of the last refresh()
+        self._lock = threading.RLock()
+
+    # --------- Read cache --------- #
+    @staticmethod
+    def current_version(db):
+        row = db.execute("SELECT value FROM app_state WHERE key='slots_version'").fetchone()
+        return row[0] if row else 0
+
+    def refresh(self, db):
+        """Return the registry, re-reading only slots changed by other workers."""
+        version = self.current_version(db)
+        with self._lock:
+            if self.registry is None:
+                self._load(db, version)
+            elif version != self.version:
+                rows = db.execute(self._SLOT_STATE_SQL + " WHERE s.version > ?", (self.version,)).fetchall()
+                if any(row["code"] not in self.registry for row in rows):
+                    self._load(db, version)
+                else:
+                    self._apply(rows)
+                    self.version = version
+            self.refreshed_at = time.monotonic()
+            return self.registry
+
+    def recent(self, max_age):
+        """The registry without a database read, if refresh() ran in the last `max_age` seconds; else None"""
+        with self._lock:
+            if self.registry is None or time.monotonic() - self.refreshed_at > max_age:
+                return None
+            return self.registry
+
+    def invalidate(self):
+        with self._lock:
+            self.registry = None
+            self.version = None
+            self.refreshed_at = None
+
+    _SLOT_STATE_SQL = (
+        "SELECT s.code, s.level, s.zone, COALESCE(s.rank, s.id) AS rank, s.status, s.parking_id, "
+        "p.vehicle_number, p.entry_ts, p.exit_ts "
+        "FROM slots s LEFT JOIN parkings p ON p.id = s.parking_id"
+    )
+
+    def _load(self, db, version):
+        rows = db.execute(self._SLOT_STATE_SQL).fetchall()
+        registry = SlotRegistry()
+        for row in rows:
+            registry.add(row["code"], level=row["level"], zone=row["zone"], rank=row["rank"])
+        self.registry = registry
+        self._apply(row for row in rows if row["status"] == "occupied")
+        self.version = version
+
+    def _apply(self, rows):
+        for row in rows:
+            if row["status"] == "occupied":
+                self.registry.occupy(
+                    row["code"],
+                    vehicle=row["vehicle_number"],
+                    entry_time=from_epoch(row["entry_ts"]),
+                    exit_time=from_epoch(row["exit_ts"]),
+                    parking_id=row["parking_id"],
+                )
+            else:
+                self.registry.release(row["code"])
+                # Another worker may have opened and closed sessions here since we last looked
+                self.registry.forget_session(row["code"])
+
+    # --------- Atomic state changes --------- #
+    def add_slots(self, db, slots):
+        """Insert new free slots in one transaction, stamped so every worker's cache picks them up.
+
+        `slots` are codes, or (code, level, zone) tuples as read by layout.load().
+        They are ranked after the existing slots, in the given order.
+        """
+        return self.import_layout(db, slots, update=False)
+
+    def import_layout(self, db, slots, update=True):
+        """Add slots and, with update=True, re-level/re-zone/re-rank the ones that exist.
+
+        Existing slots keep their occupancy. Returns the number of new slots.
+        """
+        slots = [(s, *parse_code(s)[::2]) if isinstance(s, str) else tuple(s) for s in slots]
+        on_conflict = (" ON CONFLICT (code) DO UPDATE SET level=excluded.level, zone=excluded.zone,"
+                       " rank=excluded.rank, version=excluded.version") if update else ""
+        with db:
+            before = db.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+            first_rank = db.execute("SELECT COALESCE(MAX(COALESCE(rank, id)), 0) + 1 FROM slots").fetchone()[0]
+            version = self._bump(db)
+            db.executemany(
+                "INSERT INTO slots (code, level, zone, rank, status, version) VALUES (?, ?, ?, ?, 'free', ?)"
+                + on_conflict,
+                [(code, level, zone, first_rank + i, version) for i, (code, level, zone) in enumerate(slots)],
+            )
+            added = db.execute("SELECT COUNT(*) FROM slots").fetchone()[0] - before
+        # Layout changes are rare; let every worker, this one included, reload
+        self.invalidate()
+        return added
+
+    def recover(self, db):
+        """Repair slot occupancy from open sessions, e.g. after restoring an old backup.
+
+        A free slot with an open session in it (unpaid and without an exit
+        time, so not let out at the exit gate) is marked occupied by it. An
+        occupied slot whose session is missing or already paid takes the
+        newest open session in that slot (an indexed MAX), or is freed if
+        there is none. Returns the number of slots repaired.
+        """
+        with db:
+            version = self._bump(db)
+            repaired = db.execute(OCCUPY_OPEN_SQL, (version,)).rowcount
+            repaired += db.execute(
+                "UPDATE slots SET version=?, parking_id=("
+                f"  SELECT MAX(p.id) FROM parkings p WHERE {_OPEN}) "
+                "WHERE status='occupied' AND (parking_id IS NULL OR NOT EXISTS ("
+                "  SELECT 1 FROM parkings p WHERE p.id = slots.parking_id AND p.paid = 0))",
+                (version,),
+            ).rowcount
+            db.execute("UPDATE slots SET status='free', version=? WHERE status='occupied' AND parking_id IS NULL",
+                       (version,))
+            if not repaired:
+                db.rollback()
+        if repaired:
+            self.invalidate()
+        return repaired
+
+
+    def claim(self, db, code, vehicle, user_id, entry_time, exit_time=None, check=None):
+        """Open a parking session in `code` if it is free. Returns the parking id or None.
+
+        `check(db)` runs first, in the same write transaction, and may raise to
+        refuse the claim (e.g. the slot is reserved).
+        """
+        with db:
+            if check is not None:
+                db.execute("BEGIN IMMEDIATE")
+                check(db)
+            parking_id, version = self.claim_in(db, code, vehicle, user_id, entry_time, exit_time)
+        if parking_id is None:
+            return None
+        with self._lock:
+            self._track(version)
+            if self.registry is not None and code in self.registry:
+                self.registry.occupy(code, vehicle=vehicle, entry_time=entry_time,
+                                     exit_time=exit_time, parking_id=parking_id)
+        return parking_id
+
+    def claim_in(self, db, code, vehicle, user_id, entry_time, exit_time=None):
+        """claim() inside the caller's transaction. Returns (parking id, version) or (None, None).
+
+        Writes nothing when the slot is taken. The cache is not updated; it
+        catches up on the next refresh() after the caller commits.
+        """
+        if not db.execute("UPDATE slots SET status='occupied' WHERE code=? AND status='free'", (code,)).rowcount:
+            return None, None
+        parking_id = db.execute(
+            "INSERT INTO parkings (vehicle_number, slot, user_id, entry_time, exit_time, entry_ts, exit_ts, paid, paid_amount) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0)",
+            (vehicle, code, user_id, to_text(entry_time), to_text(exit_time),
+             to_epoch(entry_time), to_epoch(exit_time)),
+        ).lastrowid
+        version = self._bump(db)
+        db.execute("UPDATE slots SET parking_id=?, version=? WHERE code=?", (parking_id, version, code))
+        rollups.record_entry(db, code, to_epoch(entry_time))
+        _record_change(db, to_epoch(entry_time), to_epoch(exit_time))
+        return parking_id, version
+
+    def release(self, db, code, parking_id, amount, exit_time):
+        """Mark the session paid and free its slot. Returns False if another worker got there first."""
+        with db:
+            version = self.release_in(db, code, parking_id, amount, exit_time)
+        if version is None:
+            return False
+        with self._lock:
+            self._track(version)
+            if self.registry is not None and code in self.registry:
+                self.registry.release(code)
+        return True
+
+    def release_in(self, db, code, parking_id, amount, exit_time):
+        """release() inside the caller's transaction. Returns the new version, or None if nothing was released."""
+        released = db.execute(
+            "UPDATE slots SET status='free', parking_id=NULL WHERE code=? AND status='occupied' AND parking_id=?",
+            (code, parking_id),
+        ).rowcount
+        if not released:
+            return None
+        version = self._bump(db)
+        db.execute("UPDATE slots SET version=? WHERE code=?", (version, code))
+        db.execute(
+            "UPDATE parkings SET exit_time=?, exit_ts=?, paid=1, paid_amount=? WHERE id=?",
+            (to_text(exit_time), to_epoch(exit_time), amount, parking_id),
+        )
+        rollups.record_exit(db, code, to_epoch(exit_time))
+        rollups.record_payment(db, code, to_epoch(exit_time), amount)
+        _record_change(db, to_epoch(exit_time))
+        return version
+
+    def pay_in(self, db, code, parking_id, amount, exit_time):
+        """Take payment for a session that has already left its slot (e.g. at the exit gate).
+
+        Runs inside the caller's transaction. Returns False, writing nothing,
+        if the session was paid meanwhile.
+        """
+        row = db.execute("SELECT exit_ts FROM parkings WHERE id=? AND paid=0", (parking_id,)).fetchone()
+        paid = db.execute(
+            "UPDATE parkings SET paid=1, paid_amount=?, exit_time=?, exit_ts=? WHERE id=? AND paid=0",
+            (amount, to_text(exit_time), to_epoch(exit_time), parking_id),
+        ).rowcount
+        if paid:
+            rollups.record_payment(db, code, to_epoch(exit_time), amount)
+            # The exit moves from the gate's time to the payment's
+            _record_change(db, row[0], to_epoch(exit_time))
+        return bool(paid)
+
+    def write_batch(self, db, ops):
+        """Apply a sequence of entries and exits inside the caller's transaction.
+
+        The caller must hold the write lock (BEGIN IMMEDIATE) and have planned
+        `ops` against refresh(), so every slot is free or held as expected.
+        Ops are ("entry", code, vehicle, user_id, entry_time) or
+        ("exit", code, parking_id, exit_time), where parking_id may be
+        ("batch", i) for the i-th entry of this batch. Exits record the exit
+        time and free the slot; payment is still taken by confirm_payment.
+        Returns the parking id each op opened or closed. This worker's cache
+        catches up on its next refresh().
+        """
+        entries = [op for op in ops if op[0] == "entry"]
+        new_ids = []
+        if entries:
+            db.executemany(
+                "INSERT INTO parkings (vehicle_number, slot, user_id, entry_time, entry_ts, paid, paid_amount) "
+                "VALUES (?, ?, ?, ?, ?, 0, 0)",
+                [(vehicle, code, user_id, to_text(entry_time), to_epoch(entry_time))
+                 for _kind, code, vehicle, user_id, entry_time in entries],
+            )
+            # AUTOINCREMENT hands out consecutive ids while we hold the write lock
+            last = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+            new_ids = list(range(last - len(entries) + 1, last + 1))
+
+        version = self._bump(db)
+        next_id = iter(new_ids)
+        results, slot_state, exit_rows, changes = [], {}, [], []
+        for op in ops:
+            if op[0] == "entry":
+                _kind, code, _vehicle, _user_id, entry_time = op
+                parking_id = next(next_id)
+                slot_state[code] = ("occupied", parking_id)
+                changes.append((code, to_epoch(entry_time), 1, 0, 0, 0))
+            else:
+                _kind, code, parking_id, exit_time = op
+                if isinstance(parking_id, tuple):
+                    parking_id = new_ids[parking_id[1]]
+                slot_state[code] = ("free", None)
+                exit_rows.append((to_text(exit_time), to_epoch(exit_time), parking_id))
+                changes.append((code, to_epoch(exit_time), 0, 1, 0, 0))
+            results.append(parking_id)
+
+        if exit_rows:
+            db.executemany("UPDATE parkings SET exit_time=?, exit_ts=? WHERE id=?", exit_rows)
+        db.executemany(
+            "UPDATE slots SET status=?, parking_id=?, version=? WHERE code=?",
+            [(status, parking_id, version, code) for code, (status, parking_id) in slot_state.items()],
+        )
+        rollups.record_many(db, changes)
+        _record_change(db, *(change[1] for change in changes))
+        return results
+
+    @staticmethod
+    def _bump(db):
+        db.execute("UPDATE app_state SET value = value + 1 WHERE key='slots_version'")
+        return db.execute("SELECT value FROM app_state WHERE key='slots_version'").fetchone()[0]
+
+    def _track(self, version):
+        # Our own write only advances the cache if nobody else wrote in between;
+        # otherwise the next refresh() re-reads the gap, including this change.
+        if self.version is not None and version == self.version + 1:
+            self.version = version
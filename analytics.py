@@ -0,0 +1,250 @@
+"""Occupancy analytics: bucketed occupancy, peak-hour heatmaps and dwell times.
+
+Sessions are loaded as NumPy columns (entry, exit, slot) in batches and
+aggregated with array operations, never row by row in Python. Occupancy is a
+sweep over boundary events: each session adds +1 where it starts and -1
+where it ends on a bucket grid, and a cumulative sum turns those into the
+number of sessions covering each bucket.
+
+Results are computed per day and per slot. OccupancyCache keeps days that
+are over; levels and the whole garage are sums of slots. A finished day
+only changes through a backdated write (a late gate event, a past entry
+time), which record_change() logs in the database so every worker's cache
+drops that day on its next sync().
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DAY = 86400
+BATCH = 50000
+WIDTHS = (900, 1800, 3600)  # bucket sizes that divide a day evenly
+
+# Sessions overlapping [start, end), in no particular order. Open sessions run
+# until `now`. Each half is a range on idx_parkings_exit_ts, so sessions that
+# ended before `start` are never read.
+_SESSIONS_SQL = (
+    "SELECT entry_ts, ? AS exit_ts, 0 AS closed, COALESCE(slot, '') FROM {table} "
+    "WHERE exit_ts IS NULL AND entry_ts < ? "
+    "UNION ALL "
+    "SELECT entry_ts, exit_ts, 1, COALESCE(slot, '') FROM {table} "
+    "WHERE exit_ts > ? AND +entry_ts < ?"  # unary +: range on exit_ts, not entry_ts
+)
+
+
+# ------------------ LOADING ------------------ #
+def load_sessions(rows, batch=BATCH):
+    """(entry, exit, closed, slot) arrays from rows of those four values, read `batch` rows at a time"""
+    columns = ([], [], [], [])
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, batch))
+        if not chunk:
+            break
+        entry, exit_, closed, slot = zip(*chunk)
+        columns[0].append(np.fromiter(entry, np.int64, len(chunk)))
+        columns[1].append(np.fromiter(exit_, np.int64, len(chunk)))
+        columns[2].append(np.fromiter(closed, bool, len(chunk)))
+        columns[3].append(np.array(slot, dtype=object))
+    dtypes = (np.int64, np.int64, bool, object)
+    return tuple(np.concatenate(parts) if parts else np.empty(0, dtype)
+                 for parts, dtype in zip(columns, dtypes))
+
+
+def sessions(db, start, end, now_ts, read_archive=None):
+    """Sessions overlapping [start, end) as columns; `read_archive` as in plates.history()"""
+    args = (now_ts, end, start, end)
+    if read_archive is None:
+        return load_sessions(db.execute(_SESSIONS_SQL.format(table="parkings"), args))
+    return load_sessions(read_archive(_SESSIONS_SQL.format(table="all_parkings"), args, order_by=None))
+
+
+# ------------------ AGGREGATION ------------------ #
+def occupancy(entry, exit_, group, n_groups, start, end, width):
+    """Average occupied slots per group in each `width`-second bucket of [start, end).
+
+    Buckets a session covers completely come from a difference array (+1
+    after its first bucket, -1 at its last) and a cumulative sum. Its partly
+    covered first and last buckets get their seconds added directly.
+    Returns an (n_groups, buckets) array.
+    """
+    n = (end - start) // width
+    e = np.clip(entry, start, end)
+    x = np.clip(exit_, start, end)
+    keep = x > e
+    e, x, g = e[keep], x[keep], group[keep]
+    cols = n + 1  # column n catches sessions still running at `end`
+    size = n_groups * cols
+    first = g * cols + (e - start) // width
+    last = g * cols + (x - start) // width
+
+    span = last > first
+    diff = (np.bincount(first[span] + 1, minlength=size + 1)[:size]
+            - np.bincount(last[span], minlength=size))
+    full = diff.reshape(n_groups, cols).cumsum(axis=1) * width
+
+    bucket_start = start + (first - g * cols) * width
+    same = ~span
+    partial = np.bincount(
+        np.concatenate([first[same], first[span], last[span]]),
+        weights=np.concatenate([
+            x[same] - e[same],                          # starts and ends in one bucket
+            bucket_start[span] + width - e[span],       # head of a longer session
+            x[span] - (start + (last[span] - g[span] * cols) * width),  # its tail
+        ]),
+        minlength=size,
+    ).reshape(n_groups, cols)
+    return ((full + partial)[:, :n] / width).astype(np.float32)
+
+
+def dwell(entry, exit_, closed, group, n_groups, start, days):
+    """(sessions, total seconds) per day and group of closed sessions exiting in those days: (days, n_groups) arrays"""
+    day = (exit_ - start) // DAY
+    done = closed & (exit_ >= start) & (day < days)
+    cell = day[done] * n_groups + group[done]
+    size = days * n_groups
+    return (np.bincount(cell, minlength=size).reshape(days, n_groups),
+            np.bincount(cell, weights=exit_[done] - entry[done], minlength=size).reshape(days, n_groups))
+
+
+def compute_days(columns, first_day, days, width):
+    """Per-day results for `days` days from first_day: {day: (slots, occupancy, dwell count, dwell seconds)}"""
+    entry, exit_, closed, slot = columns
+    # Number the slots in a dict; np.unique would sort millions of Python strings
+    index = {}
+    group = np.fromiter((index.setdefault(code, len(index)) for code in slot), np.int64, len(slot))
+    labels = list(index)
+    grid = occupancy(entry, exit_, group, len(labels), first_day, first_day + days * DAY, width)
+    count, seconds = dwell(entry, exit_, closed, group, len(labels), first_day, days)
+    per_day = DAY // width
+    return {first_day + i * DAY: (labels, grid[:, i * per_day:(i + 1) * per_day], count[i], seconds[i])
+            for i in range(days)}
+
+
+# ------------------ REPORTS ------------------ #
+def report(results, width, by="all", level_of=None):
+    """Combine per-day results, oldest first, into series per `by` ("all", "level" or "slot")"""
+    days = sorted(results)
+    per_day = DAY // width
+    slots = sorted({code for day in days for code in results[day][0]})
+    if by == "slot":
+        names = slots
+        key = {code: code for code in slots}
+    elif by == "level":
+        key = {code: f"level:{level_of(code)}" for code in slots}
+        names = sorted(set(key.values()))
+    else:
+        key = {code: "all" for code in slots}
+        names = ["all"]
+    row = {name: i for i, name in enumerate(names)}
+
+    series = np.zeros((max(len(names), 1), len(days) * per_day), np.float32)
+    count = np.zeros(len(series))
+    seconds = np.zeros(len(series))
+    for d, day in enumerate(days):
+        labels, grid, day_count, day_seconds = results[day]
+        if not len(labels):
+            continue
+        rows = np.fromiter((row[key[code]] for code in labels), int, len(labels))
+        np.add.at(series, (rows, slice(d * per_day, (d + 1) * per_day)), grid)
+        np.add.at(count, rows, day_count)
+        np.add.at(seconds, rows, day_seconds)
+    names = names or ["all"]
+    return {
+        "start": days[0] if days else None,
+        "width": width,
+        "series": {name: np.round(series[i].astype(float), 2).tolist() for i, name in enumerate(names)},
+        "dwell": {name: {"sessions": int(count[i]),
+                         "avg_minutes": round(float(seconds[i] / count[i]) / 60, 1) if count[i] else None}
+                  for i, name in enumerate(names)},
+        "heatmap": heatmap(series.sum(axis=0), days[0] if days else 0, width),
+    }
+
+
+def heatmap(values, start, width):
+    """Average of a bucket series by weekday (Monday first) and hour: a 7 x 24 list"""
+    ts = start + np.arange(len(values)) * width
+    cell = ((ts // DAY + 3) % 7) * 24 + (ts % DAY) // 3600  # 1970-01-01 was a Thursday
+    total = np.bincount(cell, weights=values, minlength=7 * 24)
+    n = np.bincount(cell, minlength=7 * 24)
+    means = np.divide(total, n, out=np.zeros(7 * 24), where=n > 0)
+    return np.round(means, 2).reshape(7, 24).tolist()
+
+
+# ------------------ CACHE ------------------ #
+# --------- Caching --------- #
+def record_change(db, timestamps, now_ts):
+    """Log a session write touching `timestamps`, inside its transaction, if any falls before today"""
+    today = now_ts - now_ts % DAY
+    past = [ts for ts in timestamps if ts is not None and ts < today]
+    if past:
+        first = min(past)
+        db.execute("INSERT INTO occupancy_changes (day) VALUES (?)", (first - first % DAY,))
+
+
+class OccupancyCache:
+    """Per-day results of days that are over, most recently used kept"""
+
+    def __init__(self, max_days=366):
+        self.max_days = max_days
+        self.hits = 0
+        self.misses = 0
+        self._days = OrderedDict()   # (day, width) -> result
+        self._seq = 0                # last occupancy_changes row applied
+        self._lock = threading.Lock()
+
+    def sync(self, db):
+        """Drop cached days from the first one changed since the last sync (see record_change())"""
+        seq, first = db.execute(
+            "SELECT MAX(seq), MIN(day) FROM occupancy_changes WHERE seq > ?", (self._seq,)).fetchone()
+        if seq is None:
+            return
+        with self._lock:
+            for key in [key for key in self._days if key[0] >= first]:
+                del self._days[key]
+            self._seq = max(self._seq, seq)
+
+    def days(self, load, first_day, last_day, width, now_ts):
+        """Results for every day in [first_day, last_day]. load(start, end) returns their session columns.
+
+        Days not cached are loaded in runs of consecutive days, one query per run.
+        """
+        today = now_ts - now_ts % DAY
+        wanted = range(first_day, last_day + 1, DAY)
+        results = {}
+        with self._lock:
+            for day in wanted:
+                if (day, width) in self._days:
+                    self._days.move_to_end((day, width))
+                    results[day] = self._days[(day, width)]
+        self.hits += len(results)
+        missing = [day for day in wanted if day not in results]
+        self.misses += len(missing)
+
+        for run in _runs(missing):
+            computed = compute_days(load(run[0], run[-1] + DAY), run[0], len(run), width)
+            results.update(computed)
+            with self._lock:
+                for day, result in computed.items():
+                    if day < today:
+                        self._days[(day, width)] = result
+                while len(self._days) > self.max_days:
+                    self._days.popitem(last=False)
+        return results
+
+    def invalidate(self):
+        with self._lock:
+            self._days.clear()
+
+
+def _runs(days):
+    """Split sorted days into runs of consecutive days"""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][-1] + DAY:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
@@ -1,107 +1,369 @@
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, jsonify, Response, abort, has_request_context
+from werkzeug.security import generate_password_hash
+from markupsafe import Markup
 from datetime import datetime
 import os
+import atexit
+import threading
+from functools import wraps
+import csv
+import json
+import hmac
+from time import perf_counter
+
+import click
+
+from slot_registry import parse_code
+from facilities import Facility, FacilityRouter
+from group_commit import WriteTimeout
+from db_pool import TimedConnection, get_pool, set_query_observer
+from migrations import migrate
+from timeutil import from_epoch, to_epoch, to_text, date_to_epoch
+from tariff import Tariff, DEFAULT_TARIFF, reprice, reprice_query
+from reservations import SlotReserved, expected_exit
+import gate_events
+import gate_commands
+import exports
+import history
+import layout
+import plates
+import slot_map
+import archive
+import assets
+import analytics
+from auth_pool import HashingPool, PoolBusy, TokenBucketLimiter
+from user_cache import UserCache
+from receipt_cache import ClosedReceipt
+from metrics import Metrics
+import rollups
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
+app.config["DB_POOL"] = True  # False = plain connect-per-request (for benchmarking)
+app.config["TARIFF"] = dict(DEFAULT_TARIFF)  # see tariff.py for the rate table fields
+app.config["HASH_POOL_WORKERS"] = 2        # processes for password hashing; 0 = hash inline
+app.config["HASH_POOL_MAX_PENDING"] = 32   # queued hashes before logins get a fast "busy"
+app.config["LOGIN_LIMIT_ACCOUNT"] = (5, 1 / 30)   # burst, attempts refilled per second
+app.config["LOGIN_LIMIT_IP"] = (200, 5)           # generous: a whole site may share one IP
+app.config["USER_CACHE_SIZE"] = 1024
+app.config["USER_CACHE_TTL"] = 60          # seconds; bounds staleness across workers
+app.config["SLOT_RECEIPT_MAX_AGE"] = 1     # seconds a worker's slot view may answer receipt revalidations
+app.config["METRICS"] = True               # route/SQL timings served at /metrics
+app.config["METRICS_TOKEN"] = os.environ.get("PMS_METRICS_TOKEN")  # Bearer token for scrapers; admins need none
+app.config["SLOW_QUERY_MS"] = 100
+app.config["WALK_IN_HOLD_MINUTES"] = 60   # assumed stay when checking a walk-in against reservations
+app.config["MAX_RESERVATION_HOURS"] = 24
+app.config["GROUP_COMMIT"] = False          # park/pay writes share commits on a writer thread
+app.config["GROUP_COMMIT_WINDOW_MS"] = 2
+app.config["GROUP_COMMIT_MAX_BATCH"] = 256
+app.config["GROUP_COMMIT_TIMEOUT_S"] = 10   # a write not started by then is dropped with a 503
+app.config["LAYOUT_FILE"] = None            # JSON/CSV garage layout used to create slots (see layout.py)
+app.config["ARCHIVE_DIR"] = "archive"       # monthly partitions of closed sessions
+app.config["ARCHIVE_RETENTION_DAYS"] = 180  # paid sessions older than this leave the hot table
+app.config["ANALYTICS_MAX_DAYS"] = 92       # longest range /api/analytics/occupancy serves at once
+app.config["ANALYTICS_CACHE_DAYS"] = 366    # finished days of per-slot results kept in memory
+# Lots served by this deployment, each in its own database:
+# {"north": {"name": "North Lot", "database": "north.db"}, ...}. None = one lot in DATABASE.
+app.config["FACILITIES"] = None
+app.config["FACILITY_TIMEOUT_MS"] = 2000    # per-shard limit for admin-wide queries
+app.config["FACILITY_WORKERS"] = 8          # threads running admin-wide queries
+app.config["COMPRESS_RESPONSES"] = True     # gzip/brotli pages and JSON for clients that accept it
+app.config["COMPRESS_MIN_BYTES"] = 1024     # smaller responses go out as they are
+# Gate controller gateway (gateway.py), a separate ASGI process on the same databases
+app.config["GATE_API_KEY"] = os.environ.get("PMS_GATE_API_KEY")  # Bearer token controllers send; None = closed
+app.config["GATEWAY_POLL_MS"] = 50          # how often the gateway checks each lot for new commands
+app.config["GATEWAY_MAX_CONNECTIONS"] = 10000
 
+# Home database: accounts, and the only lot unless FACILITIES is set
 DATABASE = "database.db"
 
+# ------------------ FACILITIES ------------------ #
+_router = None
+_router_lots = None
+_router_lock = threading.Lock()
+
+def configured_lots():
+    """{key: (name, database, archive dir)} for the configured lots"""
+    lots = app.config["FACILITIES"] or {"main": {"name": "Main", "database": DATABASE}}
+    return {key: (lot.get("name", key), lot["database"],
+                  # The home database keeps the original archive directory
+                  app.config["ARCHIVE_DIR"] if lot["database"] == DATABASE
+                  else os.path.join(app.config["ARCHIVE_DIR"], key))
+            for key, lot in lots.items()}
+
+def facilities():
+    """Router over the configured lots, rebuilt when the configuration changes"""
+    global _router, _router_lots
+    lots = configured_lots()
+    if lots != _router_lots:
+        with _router_lock:
+            if lots != _router_lots:
+                old = _router
+                _router = FacilityRouter(
+                    [Facility(key, name, path, archive_dir,
+                              max_reservation_hours=app.config["MAX_RESERVATION_HOURS"],
+                              analytics_cache_days=app.config["ANALYTICS_CACHE_DAYS"])
+                     for key, (name, path, archive_dir) in lots.items()],
+                    workers=app.config["FACILITY_WORKERS"])
+                _router_lots = lots
+                if old is not None:
+                    old.shutdown()
+    return _router
+
+def current_facility():
+    """The lot this request works on: the one picked in the session, else the first"""
+    if "facility" not in g:
+        key = session.get("facility") if has_request_context() else None
+        g.facility = facilities().get(key) or facilities().default
+    return g.facility
+
+def each_facility():
+    """Yield every facility in turn, inside an app context where get_db() is its database"""
+    for facility in facilities():
+        with app.app_context():
+            g.facility = facility
+            yield facility
+
+@atexit.register
+def shutdown_facilities():
+    if _router is not None:
+        _router.shutdown()
+
 # ------------------ DB HELPERS ------------------ #
+def _connect(path):
+    if app.config["DB_POOL"]:
+        return get_pool(path).acquire()
+    db = sqlite3.connect(path, factory=TimedConnection)
+    db.row_factory = sqlite3.Row
+    return db
+
 def get_db():
+    """Connection to the current facility's database"""
     if "db" not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        g.db_path = current_facility().path
+        g.db = _connect(g.db_path)
     return g.db
 
+def get_home_db():
+    """Connection to the home database, where accounts live"""
+    if current_facility().path == DATABASE:
+        return get_db()
+    if "home_db" not in g:
+        g.home_db = _connect(DATABASE)
+    return g.home_db
+
 @app.teardown_appcontext
 def close_db(error):
-    db = g.pop("db", None)
-    if db is not None:
-        db.close()
+    for key, path in (("db", g.pop("db_path", None)), ("home_db", DATABASE)):
+        db = g.pop(key, None)
+        if db is not None:
+            if app.config["DB_POOL"]:
+                get_pool(path).release(db)
+            else:
+                db.close()
 
-def query_db(query, args=(), one=False):
-    cur = get_db().execute(query, args)
+def query_db(query, args=(), one=False, home=False):
+    cur = (get_home_db() if home else get_db()).execute(query, args)
     rv = cur.fetchall()
     cur.close()
     return (rv[0] if rv else None) if one else rv
 
-def execute_db(query, args=()):
-    db = get_db()
+def execute_db(query, args=(), home=False):
+    db = get_home_db() if home else get_db()
     cur = db.execute(query, args)
     db.commit()
     return cur.lastrowid
 
+# ------------------ METRICS ------------------ #
+metrics = Metrics(slow_query_seconds=app.config["SLOW_QUERY_MS"] / 1000)
+
+def record_query(query, seconds):
+    """Observer for every statement on our connections: pool, writer, fan-out or direct"""
+    if not app.config["METRICS"]:
+        return
+    endpoint = None
+    if has_request_context():
+        endpoint = request.endpoint
+        g.sql_count = g.get("sql_count", 0) + 1
+    metrics.observe_query(query, seconds, endpoint)
+
+set_query_observer(record_query)
+
+@app.before_request
+def start_timer():
+    if app.config["METRICS"]:
+        g.request_started = perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        metrics.observe_request(request.endpoint, request.method, response.status_code,
+                                perf_counter() - started, g.get("sql_count", 0))
+    return response
+
+@app.teardown_request
+def record_failed_request(error):
+    # Unhandled exceptions skip after_request; count them as 500s
+    started = g.pop("request_started", None)
+    if started is not None:
+        metrics.observe_request(request.endpoint, request.method, 500,
+                                perf_counter() - started, g.get("sql_count", 0))
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics, for a logged-in admin or a scraper sending METRICS_TOKEN"""
+    if not app.config["METRICS"]:
+        abort(404)
+    token = app.config["METRICS_TOKEN"]
+    supplied = request.headers.get("Authorization", "")
+    if session.get("role") != "admin" and not (
+            token and hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain",
+                        headers={"WWW-Authenticate": "Bearer"})
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# ------------------ ASSETS & COMPRESSION ------------------ #
+# Static files are served under content-hashed names and cached for a year
+asset_manifest = assets.AssetManifest(app.static_folder, min_size=app.config["COMPRESS_MIN_BYTES"])
+
+@app.template_global()
+def asset_url(filename):
+    """Content-hashed URL of a static file"""
+    hashed = asset_manifest.hashed(filename)
+    if hashed:
+        return url_for("asset", filename=hashed)
+    if filename in assets.VENDOR:
+        # Committed under static/vendor/; a deploy without them is broken, not "use the CDN"
+        raise RuntimeError(f"static/{filename} is missing; restore it or run `flask vendor-assets`")
+    return url_for("static", filename=filename)
+
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    item = asset_manifest.get(filename)
+    if item is None:
+        abort(404)
+    body, encoding = item.body(request.accept_encodings)
+    response = Response(body, mimetype=item.mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(f"{item.etag}-{encoding}" if encoding else item.etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response.make_conditional(request)
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli rendered pages and JSON. Streamed responses (CSV exports, SSE) go out as they are."""
+    if (not app.config["COMPRESS_RESPONSES"] or request.endpoint == "asset"
+            or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or not assets.compressible(response.mimetype)):
+        return response
+    response.vary.add("Accept-Encoding")
+    choices = assets.encodings(request.accept_encodings)
+    if not choices or response.content_length < app.config["COMPRESS_MIN_BYTES"]:
+        return response
+    response.set_data(assets.encode(response.get_data(), choices[0]))
+    response.headers["Content-Encoding"] = choices[0]
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # Compressed bytes differ, so the tag can only promise equivalent content
+        response.set_etag(etag, weak=True)
+    return response
+
 # ------------------ INIT & SEED ------------------ #
 def init_db():
-    """Initialize database from schema.sql"""
-    db = get_db()
-    try:
-        with app.open_resource("schema.sql", mode="r") as f:
-            db.executescript(f.read())
-        db.commit()
-        print("âœ… Database initialized with schema.sql")
-    except FileNotFoundError:
-        print("âŒ schema.sql file not found! Creating tables manually...")
-        # Create tables manually if schema.sql doesn't exist
-        db.executescript('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'customer',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            
-            CREATE TABLE IF NOT EXISTS slots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE NOT NULL,
-                status TEXT DEFAULT 'free',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            
-            CREATE TABLE IF NOT EXISTS parkings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_number TEXT NOT NULL,
-                slot TEXT NOT NULL,
-                entry_time TIMESTAMP NOT NULL,
-                exit_time TIMESTAMP,
-                paid INTEGER DEFAULT 0,
-                paid_amount REAL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        db.commit()
-        print("âœ… Tables created manually")
+    """Create or upgrade the home and current facility's database schemas (see migrations/)"""
+    for db in dict.fromkeys([get_home_db(), get_db()]):
+        for name in migrate(db):
+            print(f"✅ Applied migration {name}")
 
 def seed_data():
     """Insert default admin and slots if not exist"""
-    admin = query_db("SELECT * FROM users WHERE username='admin'", one=True)
+    admin = query_db("SELECT * FROM users WHERE username='admin'", one=True, home=True)
     if not admin:
         # Fixed admin password to admin123
         execute_db(
             "INSERT INTO users (username, email, password_hash, role) VALUES (?,?,?,?)",
-            ("admin", "admin@example.com", generate_password_hash("admin123"), "admin")
+            ("admin", "admin@example.com", generate_password_hash("admin123"), "admin"),
+            home=True
         )
         print("âœ… Admin created (username=admin, password=admin123)")
 
     slots_exist = query_db("SELECT COUNT(*) as c FROM slots", one=True)["c"]
     if slots_exist == 0:
-        # ðŸ”¥ FIX: Actually insert slots into the DATABASE
-        for i in range(1, 11):
-            for sub in ["A", "B"]:
-                slot_code = f"{i}{sub}"
-                execute_db("INSERT INTO slots (code, status) VALUES (?, 'free')", (slot_code,))
-        print("âœ… 20 slots created in database")
+        # A lot may have its own layout: FACILITIES = {"north": {..., "layout": "north.json"}}
+        lot = (app.config["FACILITIES"] or {}).get(current_facility().key, {})
+        layout_file = lot.get("layout") or app.config["LAYOUT_FILE"]
+        if layout_file:
+            added = current_facility().allocator.add_slots(get_db(), layout.load(layout_file))
+            print(f"âœ… {added} slots created from {layout_file}")
+        else:
+            # ðŸ”¥ FIX: Actually insert slots into the DATABASE
+            current_facility().allocator.add_slots(get_db(), [f"{i}{sub}" for i in range(1, 11) for sub in ["A", "B"]])
+            print("âœ… 20 slots created in database")
+
+def warm_start():
+    """Repair occupancy from open sessions and load the slot registry before serving"""
+    started = perf_counter()
+    db = get_db()
+    allocator = current_facility().allocator
+    allocator.invalidate()
+    repaired = allocator.recover(db)
+    if repaired:
+        print(f"⚠️ Repaired occupancy of {repaired} slots from open sessions")
+    slots = allocator.refresh(db)
+    print(f"✅ {current_facility().name}: {len(slots)} slots loaded, {slots.occupied_count} occupied, "
+          f"in {(perf_counter() - started) * 1000:.0f} ms")
         
 # ------------------ AUTH HELPERS ------------------ #
+# Password hashes run on a process pool so login storms don't stall other routes
+hasher = HashingPool(workers=app.config["HASH_POOL_WORKERS"],
+                     max_pending=app.config["HASH_POOL_MAX_PENDING"])
+account_limiter = TokenBucketLimiter(rate=app.config["LOGIN_LIMIT_ACCOUNT"][1],
+                                     burst=app.config["LOGIN_LIMIT_ACCOUNT"][0])
+ip_limiter = TokenBucketLimiter(rate=app.config["LOGIN_LIMIT_IP"][1],
+                                burst=app.config["LOGIN_LIMIT_IP"][0])
+
+def too_many_attempts(account):
+    """429 response if this client IP or account is out of password attempts, else None"""
+    ip_ok = ip_limiter.allow(request.remote_addr)
+    account_ok = account_limiter.allow(str(account).lower())
+    if ip_ok and account_ok:
+        return None
+    limiter = account_limiter if ip_ok else ip_limiter
+    return (render_template("busy.html", message="Too many attempts. Please wait before trying again."),
+            429, {"Retry-After": str(limiter.retry_after())})
+
+@app.errorhandler(PoolBusy)
+def hashing_busy(error):
+    return (render_template("busy.html", message="The server is busy signing people in."),
+            503, {"Retry-After": "2"})
+
+@app.errorhandler(WriteTimeout)
+def write_timeout(error):
+    return (render_template("busy.html", message="The database is busy. Please try again."),
+            503, {"Retry-After": "2"})
+
+# User rows shared across requests; call user_cache.invalidate(id) after writing a user
+user_cache = UserCache(max_size=app.config["USER_CACHE_SIZE"], ttl=app.config["USER_CACHE_TTL"])
+metrics.gauge("pms_user_cache", "User cache hits, misses and size", user_cache.stats)
+
+def load_user(user_id):
+    return query_db("SELECT * FROM users WHERE id=?", (user_id,), one=True, home=True)
+
+def get_user(user_id):
+    return user_cache.get(user_id, load_user)
+
 def current_user():
-    if "user_id" in session:
-        return query_db("SELECT * FROM users WHERE id=?", (session["user_id"],), one=True)
-    return None
+    """Logged-in user, looked up at most once per request"""
+    if "user_id" not in session:
+        return None
+    if "user" not in g:
+        g.user = get_user(session["user_id"])
+    return g.user
 
 def login_required(f):
     from functools import wraps
@@ -170,10 +432,15 @@ def register():
                 return redirect(url_for("register"))
             role = 'admin'
 
-        hashed = generate_password_hash(password)
+        limited = too_many_attempts(username)
+        if limited:
+            return limited
+
+        hashed = hasher.hash(password)
         try:
-            execute_db("INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?)",
-                       (username, email, hashed, role))
+            user_id = execute_db("INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?)",
+                                 (username, email, hashed, role), home=True)
+            user_cache.invalidate(user_id)
             flash("Registered successfully. Please login.", "success")
             return redirect(url_for("login"))
         except Exception:
@@ -192,7 +459,11 @@ def login():
             flash("All fields required", "danger")
             return redirect(url_for("login"))
 
-        user = query_db("SELECT * FROM users WHERE username=? AND role=?", (username, role), one=True)
+        limited = too_many_attempts(username)
+        if limited:
+            return limited
+
+        user = query_db("SELECT * FROM users WHERE username=? AND role=?", (username, role), one=True, home=True)
 
         if user is None:
             flash(f"User '{username}' with role '{role}' not found", "danger")
@@ -204,7 +475,7 @@ def login():
                 flash("Invalid admin password", "danger")
                 return redirect(url_for("login"))
         else:
-            if not check_password_hash(user["password_hash"], password):
+            if not hasher.verify(user["password_hash"], password):
                 flash("Invalid password", "danger")
                 return redirect(url_for("login"))
 
@@ -233,53 +504,150 @@ def logout():
 @app.route("/dashboard")
 @admin_required
 def dashboard():
-    total_slots = query_db("SELECT COUNT(*) AS c FROM slots", one=True)["c"]
-    
-    # Count occupied slots from in-memory data (more accurate for current state)
-    occupied = len([s for s in slots if s["status"] == "occupied"])
+    slots = current_slots()
+    total_slots = len(slots)
+    occupied = slots.occupied_count
     available = total_slots - occupied
     
-    # Get revenue from database + in-memory payments
-    db_revenue = query_db("SELECT SUM(paid_amount) as total FROM parkings WHERE paid=1", one=True)["total"] or 0
-    
-    # Add in-memory payments that might not be in database yet
-    memory_revenue = sum(s.get("paid_amount", 0) for s in slots if s.get("paid", False))
-    
-    total_revenue = db_revenue + memory_revenue
-    
-    # Get recent payments for display
-    recent_payments = []
-    for slot in slots:
-        if slot.get("paid", False) and slot.get("paid_amount", 0) > 0:
-            recent_payments.append({
-                "slot": slot["code"],
-                "vehicle": slot.get("vehicle", "N/A"),
-                "amount": slot.get("paid_amount", 0),
-                "time": datetime.now().strftime("%H:%M")
-            })
+    # Precomputed, maintained by every payment (see rollups.py)
+    db = get_db()
+    total_revenue = rollups.get(db)["revenue"]
+    today = rollups.today(db, to_epoch(datetime.now()))
+
+    recent_payments = [
+        {
+            "slot": p["slot"],
+            "vehicle": p["vehicle_number"],
+            "amount": p["paid_amount"],
+            "time": p["exit_time"][11:16] if p["exit_time"] else "",
+        }
+        for p in query_db("SELECT slot, vehicle_number, paid_amount, exit_time FROM parkings WHERE paid=1 ORDER BY id DESC LIMIT 5")
+    ]
 
     stats = {
         "total_slots": total_slots, 
         "occupied": occupied, 
         "available": available, 
         "revenue": total_revenue,
-        "recent_payments": recent_payments[-5:]  # Show last 5 payments
+        "today_revenue": today["revenue"],
+        "today_entries": today["entries"],
+        "recent_payments": recent_payments
     }
     return render_template("dashboard.html", stats=stats)
 
 # --------- Park Vehicle --------- #
-# Initialize slots as a list of dictionaries for halves
-slots = []
-for i in range(1, 11):
-    slots.append({"code": f"{i}A", "status": "free", "paid": False})
-    slots.append({"code": f"{i}B", "status": "free", "paid": False})
+# The slots table is the source of truth for occupancy; each worker keeps an
+# indexed read cache of it per facility that catches up with other workers' changes.
+tariff = Tariff.from_config(app.config["TARIFF"])
+
+def current_slots():
+    """Slot registry synced with the database, once per request"""
+    if "slots" not in g:
+        g.slots = current_facility().allocator.refresh(get_db())
+    return g.slots
+
+# The park page's slot map is rendered once per registry state
+metrics.gauge("pms_slot_map_renders", "Slot map fragments rendered",
+              lambda: sum(f.slot_map.renders for f in facilities()))
+
+def slot_map_html():
+    return Markup(current_facility().slot_map.get(
+        current_slots(), lambda levels, version: render_template("_slot_map.html", levels=levels, version=version)))
+
+# --------- Group commit --------- #
+def get_writer():
+    """The current facility's group-commit writer"""
+    return current_facility().writer(max_batch=app.config["GROUP_COMMIT_MAX_BATCH"],
+                                     max_wait=app.config["GROUP_COMMIT_WINDOW_MS"] / 1000)
+
+def claim_slot(code, vehicle, user_id, entry_time, exit_time=None, stay=None):
+    """allocator.claim(), through the group-commit writer when it is enabled.
+
+    With `stay` ([from, to) epoch seconds), raises SlotReserved if a reservation
+    for another vehicle holds the slot then, checked in the claim's transaction.
+    """
+    facility = current_facility()
+    allocator = facility.allocator
+
+    def check(db):
+        if stay and not facility.reservations.refresh(db, to_epoch(datetime.now())).is_free(code, *stay, vehicle):
+            raise SlotReserved(code)
+
+    if not app.config["GROUP_COMMIT"]:
+        return allocator.claim(get_db(), code, vehicle, user_id, entry_time, exit_time, check=check)
+
+    def checked_claim_in(db):
+        check(db)
+        return allocator.claim_in(db, code, vehicle, user_id, entry_time, exit_time)
+
+    parking_id, _version = get_writer().run(checked_claim_in, timeout=app.config["GROUP_COMMIT_TIMEOUT_S"])
+    g.slots = allocator.refresh(get_db())
+    return parking_id
+
+def release_slot(code, parking_id, amount, exit_time):
+    """allocator.release(), through the group-commit writer when it is enabled"""
+    allocator = current_facility().allocator
+    if not app.config["GROUP_COMMIT"]:
+        return allocator.release(get_db(), code, parking_id, amount, exit_time)
+    version = get_writer().run(allocator.release_in, code, parking_id, amount, exit_time,
+                               timeout=app.config["GROUP_COMMIT_TIMEOUT_S"])
+    g.slots = allocator.refresh(get_db())
+    return version is not None
+
+def pay_session(code, parking_id, amount, exit_time):
+    """allocator.pay_in() for a session no longer holding its slot, through the group-commit writer when it is enabled"""
+    allocator = current_facility().allocator
+    if not app.config["GROUP_COMMIT"]:
+        db = get_db()
+        with db:
+            return allocator.pay_in(db, code, parking_id, amount, exit_time)
+    return get_writer().run(allocator.pay_in, code, parking_id, amount, exit_time,
+                            timeout=app.config["GROUP_COMMIT_TIMEOUT_S"])
+
+def send_gate_commands(*commands):
+    """Queue (gate, kind, payload) commands for the gate controllers, through the group-commit writer when it is enabled"""
+    if not app.config["GROUP_COMMIT"]:
+        db = get_db()
+        with db:
+            return gate_commands.enqueue(db, commands)
+    return get_writer().run(gate_commands.enqueue, commands, timeout=app.config["GROUP_COMMIT_TIMEOUT_S"])
+
+def current_reservations():
+    """Reservation index synced with the database, once per request"""
+    if "reservations" not in g:
+        g.reservations = current_facility().reservations.refresh(get_db(), to_epoch(datetime.now()))
+    return g.reservations
+
+# Live updates pushed to connected dashboards (see /api/events), one feed per facility
+metrics.gauge("pms_sse_subscribers", "Connected live-dashboard clients",
+              lambda: sum(f.feed.subscriber_count for f in facilities()))
+
+def publish_occupancy(slot_code):
+    slots = current_slots()
+    slot = slots.get(slot_code)
+    current_facility().feed.publish("occupancy", {
+        "slot": slot_code,
+        "status": slot.status,
+        "vehicle": slot.vehicle,
+        "occupied": slots.occupied_count,
+        "available": len(slots) - slots.occupied_count
+    })
+
+def publish_payment(slot_code, vehicle, amount, exit_time):
+    current_facility().feed.publish("payment", {
+        "slot": slot_code,
+        "vehicle": vehicle,
+        "amount": amount,
+        "time": exit_time.strftime("%H:%M"),
+        "revenue": rollups.get(get_db())["revenue"]
+    })
 
 @app.route("/park", methods=["GET", "POST"])
 @login_required
 def park():
     if request.method == "POST":
         vehicle_number = request.form["vehicle_number"].strip().upper()
-        selected_slot = request.form.get("slot_code")
+        selected_slot = (request.form.get("slot_code") or "").strip()
         entry_time_str = request.form.get("entry_time")
         exit_time_str = request.form.get("exit_time")
 
@@ -287,10 +655,6 @@ def park():
             flash("Vehicle number required", "danger")
             return redirect(url_for("park"))
 
-        if not selected_slot:
-            flash("Please select a slot", "danger")
-            return redirect(url_for("park"))
-
         if not entry_time_str:
             flash("Entry time required", "danger")
             return redirect(url_for("park"))
@@ -310,45 +674,75 @@ def park():
                 flash("Invalid exit time format", "danger")
                 return redirect(url_for("park"))
 
+        # Walk-ins without an exit time are assumed to stay WALK_IN_HOLD_MINUTES
+        stay_from = to_epoch(entry_time)
+        stay_to = to_epoch(exit_time) if exit_time else stay_from + app.config["WALK_IN_HOLD_MINUTES"] * 60
+        booked = current_reservations()
+        slots = current_slots()
+        if not selected_slot or selected_slot.lower() == "auto":
+            nearest = slots.nearest_free(skip=booked.busy_slots(stay_from, stay_to, vehicle_number))
+            selected_slot = nearest.code if nearest else None
+            if not selected_slot:
+                flash("No free slots available", "warning")
+                return redirect(url_for("park"))
+        elif not booked.is_free(selected_slot, stay_from, stay_to, vehicle_number):
+            flash(f"Slot {selected_slot} is reserved for that time", "warning")
+            return redirect(url_for("park"))
+
         # Check if the selected slot is free
-        slot_obj = next((s for s in slots if s["code"] == selected_slot), None)
+        slot_obj = slots.get(selected_slot)
         if not slot_obj:
             flash("Invalid slot selected", "danger")
             return redirect(url_for("park"))
-        if slot_obj["status"] == "occupied":
+        if slot_obj.status == "occupied":
             flash(f"Slot {selected_slot} is already occupied", "warning")
             return redirect(url_for("park"))
 
-        # ðŸ”¥ Save to database with datetime as TEXT (ISO format)
+        # ðŸ”¥ Claim the slot and open the session in one atomic write
         try:
-            # Convert datetime to ISO string format
-            entry_iso = entry_time.strftime("%Y-%m-%d %H:%M:%S")
-            exit_iso = exit_time.strftime("%Y-%m-%d %H:%M:%S") if exit_time else None
-            
-            parking_id = execute_db(
-                "INSERT INTO parkings (vehicle_number, slot, user_id, entry_time, exit_time, paid, paid_amount) VALUES (?, ?, ?, ?, ?, 0, 0)",
-                (vehicle_number, selected_slot, session.get("user_id"), entry_iso, exit_iso)
-            )
-            # Store the parking_id in the slot object
-            slot_obj["parking_id"] = parking_id
+            parking_id = claim_slot(selected_slot, vehicle_number, session.get("user_id"),
+                                    entry_time, exit_time, stay=(stay_from, stay_to))
+        except SlotReserved:
+            flash(f"Slot {selected_slot} is reserved for that time", "warning")
+            return redirect(url_for("park"))
+        except WriteTimeout:
+            raise
         except Exception as e:
             flash(f"Database error: {e}", "danger")
             print(f"Error: {e}")
             return redirect(url_for("park"))
 
-        # Assign the slot in memory
-        slot_obj["status"] = "occupied"
-        slot_obj["vehicle"] = vehicle_number
-        slot_obj["entry_time"] = entry_time
-        slot_obj["exit_time"] = exit_time
-        slot_obj["paid"] = False
+        if parking_id is None:
+            flash(f"Slot {selected_slot} is already occupied", "warning")
+            return redirect(url_for("park"))
         
+        publish_occupancy(selected_slot)
+        gate = gate_commands.gate_name(request.form.get("gate"), "entry")
+        try:
+            send_gate_commands(
+                gate_commands.command(gate, gate_commands.SLOT_ASSIGNED, slot=selected_slot,
+                                      vehicle=vehicle_number, parking_id=parking_id),
+                gate_commands.command(gate, gate_commands.OPEN_BARRIER, vehicle=vehicle_number,
+                                      parking_id=parking_id))
+        except Exception as e:
+            print(f"⚠️ Error queueing gate commands: {e}")
         flash(f"Vehicle {vehicle_number} assigned to slot {selected_slot}", "success")
         return redirect(url_for("park"))
 
-    # Prepare occupied list for template
-    occupied = [s["code"] for s in slots if s["status"] == "occupied"]
-    return render_template("park.html", slots=slots, occupied=occupied)
+    slots = current_slots()
+    nearest = slots.nearest_free()
+    return render_template("park.html", slot_map=slot_map_html(), nearest=nearest.code if nearest else None)
+
+@app.route("/api/slot_map")
+@login_required
+def api_slot_map():
+    """Slot map cells changed since ?since=<version>, or the whole map when they can't be worked out"""
+    slots = current_slots()
+    version = slot_map.version(slots)  # taken first, so no later change can be skipped
+    cells = slot_map.delta(slots, request.args.get("since"))
+    if cells is None:
+        return jsonify({"html": slot_map_html()})
+    return jsonify({"version": version, "cells": cells})
 
 # --------- Receipt --------- #
 
@@ -358,58 +752,45 @@ def park():
 @login_required
 def receipt_by_slot(slot_code):
     """Display the parking receipt and allow printing as PDF."""
-    db = get_db()
+    if request.if_none_match:
+        # Revalidating the slot's last closed receipt: a recently refreshed
+        # slot view and the receipt cache answer it without the database
+        slots = current_facility().allocator.recent(app.config["SLOT_RECEIPT_MAX_AGE"])
+        slot_obj = slots.get(slot_code) if slots is not None else None
+        if slot_obj and slot_obj.status == "free":
+            closed = current_facility().receipts.get(slots.last_session(slot_code))
+            if closed and request.if_none_match.contains_weak(closed.etag):
+                return serve_receipt(closed.parking_id, check_owner=False, payable=True)
 
-    # Try to get live (in-memory) slot first
-    slot_obj = next((s for s in slots if s["code"] == slot_code), None)
-    if slot_obj and slot_obj.get("status") == "occupied":
-        entry_time = slot_obj.get("entry_time")
-        exit_time = slot_obj.get("exit_time") or datetime.now()
-        vehicle = slot_obj.get("vehicle")
-        paid = slot_obj.get("paid", False)
-
-        # Calculate parking duration and amount
-        if entry_time:
-            hours = max(1, int((exit_time - entry_time).total_seconds() // 3600))
-        else:
-            hours = 1
-        amount = hours * 50
+    # Try to get live (in-memory) slot first. The amount due is priced on
+    # every view and only written when payment is confirmed.
+    slots = current_slots()
+    slot_obj = slots.get(slot_code)
+    if slot_obj and slot_obj.status == "occupied":
+        entry_time = slot_obj.entry_time
+        exit_time = slot_obj.exit_time or datetime.now()
+        hours, amount = tariff.quote(entry_time, exit_time)
+        return render_template("receipt.html", receipt=build_receipt(
+            slot_obj.vehicle, slot_code, entry_time, exit_time, hours, amount, slot_obj.paid))
 
-        # Update database with latest exit time and amount
-        parking_id = slot_obj.get("parking_id")
-        if parking_id:
-            try:
-                db.execute(
-                    "UPDATE parkings SET exit_time=?, paid_amount=? WHERE id=?",
-                    (exit_time.strftime("%Y-%m-%d %H:%M:%S"), amount, parking_id),
-                )
-                db.commit()
-            except Exception as e:
-                print(f"⚠️ Error updating receipt data: {e}")
-    else:
-        # Load last record for this slot from DB
+    # Otherwise the last session in this slot, remembered by the registry once looked up
+    parking_id = slots.last_session(slot_code)
+    if parking_id is None:
         parking = query_db(
-            "SELECT * FROM parkings WHERE slot=? ORDER BY id DESC LIMIT 1",
+            "SELECT id FROM parkings WHERE slot=? ORDER BY id DESC LIMIT 1",
             (slot_code,),
             one=True
         )
         if not parking:
             flash("No receipt found for this slot.", "warning")
             return redirect(url_for("park"))
+        parking_id = parking["id"]
+        slots.remember_session(slot_code, parking_id)
+    return serve_receipt(parking_id, check_owner=False, payable=True)
 
-        entry_time = datetime.strptime(parking["entry_time"], "%Y-%m-%d %H:%M:%S") if parking["entry_time"] else None
-        exit_time = datetime.strptime(parking["exit_time"], "%Y-%m-%d %H:%M:%S") if parking["exit_time"] else datetime.now()
-        vehicle = parking["vehicle_number"]
-        amount = parking["paid_amount"]
-        paid = parking["paid"] == 1
-
-        if entry_time:
-            hours = max(1, int((exit_time - entry_time).total_seconds() // 3600))
-        else:
-            hours = 1
-
-    # Prepare receipt dictionary for template
-    receipt = {
+def build_receipt(vehicle, slot_code, entry_time, exit_time, hours, amount, paid, payable=True):
+    """Prepare receipt dictionary for template"""
+    return {
         "vehicle_number": vehicle or "N/A",
         "slot": slot_code,
         "entry_time": entry_time.strftime("%Y-%m-%d %H:%M") if entry_time else "N/A",
@@ -417,9 +798,67 @@ def receipt_by_slot(slot_code):
         "hours": hours,
         "amount": amount,
         "paid": paid,
+        "payable": payable,
     }
 
-    return render_template("receipt.html", receipt=receipt)
+def receipt_from_parking(parking, payable=True):
+    """Receipt for a stored session: the amount charged if paid, else the amount due now"""
+    entry_time = from_epoch(parking["entry_ts"])
+    exit_time = from_epoch(parking["exit_ts"]) or datetime.now()
+    paid = parking["paid"] == 1
+    hours, amount = tariff.quote(entry_time, exit_time)
+    if paid:
+        amount = parking["paid_amount"]
+    return build_receipt(parking["vehicle_number"], parking["slot"], entry_time, exit_time,
+                         hours, amount, paid, payable)
+
+# Paid sessions are immutable, so their receipts are cached (per facility) and revalidated by ETag
+def serve_receipt(parking_id, check_owner=True, payable=None):
+    """Receipt page for one session; closed ones come from the receipt cache, or 304 when unchanged.
+
+    payable=None works out whether this is the slot's latest session.
+    """
+    receipt_cache = current_facility().receipts
+    closed = receipt_cache.get(parking_id)
+    if closed is None:
+        parking = query_db("SELECT * FROM parkings WHERE id=?", (parking_id,), one=True)
+        if not parking and archive.reaches(get_db(), None):
+            parking = next(archive.query(*archive_location(), "SELECT * FROM all_parkings WHERE id=?",
+                                         (parking_id,)), None)
+        if not parking:
+            flash("No receipt found.", "warning")
+            return redirect(url_for("parking_history"))
+        if parking["paid"] == 1:
+            closed = receipt_cache.put(ClosedReceipt(
+                parking_id, parking["user_id"], receipt_from_parking(parking), from_epoch(parking["exit_ts"])))
+
+    owner = closed.user_id if closed else parking["user_id"]
+    if check_owner and session.get("role") != "admin" and owner != session["user_id"]:
+        flash("No receipt found.", "warning")
+        return redirect(url_for("parking_history"))
+
+    if closed is None:
+        if payable is None:
+            # Payment is taken per slot, so only the slot's latest session can be paid from here
+            latest = query_db("SELECT MAX(id) AS id FROM parkings WHERE slot=?", (parking["slot"],), one=True)["id"]
+            payable = latest == parking_id
+        return render_template("receipt.html", receipt=receipt_from_parking(parking, payable))
+
+    # receipt.html is a standalone page of the receipt alone, so one validator serves every viewer
+    if request.if_none_match.contains_weak(closed.etag):
+        response = Response(status=304)
+    else:
+        response = Response(render_template("receipt.html", receipt=closed.receipt))
+    response.set_etag(closed.etag)
+    response.last_modified = closed.last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+@app.route("/receipt/<int:parking_id>")
+@login_required
+def receipt(parking_id):
+    """Receipt for one session from the history"""
+    return serve_receipt(parking_id)
 
 # --------- Confirm Payment --------- #
 def get_slot_id(slot_code):
@@ -427,6 +866,15 @@ def get_slot_id(slot_code):
     slot = query_db("SELECT id FROM slots WHERE code=?", (slot_code,), one=True)
     return slot["id"] if slot else None
 
+def open_exit_barrier(slot_code, vehicle, parking_id, amount):
+    """Tell the exit gate (?gate= overrides it) to let a paid vehicle out"""
+    gate = gate_commands.gate_name(request.values.get("gate"), "exit")
+    try:
+        send_gate_commands(gate_commands.command(gate, gate_commands.OPEN_BARRIER, slot=slot_code,
+                                                 vehicle=vehicle, parking_id=parking_id, amount=amount))
+    except Exception as e:
+        print(f"⚠️ Error queueing gate commands: {e}")
+
 @app.route("/confirm_payment/<slot_code>", methods=['POST'])
 @login_required
 def confirm_payment(slot_code):
@@ -435,46 +883,26 @@ def confirm_payment(slot_code):
     
     try:
         # Find the slot in memory
-        slot_obj = next((s for s in slots if s["code"] == slot_code), None)
+        slot_obj = current_slots().get(slot_code)
         
-        if slot_obj and slot_obj.get("status") == "occupied":
-            entry_time = slot_obj.get("entry_time")
-            exit_time = slot_obj.get("exit_time") or datetime.now()
-            vehicle = slot_obj.get("vehicle", "Unknown")
+        if slot_obj and slot_obj.status == "occupied":
+            entry_time = slot_obj.entry_time
+            exit_time = slot_obj.exit_time or datetime.now()
+            vehicle = slot_obj.vehicle or "Unknown"
+            parking_id = slot_obj.parking_id  # release clears it on the cached slot
             
             # Calculate hours and amount
-            if entry_time:
-                hours = max(1, int((exit_time - entry_time).total_seconds() // 3600))
-            else:
-                hours = 1
-            
-            amount = hours * 50
+            hours, amount = tariff.quote(entry_time, exit_time)
             
-            # Update database - mark as paid
-            parking_id = slot_obj.get("parking_id")
-            if parking_id:
-                exit_iso = exit_time.strftime("%Y-%m-%d %H:%M:%S")
-                execute_db(
-                    "UPDATE parkings SET exit_time=?, paid=1, paid_amount=? WHERE id=?",
-                    (exit_iso, amount, parking_id)
-                )
-            else:
-                # Create new parking record if parking_id doesn't exist
-                entry_iso = entry_time.strftime("%Y-%m-%d %H:%M:%S") if entry_time else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                exit_iso = exit_time.strftime("%Y-%m-%d %H:%M:%S")
-                parking_id = execute_db(
-                    "INSERT INTO parkings (vehicle_number, slot, user_id, entry_time, exit_time, paid, paid_amount) VALUES (?, ?, ?, ?, ?, 1, ?)",
-                    (vehicle, slot_code, session.get("user_id"), entry_iso, exit_iso, amount)
-                )
-            
-            # FREE THE SLOT - reset all slot data
-            slot_obj["status"] = "free"
-            slot_obj["vehicle"] = None
-            slot_obj["entry_time"] = None
-            slot_obj["exit_time"] = None
-            slot_obj["paid"] = False
-            slot_obj["paid_amount"] = 0
-            slot_obj["parking_id"] = None
+            # Mark as paid and FREE THE SLOT in one atomic write
+            if not release_slot(slot_code, parking_id, amount, exit_time):
+                return jsonify({
+                    "success": False,
+                    "message": "Slot not found or already paid"
+                })
+            publish_occupancy(slot_code)
+            publish_payment(slot_code, vehicle, amount, exit_time)
+            open_exit_barrier(slot_code, vehicle, parking_id, amount)
             
             return jsonify({
                 "success": True,
@@ -493,21 +921,19 @@ def confirm_payment(slot_code):
             )
             
             if parking and parking["paid"] == 0:
-                entry_time = datetime.strptime(parking["entry_time"], "%Y-%m-%d %H:%M:%S") if parking["entry_time"] else None
-                exit_time = datetime.strptime(parking["exit_time"], "%Y-%m-%d %H:%M:%S") if parking["exit_time"] else datetime.now()
-                
-                if entry_time:
-                    hours = max(1, int((exit_time - entry_time).total_seconds() // 3600))
-                else:
-                    hours = 1
+                entry_time = from_epoch(parking["entry_ts"])
+                exit_time = from_epoch(parking["exit_ts"]) or datetime.now()
                 
-                amount = hours * 50
+                hours, amount = tariff.quote(entry_time, exit_time)
                 
-                # Update payment in database
-                execute_db(
-                    "UPDATE parkings SET paid=1, paid_amount=?, exit_time=? WHERE id=?",
-                    (amount, exit_time.strftime("%Y-%m-%d %H:%M:%S"), parking["id"])
-                )
+                # Update payment in database, unless another request got there first
+                if not pay_session(slot_code, parking["id"], amount, exit_time):
+                    return jsonify({
+                        "success": False,
+                        "message": "Slot not found or already paid"
+                    })
+                publish_payment(slot_code, parking["vehicle_number"], amount, exit_time)
+                open_exit_barrier(slot_code, parking["vehicle_number"], parking["id"], amount)
                 
                 return jsonify({
                     "success": True,
@@ -522,6 +948,8 @@ def confirm_payment(slot_code):
                 "message": "Slot not found or already paid"
             })
     
+    except WriteTimeout:
+        return jsonify({"success": False, "message": "The database is busy. Please try again."}), 503
     except Exception as e:
         print(f"⚠️ Error confirming payment: {e}")
         return jsonify({
@@ -533,22 +961,398 @@ def confirm_payment(slot_code):
 @app.route("/api/dashboard_stats", methods=['GET'])
 @admin_required
 def api_dashboard_stats():
-    total_slots = query_db("SELECT COUNT(*) AS c FROM slots", one=True)["c"]
-    occupied = len([s for s in slots if s["status"] == "occupied"])
+    slots = current_slots()
+    total_slots = len(slots)
+    occupied = slots.occupied_count
     available = total_slots - occupied
     
-    # Get revenue from database + in-memory payments
-    db_revenue = query_db("SELECT SUM(paid_amount) as total FROM parkings WHERE paid=1", one=True)["total"] or 0
-    memory_revenue = sum(s.get("paid_amount", 0) for s in slots if s.get("paid", False))
-    total_revenue = db_revenue + memory_revenue
+    db = get_db()
+    today = rollups.today(db, to_epoch(datetime.now()))
     
     return jsonify({
         "total_slots": total_slots,
         "occupied": occupied,
         "available": available,
-        "revenue": total_revenue
+        "revenue": rollups.get(db)["revenue"],
+        "today_revenue": today["revenue"],
+        "today_entries": today["entries"]
     })
 
+# --------- Facilities --------- #
+@app.context_processor
+def inject_facilities():
+    return {"facility_choices": list(facilities()), "current_facility": current_facility()}
+
+@app.route("/facility", methods=["POST"])
+@login_required
+def select_facility():
+    """Switch the lot this session works on"""
+    facility = facilities().get(request.form.get("facility"))
+    if facility is None:
+        flash("Unknown facility", "danger")
+    else:
+        session["facility"] = facility.key
+        flash(f"Now working in {facility.name}", "info")
+    return redirect(url_for("index"))
+
+@app.route("/api/facilities")
+@admin_required
+def api_facilities():
+    """Occupancy and revenue of every facility, read from all databases in parallel, and their totals"""
+    now_ts = to_epoch(datetime.now())
+
+    def summary(facility, db):
+        slots = facility.allocator.refresh(db)
+        today = rollups.today(db, now_ts)
+        return {
+            "total_slots": len(slots),
+            "occupied": slots.occupied_count,
+            "revenue": rollups.get(db)["revenue"],
+            "today_revenue": today["revenue"],
+            "today_entries": today["entries"],
+        }
+
+    results, errors = facilities().fan_out(summary, app.config["FACILITY_TIMEOUT_MS"] / 1000)
+    lots = []
+    for facility in facilities():
+        lot = {"key": facility.key, "name": facility.name}
+        if facility.key in results:
+            lot.update(results[facility.key])
+        else:
+            print(f"⚠️ Facility {facility.key} left out of the summary: {errors[facility.key]}")
+            lot["error"] = errors[facility.key]
+        lots.append(lot)
+    totals = {field: sum(r[field] for r in results.values())
+              for field in ("total_slots", "occupied", "revenue", "today_revenue", "today_entries")}
+    totals["available"] = totals["total_slots"] - totals["occupied"]
+    # complete is false when some facility timed out or failed and is missing from the totals
+    return jsonify({"facilities": lots, "totals": totals, "complete": not errors})
+
+# --------- Plate search --------- #
+# "Where is my car?": parked vehicles come from the registry, past sessions
+# from the parkings plate index
+@app.route("/api/plates")
+@admin_required
+def api_plates():
+    """Plates starting with ?q= (spaces and dashes ignored): where they are parked and their last visit"""
+    query = plates.normalize(request.args.get("q"))
+    if len(query) < 2:
+        return jsonify({"success": False, "message": "Type at least 2 characters of the plate"}), 400
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+
+    slots = current_slots()
+    plate_index = current_facility().plates
+    plate_index.sync(slots)
+    parked = []
+    for code in plate_index.search(query, limit):
+        slot = slots.get(code)
+        parked.append({"vehicle": slot.vehicle, "slot": code, "entry_time": to_text(slot.entry_time)})
+
+    read_archive = None
+    if request.args.get("archived") == "1":
+        source = archived_source(None)
+        if source:
+            read_archive = lambda sql, args, order_by: archive.query(*source, sql, args, order_by=order_by)
+    history_rows = plates.history(get_db(), query, limit, read_archive)
+    past = [{
+        "vehicle": row["vehicle_number"],
+        "slot": row["slot"],
+        "entry_time": to_text(from_epoch(row["entry_ts"])),
+        "exit_time": to_text(from_epoch(row["exit_ts"])),
+        "paid": bool(row["paid"]),
+        "visits": row["visits"],
+    } for row in history_rows]
+    return jsonify({"success": True, "parked": parked, "history": past})
+
+# --------- Occupancy analytics --------- #
+metrics.gauge("pms_occupancy_cache", "Occupancy analytics days served from cache or computed",
+              lambda: {"hits": sum(f.occupancy.hits for f in facilities()),
+                       "misses": sum(f.occupancy.misses for f in facilities())})
+
+@app.route("/api/analytics/occupancy")
+@admin_required
+def api_occupancy():
+    """Average occupancy in ?width=15|30|60 minute buckets, dwell times and a weekday x hour heatmap.
+
+    Covers the days ?from= to ?to= (YYYY-MM-DD, inclusive; default the last
+    7 days), grouped ?by=all|level|slot.
+    """
+    now_ts = to_epoch(datetime.now())
+    today = now_ts - now_ts % analytics.DAY
+    try:
+        last_day = date_to_epoch(request.args.get("to")) or today
+        first_day = date_to_epoch(request.args.get("from")) or last_day - 6 * analytics.DAY
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+    width = request.args.get("width", 60, type=int) * 60
+    by = request.args.get("by", "all")
+    if width not in analytics.WIDTHS or by not in ("all", "level", "slot"):
+        return jsonify({"success": False, "message": "width must be 15, 30 or 60; by must be all, level or slot"}), 400
+    if not first_day <= last_day <= today:
+        return jsonify({"success": False, "message": "The range must be in order and not in the future"}), 400
+    if (last_day - first_day) // analytics.DAY >= app.config["ANALYTICS_MAX_DAYS"]:
+        return jsonify({"success": False,
+                        "message": f"At most {app.config['ANALYTICS_MAX_DAYS']} days at a time"}), 400
+
+    db = get_db()
+    current_facility().occupancy.sync(db)
+    source = archived_source(first_day)
+    read_archive = None
+    if source:
+        read_archive = lambda sql, args, order_by: archive.query(*source, sql, args, order_by=order_by)
+    days = current_facility().occupancy.days(lambda start, end: analytics.sessions(db, start, end, now_ts, read_archive),
+                                first_day, last_day, width, now_ts)
+
+    slots = current_slots()
+    def level_of(code):
+        slot = slots.get(code)
+        return slot.level if slot else parse_code(code)[0]
+
+    result = analytics.report(days, width, by, level_of)
+    return jsonify({
+        "success": True,
+        "start": to_text(from_epoch(result["start"])),
+        "width_minutes": width // 60,
+        "series": result["series"],
+        "dwell": result["dwell"],
+        "heatmap": result["heatmap"],
+    })
+
+# --------- Gate controller ingestion --------- #
+@app.route("/api/gate_events", methods=["POST"])
+@admin_required
+def api_gate_events():
+    """Apply a batch of entry/exit events: {"events": [{event_id, type, plate, slot, timestamp}, ...]}"""
+    payload = request.get_json(silent=True)
+    events = payload.get("events") if isinstance(payload, dict) else payload
+    if not isinstance(events, list):
+        return jsonify({"success": False, "message": "Expected a JSON list of events"}), 400
+    if len(events) > gate_events.MAX_BATCH:
+        return jsonify({"success": False, "message": f"At most {gate_events.MAX_BATCH} events per batch"}), 413
+
+    try:
+        results = gate_events.ingest(get_db(), current_facility().allocator, events, session.get("user_id"),
+                                     reservations=current_facility().reservations,
+                                     hold_seconds=app.config["WALK_IN_HOLD_MINUTES"] * 60)
+    except sqlite3.Error as e:
+        print(f"⚠️ Error ingesting gate events: {e}")
+        return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
+
+    for code in {r["slot"] for r in results if r["status"] == "accepted"}:
+        publish_occupancy(code)
+    return jsonify({"success": True, "results": results})
+
+@app.route("/api/events")
+@admin_required
+def api_events():
+    """Server-Sent Events stream of occupancy and payment changes"""
+    return Response(
+        current_facility().feed.subscribe().stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --------- History --------- #
+def archived_source(date_from):
+    """(database, archive dir) for history.page/archive.query when the range reaches archived months, else None"""
+    if archive.reaches(get_db(), date_from):
+        return archive_location()
+    return None
+
+def archive_location():
+    """(database, archive dir) of the current facility"""
+    facility = current_facility()
+    return os.path.abspath(facility.path), facility.archive_dir
+
+def date_range_args(args):
+    """?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive) -> [from_ts, to_ts) on entry time"""
+    date_from = date_to_epoch(args.get("from"))
+    date_to = date_to_epoch(args.get("to"))
+    return date_from, date_to + 86400 if date_to is not None else None
+
+def history_filters(args):
+    """Parse history filters; customers only ever see their own sessions"""
+    date_from, date_to = date_range_args(args)
+    filters = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "paid": int(args["paid"]) if args.get("paid") in ("0", "1") else None,
+        "plate": args.get("plate", "").strip().upper() or None,
+        "slot": args.get("slot", "").strip() or None,
+        "before": args.get("before", type=int),
+    }
+    if session.get("role") == "admin":
+        filters["user_id"] = args.get("user_id", type=int)
+    else:
+        filters["user_id"] = session["user_id"]
+    return filters
+
+@app.route("/history")
+@login_required
+def parking_history():
+    try:
+        filters = history_filters(request.args)
+    except ValueError:
+        flash("Dates must be YYYY-MM-DD", "danger")
+        return redirect(url_for("parking_history"))
+
+    rows, next_before = history.page(get_db(), archived=archived_source(filters["date_from"]), **filters)
+    sessions = [dict(receipt_from_parking(row), id=row["id"]) for row in rows]
+    newest_args = {k: v for k, v in request.args.items() if k != "before"}
+    older_args = dict(newest_args, before=next_before) if next_before else None
+    return render_template("history.html", sessions=sessions, args=request.args,
+                           newest_args=newest_args, older_args=older_args)
+
+@app.route("/api/history")
+@login_required
+def api_history():
+    try:
+        filters = history_filters(request.args)
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+
+    rows, next_before = history.page(get_db(), limit=request.args.get("limit", history.PAGE_SIZE, type=int),
+                                     archived=archived_source(filters["date_from"]), **filters)
+    return jsonify({
+        "success": True,
+        "sessions": [
+            {
+                "id": row["id"],
+                "vehicle_number": row["vehicle_number"],
+                "slot": row["slot"],
+                "entry_time": row["entry_time"],
+                "exit_time": row["exit_time"],
+                "paid": row["paid"] == 1,
+                "paid_amount": row["paid_amount"],
+                "user_id": row["user_id"],
+            }
+            for row in rows
+        ],
+        "next": url_for("api_history", **dict(request.args.to_dict(), before=next_before)) if next_before else None
+    })
+
+# --------- Reservations --------- #
+def parse_window(form):
+    """(start_ts, end_ts) from datetime-local "from"/"to" fields; raises ValueError"""
+    start = datetime.strptime(form.get("from", ""), "%Y-%m-%dT%H:%M")
+    end = datetime.strptime(form.get("to", ""), "%Y-%m-%dT%H:%M")
+    return to_epoch(start), to_epoch(end)
+
+@app.route("/reservations", methods=["GET", "POST"])
+@login_required
+def reservations():
+    if request.method == "POST":
+        vehicle_number = request.form.get("vehicle_number", "").strip().upper()
+        slot_code = request.form.get("slot_code") or "auto"
+        if not vehicle_number:
+            flash("Vehicle number required", "danger")
+            return redirect(url_for("reservations"))
+        try:
+            start_ts, end_ts = parse_window(request.form)
+        except ValueError:
+            flash("Invalid reservation time", "danger")
+            return redirect(url_for("reservations"))
+        now_ts = to_epoch(datetime.now())
+        error = current_facility().reservations.validate(start_ts, end_ts, now_ts)
+        if error:
+            flash(error, "danger")
+            return redirect(url_for("reservations"))
+
+        slots = current_slots()
+        if slot_code == "auto":
+            codes = [s.code for s in sorted(slots, key=lambda s: s.rank)]
+        elif slot_code in slots:
+            codes = [slot_code]
+        else:
+            flash("Invalid slot selected", "danger")
+            return redirect(url_for("reservations"))
+
+        res_id, code = current_facility().reservations.reserve(
+            get_db(), codes, vehicle_number, session["user_id"], start_ts, end_ts, now_ts,
+            hold_seconds=app.config["WALK_IN_HOLD_MINUTES"] * 60)
+        if res_id is None:
+            flash("No slot is free for that time" if slot_code == "auto"
+                  else f"Slot {slot_code} is already reserved for that time", "warning")
+        else:
+            flash(f"Slot {code} reserved for {vehicle_number}", "success")
+        return redirect(url_for("reservations"))
+
+    sql = "SELECT * FROM reservations WHERE status='active' AND end_ts > ?"
+    args = [to_epoch(datetime.now())]
+    if session.get("role") != "admin":
+        sql += " AND user_id=?"
+        args.append(session["user_id"])
+    rows = query_db(sql + " ORDER BY start_ts LIMIT 200", args)
+    upcoming = [dict(row, start=to_text(from_epoch(row["start_ts"])), end=to_text(from_epoch(row["end_ts"])))
+                for row in rows]
+    return render_template("reservations.html", reservations=upcoming, slots=current_slots())
+
+@app.route("/reservations/<int:reservation_id>/cancel", methods=["POST"])
+@login_required
+def cancel_reservation(reservation_id):
+    owner = None if session.get("role") == "admin" else session["user_id"]
+    if current_facility().reservations.cancel(get_db(), reservation_id, owner):
+        flash("Reservation cancelled", "success")
+    else:
+        flash("Reservation not found", "danger")
+    return redirect(url_for("reservations"))
+
+def still_parked(start_ts):
+    """Occupied slots whose car isn't expected to have left by start_ts"""
+    now_ts = to_epoch(datetime.now())
+    hold = app.config["WALK_IN_HOLD_MINUTES"] * 60
+    return {s.code for s in current_slots() if s.status == "occupied"
+            and start_ts < expected_exit(to_epoch(s.exit_time), now_ts, hold)}
+
+@app.route("/api/availability")
+@login_required
+def api_availability():
+    """Is ?slot= free over ?from=&to=, or which slot is (nearest first) when no slot is given"""
+    try:
+        start_ts, end_ts = parse_window(request.args)
+    except ValueError:
+        return jsonify({"success": False, "message": "from/to must be YYYY-MM-DDTHH:MM"}), 400
+    booked = current_reservations()
+    parked = still_parked(start_ts)
+    slot_code = request.args.get("slot")
+    if slot_code:
+        if slot_code not in current_slots():
+            return jsonify({"success": False, "message": "Unknown slot"}), 404
+        return jsonify({"success": True, "slot": slot_code,
+                        "free": slot_code not in parked and booked.is_free(slot_code, start_ts, end_ts)})
+    codes = [s.code for s in sorted(current_slots(), key=lambda s: s.rank) if s.code not in parked]
+    free = booked.find_free(codes, start_ts, end_ts)
+    return jsonify({"success": True, "slot": free, "free": free is not None})
+
+# --------- Export (Admin only) --------- #
+@app.route("/admin/export.csv")
+@admin_required
+def export_parkings():
+    """Stream parking history as CSV. Filters: ?from=YYYY-MM-DD&to=YYYY-MM-DD&slot=3B"""
+    try:
+        date_from, date_to = date_range_args(request.args)
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+
+    # Accounts live in the home database; other facilities join them from there
+    users, attach = "users", None
+    if current_facility().path != DATABASE:
+        users, attach = "home.users", {"home": os.path.abspath(DATABASE)}
+    archived = archived_source(date_from)
+    if archived:
+        sql, args = exports.parkings_query(date_from, date_to, request.args.get("slot"),
+                                           table="all_parkings", users=users)
+        chunks = exports.stream_rows(archive.query(*archived, sql, args, date_from, date_to, attach=attach))
+    else:
+        sql, args = exports.parkings_query(date_from, date_to, request.args.get("slot"), users=users)
+        chunks = exports.stream_csv(os.path.abspath(current_facility().path), sql, args, attach=attach)
+    filename = f"parkings-{current_facility().key}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv"
+    return Response(
+        chunks,
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 # Add this after the confirm_payment route
 @app.route("/account")
 @login_required
@@ -568,11 +1372,17 @@ def change_password():
         flash("Admin password cannot be changed", "danger")
         return redirect(url_for("account"))
 
-    if not check_password_hash(user["password_hash"], old):
+    limited = too_many_attempts(user["username"])
+    if limited:
+        return limited
+
+    if not hasher.verify(user["password_hash"], old):
         flash("Old password incorrect", "danger")
         return redirect(url_for("account"))
 
-    execute_db("UPDATE users SET password_hash=? WHERE id=?", (generate_password_hash(newp), user["id"]))
+    execute_db("UPDATE users SET password_hash=? WHERE id=?", (hasher.hash(newp), user["id"]), home=True)
+    user_cache.invalidate(user["id"])
+    g.pop("user", None)
     flash("Password changed successfully", "success")
     return redirect(url_for("account"))
 
@@ -581,7 +1391,7 @@ def change_password():
 def forgot_password():
     if request.method == "POST":
         email = request.form.get("email")
-        user = query_db("SELECT * FROM users WHERE email=?", (email,), one=True)
+        user = query_db("SELECT * FROM users WHERE email=?", (email,), one=True, home=True)
         if user:
             flash("Password reset link generated (simulate here)", "info")
             return redirect(url_for("reset_password", user_id=user["id"]))
@@ -591,7 +1401,7 @@ def forgot_password():
 
 @app.route("/reset_password/<int:user_id>", methods=["GET", "POST"])
 def reset_password(user_id):
-    user = query_db("SELECT * FROM users WHERE id=?", (user_id,), one=True)
+    user = get_user(user_id)
     if not user:
         flash("Invalid user", "danger")
         return redirect(url_for("login"))
@@ -603,7 +1413,11 @@ def reset_password(user_id):
 
     if request.method == "POST":
         newp = request.form.get("new_password")
-        execute_db("UPDATE users SET password_hash=? WHERE id=?", (generate_password_hash(newp), user_id))
+        limited = too_many_attempts(user["username"])
+        if limited:
+            return limited
+        execute_db("UPDATE users SET password_hash=? WHERE id=?", (hasher.hash(newp), user_id), home=True)
+        user_cache.invalidate(user_id)
         flash("Password reset successful", "success")
         return redirect(url_for("login"))
 
@@ -612,22 +1426,118 @@ def reset_password(user_id):
 # Add this route to test the receipt directly
 @app.route("/test_receipt/<slot_code>")
 def test_receipt(slot_code):
-    slot_obj = next((s for s in slots if s["code"] == slot_code), None)
+    slot_obj = current_slots().get(slot_code)
     if slot_obj:
         return f"<pre>Slot Object: {slot_obj}</pre>"
     return "Slot not found"
 
+def facility_option(command):
+    """Add --facility KEY to a CLI command, which then runs against that lot's database"""
+    @click.option("--facility", "facility_key", help="Lot to work on (default: the first in FACILITIES)")
+    @wraps(command)
+    def with_facility(*args, facility_key=None, **kwargs):
+        if facility_key is not None:
+            g.facility = facilities().get(facility_key)
+            if g.facility is None:
+                raise click.ClickException(f"Unknown facility {facility_key}")
+        return command(*args, **kwargs)
+    return with_facility
+
+@app.cli.command("rebuild-rollups")
+@facility_option
+def rebuild_rollups_command():
+    """Recompute the dashboard rollups from the parkings table and archive."""
+    rollups.rebuild(get_db(), partitions=archive.partitions(current_facility().archive_dir))
+    print("✅ Rollups rebuilt")
+
+@app.cli.command("reprice")
+@facility_option
+@click.option("--from", "date_from", help="First exit date to include (YYYY-MM-DD)")
+@click.option("--to", "date_to", help="Exit date to stop before (YYYY-MM-DD)")
+@click.option("--tariff", "tariff_file", type=click.File(), help="JSON rate table to price with (default: current TARIFF)")
+@click.option("--output", type=click.File("w"), help="Write sessions whose price changes to this CSV file")
+def reprice_command(date_from, date_to, tariff_file, output):
+    """Re-price paid sessions under a tariff and report the difference."""
+    config = json.load(tariff_file) if tariff_file else app.config["TARIFF"]
+    candidate = Tariff.from_config(config)
+    writer = csv.writer(output) if output else None
+    if writer:
+        writer.writerow(["parking_id", "charged", "repriced", "difference"])
+
+    sessions = changed = 0
+    charged_total = repriced_total = 0.0
+    start_ts, end_ts = date_to_epoch(date_from), date_to_epoch(date_to)
+    rows = None
+    archived = archived_source(start_ts)
+    if archived:
+        # Filtered on exit time, so any entry month up to the end can hold matches
+        rows = archive.query(*archived, *reprice_query(start_ts, end_ts, table="all_parkings"), date_to=end_ts)
+    for ids, charged, repriced in reprice(get_db(), candidate, start_ts, end_ts, rows=rows):
+        differs = charged != repriced
+        sessions += len(ids)
+        changed += int(differs.sum())
+        charged_total += float(charged.sum())
+        repriced_total += float(repriced.sum())
+        if writer:
+            writer.writerows(zip(ids[differs].tolist(), charged[differs].tolist(), repriced[differs].tolist(),
+                                 (repriced - charged)[differs].tolist()))
+
+    print(f"Sessions:   {sessions}")
+    print(f"Changed:    {changed}")
+    print(f"Charged:    ₹{charged_total:.2f}")
+    print(f"Re-priced:  ₹{repriced_total:.2f} ({repriced_total - charged_total:+.2f})")
+
+@app.cli.command("archive")
+@facility_option
+@click.option("--days", type=int, help="Keep this many days of paid sessions hot (default: ARCHIVE_RETENTION_DAYS)")
+@click.option("--vacuum", is_flag=True, help="VACUUM afterwards to return the freed pages to the filesystem")
+def archive_command(days, vacuum):
+    """Move old paid sessions into monthly archive databases."""
+    days = app.config["ARCHIVE_RETENTION_DAYS"] if days is None else days
+    cutoff = to_epoch(datetime.now()) - days * 86400
+    archive_dir = current_facility().archive_dir
+    moved = archive.archive(get_db(), archive_dir, cutoff)
+    for month, count in moved.items():
+        print(f"{month}: {count} sessions archived")
+    print(f"✅ {sum(moved.values())} sessions archived to {archive_dir}/")
+    if vacuum:
+        get_db().execute("VACUUM")
+        print("✅ Database vacuumed")
+
+@app.cli.command("vendor-assets")
+def vendor_assets_command():
+    """Download the pinned third-party assets (Bootstrap) into static/vendor/."""
+    for path in assets.vendor(app.static_folder):
+        print(f"✅ {path}")
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Apply pending migrations and seed the admin user and slots, for every facility."""
+    for _facility in each_facility():
+        init_db()
+        seed_data()
+
+@app.cli.command("import-layout")
+@facility_option
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def import_layout_command(path):
+    """Add the slots in a JSON/CSV layout file and update existing ones' level, zone and rank."""
+    try:
+        slots = layout.load(path)
+    except (layout.LayoutError, KeyError, ValueError) as e:
+        raise click.ClickException(f"Invalid layout: {e}")
+    added = current_facility().allocator.import_layout(get_db(), slots)
+    print(f"✅ {len(slots)} slots in layout, {added} new")
+
 # ------------------ MAIN ------------------ #
 if __name__ == "__main__":
     if not os.path.exists(DATABASE):
         print("âš¡ Creating new database...")
-        open(DATABASE, "w").close()
-        with app.app_context():
-            init_db()
-            seed_data()
-    else:
-        # ðŸ”¥ Run seed_data even if database exists (to add missing slots)
-        with app.app_context():
-            seed_data()
+    # ðŸ”¥ Migrate and seed even if database exists (to add missing tables and slots)
+    for _facility in each_facility():
+        init_db()
+        seed_data()
+        warm_start()
+    print(f"✅ {asset_manifest.build()} static assets hashed and compressed")
     
     app.run(debug=True)
\ No newline at end of file
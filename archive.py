@@ -0,0 +1,167 @@
+"""Monthly archive partitions for closed sessions.
+
+archive() moves paid sessions that ended before a cutoff out of `parkings`
+and into <archive_dir>/parkings-YYYY-MM.db, one file per entry month. A
+partition only ever receives closed, paid sessions, so once written it never
+changes and needs backing up only once. Rollups are not touched: the totals
+already include archived sessions.
+
+Readers that need old sessions use query(). It ATTACHes the partitions
+covering the requested entry range to read-only connections and reads them
+through a temp view, `all_parkings`, that unions them with the hot table.
+"""
+import heapq
+import os
+import sqlite3
+from datetime import datetime
+
+from db_pool import TimedConnection
+from plates import NORM_SQL
+from timeutil import from_epoch, to_epoch
+
+# SQLite's default limit on attached databases per connection
+MAX_ATTACHED = 10
+
+_PREFIX = "parkings-"
+
+
+def month_of(ts):
+    return from_epoch(ts).strftime("%Y-%m")
+
+
+def month_bounds(month):
+    """[start, end) epoch seconds of a 'YYYY-MM' month"""
+    year, mon = map(int, month.split("-"))
+    return to_epoch(datetime(year, mon, 1)), to_epoch(datetime(year + mon // 12, mon % 12 + 1, 1))
+
+
+def partition_path(archive_dir, month):
+    return os.path.join(archive_dir, f"{_PREFIX}{month}.db")
+
+
+def partitions(archive_dir, date_from=None, date_to=None):
+    """Partition files whose entry month overlaps [date_from, date_to), oldest first"""
+    if not archive_dir or not os.path.isdir(archive_dir):
+        return []
+    first = month_of(date_from) if date_from is not None else None
+    last = month_of(date_to - 1) if date_to is not None else None
+    found = []
+    for name in sorted(os.listdir(archive_dir)):
+        if not (name.startswith(_PREFIX) and name.endswith(".db")):
+            continue
+        month = name[len(_PREFIX):-3]
+        if (first is None or month >= first) and (last is None or month <= last):
+            found.append(os.path.join(archive_dir, name))
+    return found
+
+
+def archived_before(db):
+    """Every archived session exited before this epoch second; None if nothing was ever archived"""
+    row = db.execute("SELECT value FROM app_state WHERE key='archived_before'").fetchone()
+    return row[0] if row else None
+
+
+def reaches(db, date_from):
+    """Does an entry range starting at date_from (None = the beginning) include archived sessions?"""
+    horizon = archived_before(db)
+    return horizon is not None and (date_from is None or date_from < horizon)
+
+
+# ------------------ MOVING ------------------ #
+def archive(db, archive_dir, cutoff_ts):
+    """Move paid sessions that exited before cutoff_ts into monthly partitions.
+
+    Each month is copied and committed to its partition before it is deleted
+    from the hot table. A crash in between leaves rows in both places, and
+    rerunning finishes the move. Returns {month: sessions moved}.
+    """
+    if db.in_transaction:
+        db.commit()
+    os.makedirs(archive_dir, exist_ok=True)
+    closed = ("paid = 1 AND exit_ts < ? AND entry_ts IS NOT NULL "
+              "AND id NOT IN (SELECT parking_id FROM slots WHERE parking_id IS NOT NULL)")
+    months = [row[0] for row in db.execute(
+        f"SELECT DISTINCT strftime('%Y-%m', entry_ts, 'unixepoch') FROM parkings WHERE {closed}", (cutoff_ts,))]
+
+    cols = [(row[1], row[2]) for row in db.execute("PRAGMA main.table_info(parkings)")]
+    names = ", ".join(name for name, _decl in cols)
+    decls = ", ".join("id INTEGER PRIMARY KEY" if name == "id" else f"{name} {decl}" for name, decl in cols)
+    moved = {}
+    for month in months:
+        start, end = month_bounds(month)
+        where = f"{closed} AND entry_ts >= ? AND entry_ts < ?"
+        args = (cutoff_ts, start, end)
+        db.execute("ATTACH DATABASE ? AS archive", (partition_path(archive_dir, month),))
+        try:
+            with db:
+                db.execute(f"CREATE TABLE IF NOT EXISTS archive.parkings ({decls})")
+                db.execute("CREATE INDEX IF NOT EXISTS archive.idx_parkings_user_id ON parkings(user_id, id)")
+                db.execute("CREATE INDEX IF NOT EXISTS archive.idx_parkings_entry_ts ON parkings(entry_ts)")
+                db.execute("CREATE INDEX IF NOT EXISTS archive.idx_parkings_exit_ts ON parkings(exit_ts, entry_ts)")
+                db.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_parkings_plate ON parkings({NORM_SQL}, id)")
+                db.execute(f"INSERT OR IGNORE INTO archive.parkings ({names}) "
+                           f"SELECT {names} FROM main.parkings WHERE {where}", args)
+            with db:
+                moved[month] = db.execute(
+                    f"DELETE FROM main.parkings WHERE {where} AND id IN (SELECT id FROM archive.parkings)", args
+                ).rowcount
+        finally:
+            db.execute("DETACH DATABASE archive")
+
+    with db:
+        db.execute(
+            "INSERT INTO app_state (key, value) VALUES ('archived_before', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)",
+            (cutoff_ts,),
+        )
+    return moved
+
+
+# ------------------ READING ------------------ #
+def _connect(database, paths, with_hot, attach):
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True, check_same_thread=False,
+                           factory=TimedConnection)
+    conn.row_factory = sqlite3.Row
+    for name, path in attach.items():
+        conn.execute("ATTACH DATABASE ? AS ?", (f"file:{path}?mode=ro", name))
+    hot = [name for name, in conn.execute("SELECT name FROM pragma_table_info('parkings')")]
+    selects = [f"SELECT {', '.join(hot)} FROM main.parkings"] if with_hot else []
+    for i, path in enumerate(paths):
+        conn.execute("ATTACH DATABASE ? AS ?", (f"file:{path}?mode=ro", f"part{i}"))
+        have = {row[1] for row in conn.execute(f"PRAGMA part{i}.table_info(parkings)")}
+        # Partitions written before a later migration lack its columns
+        selects.append("SELECT " + ", ".join(name if name in have else f"NULL AS {name}" for name in hot)
+                       + f" FROM part{i}.parkings")
+    conn.execute("CREATE TEMP VIEW all_parkings AS " + " UNION ALL ".join(selects))
+    return conn
+
+
+def query(database, archive_dir, sql, args=(), date_from=None, date_to=None,
+          order_by="id", descending=False, attach=None):
+    """Yield the rows of `sql`, written against the `all_parkings` view, across hot and archived sessions.
+
+    Only partitions for entry months in [date_from, date_to) are attached. More
+    than fit on one connection are spread over several. `sql` must be ordered
+    by `order_by`, so their results can be merged in order; with order_by=None
+    they are read one after another instead. `attach` maps
+    schema names to more databases every connection should see (e.g. accounts).
+    """
+    attach = attach or {}
+    per_conn = MAX_ATTACHED - len(attach)
+    paths = partitions(archive_dir, date_from, date_to)
+    groups = [paths[i:i + per_conn] for i in range(0, len(paths), per_conn)] or [[]]
+    conns = []
+    try:
+        for n, group in enumerate(groups):
+            conns.append(_connect(database, group, with_hot=n == 0, attach=attach))
+        cursors = [conn.execute(sql, args) for conn in conns]
+        if len(cursors) == 1:
+            yield from cursors[0]
+        elif order_by is None:
+            for cursor in cursors:
+                yield from cursor
+        else:
+            yield from heapq.merge(*cursors, key=lambda row: row[order_by], reverse=descending)
+    finally:
+        for conn in conns:
+            conn.close()
@@ -0,0 +1,146 @@
+"""Static assets: content-hashed URLs, year-long caching and precompressed variants.
+
+AssetManifest reads every file under the static folder once, names it
+after its content (style.css -> style.3f2a9c1b7e0d.css) and keeps gzip and,
+when the brotli package is installed, brotli encodings of the compressible
+ones. A changed file gets a new URL, so responses can be cached as
+immutable. Third-party files are committed under static/vendor/, so pages
+load without reaching a CDN; vendor() re-downloads them when bumping a pin.
+
+encodings() and encode() negotiate and compress rendered pages and JSON
+the same way, per response.
+"""
+import base64
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import urllib.request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Pinned third-party assets: vendored path -> (where vendor() fetches it from, its SRI hash)
+VENDOR = {
+    "vendor/bootstrap.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+        "sha384-QWTKZyjpPEjISv5WaRU9OFeRpok6YctnYmDr5pNlyT2bRjXh0JMhjY6hW+ALEwIH",
+    ),
+    "vendor/bootstrap.bundle.min.js": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js",
+        "sha384-YvpcrYf0tY3lHB60NNkmXc5s9fDVZLESaAA55NDzOxhy9GkcIdslK1eN7N6jIeHz",
+    ),
+}
+
+COMPRESSIBLE = {"text/html", "text/css", "text/plain", "text/csv", "application/javascript",
+                "text/javascript", "application/json", "image/svg+xml"}
+MIN_SIZE = 1024  # smaller bodies barely shrink and aren't worth the CPU
+AVAILABLE = ["br", "gzip"] if brotli is not None else ["gzip"]  # best first
+
+
+def encodings(accept_encoding):
+    """Encodings we can produce that the client accepts, best first"""
+    return [name for name in AVAILABLE if accept_encoding[name]]
+
+
+def encode(data, encoding, static=False):
+    """Compress `data`; static assets are compressed once, so they get the slow, thorough settings"""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else 4)
+    return gzip.compress(data, compresslevel=9 if static else 6, mtime=0)
+
+
+def compressible(mimetype):
+    return mimetype in COMPRESSIBLE
+
+
+class Asset:
+    __slots__ = ("filename", "hashed", "mimetype", "data", "etag", "encoded")
+
+    def __init__(self, filename, data, min_size=MIN_SIZE):
+        digest = hashlib.sha256(data).hexdigest()
+        stem, ext = os.path.splitext(filename)
+        self.filename = filename
+        self.hashed = f"{stem}.{digest[:12]}{ext}"
+        self.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        self.data = data
+        self.etag = digest[:32]
+        self.encoded = {}
+        if compressible(self.mimetype) and len(data) >= min_size:
+            for encoding in AVAILABLE:
+                body = encode(data, encoding, static=True)
+                if len(body) < len(data):
+                    self.encoded[encoding] = body
+
+    def body(self, accept_encoding):
+        """(body, content encoding or None) for a client accepting `accept_encoding`"""
+        for encoding in encodings(accept_encoding):
+            if encoding in self.encoded:
+                return self.encoded[encoding], encoding
+        return self.data, None
+
+
+class AssetManifest:
+    """Every file in the static folder, by original and by hashed name"""
+
+    def __init__(self, static_dir, min_size=MIN_SIZE):
+        self.static_dir = static_dir
+        self.min_size = min_size
+        self._by_name = None
+        self._by_hash = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Read, hash and precompress every static file. Returns the number of assets."""
+        by_name = {}
+        for root, _dirs, files in os.walk(self.static_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    by_name[filename] = Asset(filename, f.read(), self.min_size)
+        with self._lock:
+            self._by_name = by_name
+            self._by_hash = {asset.hashed: asset for asset in by_name.values()}
+        return len(by_name)
+
+    def _ensure(self):
+        if self._by_name is None:
+            self.build()
+
+    def hashed(self, filename):
+        """Content-hashed name of a static file, or None if there is no such file"""
+        self._ensure()
+        asset = self._by_name.get(filename)
+        return asset.hashed if asset else None
+
+    def get(self, hashed):
+        self._ensure()
+        return self._by_hash.get(hashed)
+
+
+def integrity(data):
+    """Subresource-integrity hash of `data`, as pinned in VENDOR"""
+    return "sha384-" + base64.b64encode(hashlib.sha384(data).digest()).decode()
+
+
+def vendor(static_dir, timeout=30):
+    """Download the VENDOR assets into the static folder. Returns the paths written.
+
+    Raises ValueError, writing nothing more, if a download doesn't match its pin.
+    """
+    written = []
+    for filename, (url, pin) in VENDOR.items():
+        path = os.path.join(static_dir, *filename.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            data = resp.read()
+        if integrity(data) != pin:
+            raise ValueError(f"{url} does not match its pinned hash {pin}")
+        with open(path, "wb") as f:
+            f.write(data)
+        written.append(path)
+    return written
@@ -0,0 +1,124 @@
+"""Password hashing off the request thread, plus login rate limiting.
+
+werkzeug's password hashes are deliberately expensive. Running them on a
+bounded process pool keeps a login storm from starving every other route in
+the worker, and a cap on queued jobs turns overload into a fast "busy"
+response instead of an ever-growing wait.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PoolBusy(Exception):
+    """Too many hashing jobs are already queued; the caller should retry later."""
+
+
+class HashingPool:
+    def __init__(self, workers=2, max_pending=32, timeout=10):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    def verify(self, pw_hash, password):
+        return self._run(check_password_hash, pw_hash, password)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        for _attempt in range(2):
+            executor = None
+            try:
+                executor = self._pool()
+                return self._call(executor, fn, *args)
+            except (BrokenProcessPool, OSError) as e:
+                # A worker died (or couldn't start); the executor stays broken until replaced
+                print(f"⚠️ Hashing pool failed ({e!r}); restarting it")
+                self._discard(executor)
+        # The rebuilt pool failed too: hash on this thread rather than fail the login
+        return fn(*args)
+
+    def _call(self, executor, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # Release on completion, not on our timeout, so abandoned jobs still count
+        future.add_done_callback(lambda _f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PoolBusy() from None
+
+    def _pool(self):
+        # A forked server worker must not reuse its parent's pool
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor):
+        """Drop a failed executor, so the next call builds a new one. Another thread may have already."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets: `burst` attempts at once, refilled at `rate` per second.
+
+    Keeps at most `max_keys` buckets, dropping the least recently used.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, *keys):
+        """Take one token from each key's bucket; False if any of them is empty."""
+        now = time.monotonic()
+        allowed = True
+        with self._lock:
+            for key in keys:
+                tokens, last = self._buckets.pop(key, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    allowed = False
+                self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+    def retry_after(self):
+        """Seconds until an empty bucket has a token again"""
+        return max(1, int(1 / self.rate + 0.5))
@@ -0,0 +1 @@
+"""Benchmarks for the parking app. Run a module with `python -m benchmarks.<name>`."""
@@ -0,0 +1,59 @@
+"""Requests per second with connect-per-request vs the pooled, tuned connections.
+
+    python -m benchmarks.db_pool --requests 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import app as parking_app
+from db_pool import close_pools
+
+
+def make_database(directory):
+    path = os.path.join(directory, "bench.db")
+    parking_app.DATABASE = path
+    with parking_app.app.app_context():
+        parking_app.init_db()
+        parking_app.seed_data()
+    return path
+
+
+def run(requests, pooled):
+    """Drive a park / receipt / pay / dashboard cycle through the test client."""
+    parking_app.app.config["DB_POOL"] = pooled
+    parking_app.facilities().default.allocator.invalidate()
+    client = parking_app.app.test_client()
+    client.post("/login", data={"username": "admin", "password": "admin123", "role": "admin"})
+
+    start = time.perf_counter()
+    done = 0
+    while done < requests:
+        client.post("/park", data={"vehicle_number": f"BENCH{done}", "slot_code": "auto",
+                                   "entry_time": "2025-01-01T10:00"})
+        client.get("/receipt_by_slot/1A")
+        client.post("/confirm_payment/1A")
+        client.get("/api/dashboard_stats")
+        done += 4
+    elapsed = time.perf_counter() - start
+    close_pools()
+    return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_database(directory)
+        before = run(args.requests, pooled=False)
+        after = run(args.requests, pooled=True)
+
+    print(f"connect-per-request: {before:8.1f} req/s")
+    print(f"pooled + WAL:        {after:8.1f} req/s  ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
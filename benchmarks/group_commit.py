@@ -0,0 +1,103 @@
+"""Park/pay writes per second: one commit per write vs the group-commit writer.
+
+    python -m benchmarks.group_commit --threads 32 --cycles 200 --synchronous FULL
+
+Each thread waits for its write before sending the next, so a group holds
+at most --threads writes: commits (and fsyncs) drop by about that factor.
+How much that raises throughput depends on what an fsync costs on the disk
+under the database; on tmpfs or a write-back cache it is little.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import app as parking_app
+from allocation import SlotAllocator
+from db_pool import ConnectionPool
+from group_commit import GroupCommitWriter
+
+
+def make_database(directory, slots):
+    path = os.path.join(directory, "bench.db")
+    parking_app.DATABASE = path
+    with parking_app.app.app_context():
+        parking_app.init_db()
+        parking_app.current_facility().allocator.add_slots(parking_app.get_db(), [f"{i}G" for i in range(slots)])
+    return path
+
+
+def run(path, threads, cycles, synchronous, grouped, window_ms=2):
+    """Each thread parks and pays in its own slot `cycles` times. Returns (writes/second, commits)."""
+    pool = ConnectionPool(path, pragmas={"synchronous": synchronous})
+    allocator = SlotAllocator()
+    writer = GroupCommitWriter(pool.connect, max_wait=window_ms / 1000) if grouped else None
+    busy = []
+    now = datetime(2025, 1, 1, 10, 0)
+
+    def worker(n):
+        code = f"{n}G"
+        db = pool.acquire()
+        for i in range(cycles):
+            if grouped:
+                parking_id, _version = writer.submit(allocator.claim_in, code, f"B{n}-{i}", None, now).result()
+                writer.submit(allocator.release_in, code, parking_id, 50, now).result()
+            else:
+                parking_id = _retry(lambda: allocator.claim(db, code, f"B{n}-{i}", None, now), busy)
+                _retry(lambda: allocator.release(db, code, parking_id, 50, now), busy)
+        pool.release(db)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    commits = threads * cycles * 2
+    if writer is not None:
+        writer.shutdown()
+        commits = writer.batches
+    if busy:
+        print(f"  {len(busy)} writes retried after 'database is locked'")
+    pool.close_all()
+    return threads * cycles * 2 / elapsed, commits
+
+
+def _retry(write, busy):
+    """Plain deferred transactions can fail with SQLITE_BUSY under contention; count and retry those"""
+    while True:
+        try:
+            return write()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            busy.append(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--cycles", type=int, default=100)
+    parser.add_argument("--synchronous", default="FULL", choices=["OFF", "NORMAL", "FULL"])
+    parser.add_argument("--window-ms", type=float, default=2, help="group-commit collection window")
+    parser.add_argument("--dir", help="directory for the database (default: a temp dir); use the real data disk")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = make_database(directory, args.threads)
+        single, single_commits = run(path, args.threads, args.cycles, args.synchronous, grouped=False)
+        grouped, grouped_commits = run(path, args.threads, args.cycles, args.synchronous, grouped=True,
+                                       window_ms=args.window_ms)
+
+    writes = args.threads * args.cycles * 2
+    print(f"commit per write: {single:9.1f} writes/s  {single_commits:7d} commits")
+    print(f"group commit:     {grouped:9.1f} writes/s  {grouped_commits:7d} commits"
+          f"  ({grouped / single:.1f}x throughput, {writes / grouped_commits:.1f} writes per commit)")
+
+
+if __name__ == "__main__":
+    main()
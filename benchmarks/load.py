@@ -0,0 +1,240 @@
+"""Replay a realistic traffic mix and report latency percentiles per route.
+
+    python -m benchmarks.load garage.db --requests 5000 --clients 4
+    python -m benchmarks.load garage.db --record trace.jsonl
+    python -m benchmarks.load garage.db --replay trace.jsonl --server
+
+Each client is an attendant logged in as admin, parking cars in its own share
+of the free slots, opening their receipts, taking payment and polling the
+dashboard. Logins are customer sign-ins on a fresh session. Requests go
+through the Flask test client, or with --server through a local threaded
+WSGI server over HTTP. A trace is one JSON request per line and replays
+exactly, as long as it is run against a copy of the database it was
+recorded on. After the run, the sessions the parks and payments left in the
+database are counted, so a mix that only exercised error paths shows up.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+from werkzeug.serving import make_server
+
+import app as parking_app
+from auth_pool import TokenBucketLimiter
+from benchmarks.synthetic import BENCH_PASSWORD
+from db_pool import close_pools
+
+# Share of each operation in the generated mix
+MIX = {"login": 0.05, "park": 0.25, "receipt": 0.25, "pay": 0.2, "dashboard": 0.25}
+ADMIN_LOGIN = {"username": "admin", "password": "admin123", "role": "admin"}
+
+
+# ------------------ PLANNING ------------------ #
+def plan(database, requests, clients, mix=MIX, seed=1):
+    """Build the request list: dicts of client, op, method, path and form"""
+    rng = random.Random(seed)
+    parking_app.DATABASE = database
+    with parking_app.app.app_context():
+        db = parking_app.get_db()
+        free = [row[0] for row in db.execute("SELECT code FROM slots WHERE status='free' ORDER BY id")]
+        users = [row[0] for row in db.execute("SELECT username FROM users WHERE role='customer' LIMIT 10000")]
+    if not free:
+        raise SystemExit("No free slots to park in")
+
+    # Disjoint slot pools so concurrent clients never race for the same slot
+    pools = [free[i::clients] for i in range(clients)]
+    entry_time = (datetime.now() - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M")
+    parked = [[] for _ in range(clients)]
+    ops, weights = zip(*mix.items())
+    trace = []
+    for n in range(requests):
+        client = n % clients
+        op = rng.choices(ops, weights)[0]
+        if op == "park" and not pools[client]:
+            op = "pay"
+        if op in ("receipt", "pay") and not parked[client]:
+            op = "park" if pools[client] else "dashboard"
+        if op == "login" and not users:
+            op = "dashboard"
+
+        if op == "login":
+            form = {"username": rng.choice(users), "password": BENCH_PASSWORD, "role": "customer"}
+            trace.append({"client": client, "op": op, "method": "POST", "path": "/login", "form": form})
+        elif op == "park":
+            code = pools[client].pop(rng.randrange(len(pools[client])))
+            parked[client].append(code)
+            form = {"vehicle_number": f"LOAD{n:07d}", "slot_code": code, "entry_time": entry_time}
+            trace.append({"client": client, "op": op, "method": "POST", "path": "/park", "form": form})
+        elif op == "receipt":
+            code = rng.choice(parked[client])
+            trace.append({"client": client, "op": op, "method": "GET", "path": f"/receipt_by_slot/{code}"})
+        elif op == "pay":
+            code = parked[client].pop(rng.randrange(len(parked[client])))
+            pools[client].append(code)
+            trace.append({"client": client, "op": op, "method": "POST", "path": f"/confirm_payment/{code}"})
+        else:
+            trace.append({"client": client, "op": op, "method": "GET", "path": "/api/dashboard_stats"})
+    return trace
+
+
+def write_trace(path, trace):
+    with open(path, "w") as f:
+        for item in trace:
+            f.write(json.dumps(item) + "\n")
+
+
+def read_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ------------------ TRANSPORTS ------------------ #
+class TestClientSession:
+    def __init__(self):
+        self.client = parking_app.app.test_client()
+
+    def request(self, method, path, form=None):
+        resp = self.client.open(path, method=method, data=form)
+        return resp.status_code, resp.data
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """Cookie-keeping HTTP client that, like the test client, does not follow redirects"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        try:
+            with self.opener.open(req) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# ------------------ RUNNING ------------------ #
+def run(trace, session_factory):
+    """Replay `trace`, one thread per client. Returns (samples, wall seconds)."""
+    by_client = defaultdict(list)
+    for item in trace:
+        by_client[item["client"]].append(item)
+    samples = defaultdict(list)   # op -> [(seconds, status)]
+    lock = threading.Lock()
+
+    def worker(items):
+        attendant = session_factory()
+        attendant.request("POST", "/login", ADMIN_LOGIN)
+        local = defaultdict(list)
+        for item in items:
+            session = session_factory() if item["op"] == "login" else attendant
+            started = time.perf_counter()
+            status, body = session.request(item["method"], item["path"], item.get("form"))
+            seconds = time.perf_counter() - started
+            if item["op"] == "pay" and not json.loads(body or b"{}").get("success"):
+                status = f"{status}-failed"  # e.g. "already paid": not a real payment
+            local[item["op"]].append((seconds, status))
+        with lock:
+            for op, values in local.items():
+                samples[op].extend(values)
+
+    threads = [threading.Thread(target=worker, args=(items,)) for items in by_client.values()]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - start
+
+
+def report(samples, elapsed):
+    total = sum(len(v) for v in samples.values())
+    print(f"{'route':<10} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  status")
+    for op in sorted(samples):
+        seconds = np.array([s for s, _status in samples[op]]) * 1000
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        statuses = defaultdict(int)
+        for _s, status in samples[op]:
+            statuses[str(status)] += 1
+        codes = " ".join(f"{code}x{n}" for code, n in sorted(statuses.items()))
+        print(f"{op:<10} {len(seconds):>7} {len(seconds) / elapsed:>8.1f} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}  {codes}")
+    print(f"{'total':<10} {total:>7} {total / elapsed:>8.1f}  in {elapsed:.2f}s")
+
+
+def check(database, trace):
+    """Compare the parks and payments in `trace` with the sessions they left. Returns True if they all took effect."""
+    parks = sum(item["op"] == "park" for item in trace)
+    pays = sum(item["op"] == "pay" for item in trace)
+    parking_app.DATABASE = database
+    with parking_app.app.app_context():
+        opened, paid = parking_app.get_db().execute(
+            "SELECT COUNT(*), COALESCE(SUM(paid), 0) FROM parkings WHERE vehicle_number LIKE 'LOAD%'").fetchone()
+    print(f"parks recorded: {opened}/{parks}, payments recorded: {paid}/{pays}")
+    if (opened, paid) != (parks, pays):
+        print("⚠️ Some parks or payments did not take effect; the latencies above include failed requests")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("database", help="e.g. one made by benchmarks.synthetic; it is modified")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--record", metavar="JSONL", help="write the planned trace here and exit")
+    parser.add_argument("--replay", metavar="JSONL", help="replay this trace instead of planning one")
+    parser.add_argument("--server", action="store_true", help="go over HTTP to a local threaded server")
+    args = parser.parse_args()
+
+    parking_app.DATABASE = args.database
+    if args.replay:
+        trace = read_trace(args.replay)
+    else:
+        trace = plan(args.database, args.requests, args.clients, seed=args.seed)
+    if args.record:
+        write_trace(args.record, trace)
+        print(f"Wrote {len(trace)} requests to {args.record}")
+        return
+
+    # Measure hashing and routing, not 429s from one client IP
+    parking_app.ip_limiter = TokenBucketLimiter(rate=1e9, burst=1e9)
+    parking_app.account_limiter = TokenBucketLimiter(rate=1e9, burst=1e9)
+
+    server = None
+    try:
+        if args.server:
+            server = make_server("127.0.0.1", 0, parking_app.app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+            samples, elapsed = run(trace, lambda: HttpSession(base_url))
+        else:
+            samples, elapsed = run(trace, TestClientSession)
+    finally:
+        if server is not None:
+            server.shutdown()
+        parking_app.hasher.shutdown()
+        close_pools()
+    report(samples, elapsed)
+    check(args.database, trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Startup time: bulk layout import and occupancy recovery for a large garage.
+
+    python -m benchmarks.startup --levels 10 --bays 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import app as parking_app
+from allocation import SlotAllocator
+from benchmarks.synthetic import generate, slot_codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=int, default=10)
+    parser.add_argument("--bays", type=int, default=1000, help="slots per level")
+    parser.add_argument("--occupancy", type=float, default=0.6)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Layout import into an empty garage, one transaction
+        parking_app.DATABASE = os.path.join(directory, "layout.db")
+        with parking_app.app.app_context():
+            parking_app.init_db()
+            start = time.perf_counter()
+            added = SlotAllocator().add_slots(parking_app.get_db(), slot_codes(args.levels, args.bays))
+            print(f"layout import: {added} slots in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        # Restart of a busy garage: recover + load the registry with a cold allocator
+        path = os.path.join(directory, "busy.db")
+        generate(path, levels=args.levels, bays=args.bays, users=10, parkings=10000, occupancy=args.occupancy)
+        parking_app.DATABASE = path
+        with parking_app.app.app_context():
+            allocator = SlotAllocator()
+            start = time.perf_counter()
+            allocator.recover(parking_app.get_db())
+            registry = allocator.refresh(parking_app.get_db())
+            elapsed = time.perf_counter() - start
+        print(f"restart:       {len(registry)} slots, {registry.occupied_count} occupied, "
+              f"in {elapsed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Generate a synthetic garage database for load tests.
+
+    python -m benchmarks.synthetic garage.db --levels 5 --bays 100 --users 5000 --parkings 2000000
+
+Every bench user has the password "bench". Paid history is spread over the
+last --days days and priced with the default tariff; --occupancy of the
+slots are left holding an open session.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+import app as parking_app
+import rollups
+from tariff import Tariff
+from timeutil import from_epoch, to_text
+
+BENCH_PASSWORD = "bench"
+ZONES = "ABCD"
+
+
+def slot_codes(levels, bays):
+    """Codes like "2-15B": `bays` per level, spread over four zones"""
+    return [f"{level}-{bay}{ZONES[bay * len(ZONES) // bays]}"
+            for level in range(1, levels + 1) for bay in range(bays)]
+
+
+def generate(path, levels=5, bays=100, users=1000, parkings=100000, days=365,
+             occupancy=0.6, seed=1, batch_size=100000):
+    """Create `path` with the given garage size. Returns {table: rows} counts."""
+    if os.path.exists(path):
+        raise SystemExit(f"{path} already exists")
+    rng = np.random.default_rng(seed)
+    parking_app.DATABASE = path
+    with parking_app.app.app_context():
+        parking_app.init_db()
+        db = parking_app.get_db()
+        codes = slot_codes(levels, bays)
+        parking_app.current_facility().allocator.add_slots(db, codes)
+        parking_app.seed_data()  # admin only; slots already exist
+
+        # Hashing is the slow part of a user row, so every bench user shares one
+        pw_hash = generate_password_hash(BENCH_PASSWORD)
+        with db:
+            db.executemany(
+                "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, 'customer')",
+                ((f"user{i}", f"user{i}@bench.local", pw_hash) for i in range(users)),
+            )
+        user_ids = [row[0] for row in db.execute("SELECT id FROM users WHERE role='customer'")]
+
+        now = int(time.time()) // 60 * 60
+        _history(db, rng, codes, user_ids, parkings, now - days * 86400, now, batch_size)
+        _open_sessions(db, rng, codes, user_ids, occupancy, now)
+
+        rollups.rebuild(db)
+        db.execute("ANALYZE")
+        db.commit()
+        return {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("slots", "users", "parkings")}
+
+
+def _history(db, rng, codes, user_ids, count, start_ts, end_ts, batch_size):
+    """Paid sessions in entry order, written in batches"""
+    tariff = Tariff()
+    entries = np.sort(rng.integers(start_ts, end_ts - 86400, count))
+    for lo in range(0, count, batch_size):
+        entry_ts = entries[lo:lo + batch_size]
+        n = len(entry_ts)
+        # Mostly short stays with a long tail of overnight ones
+        stay = np.minimum(rng.lognormal(mean=8.6, sigma=0.9, size=n), 3 * 86400).astype(np.int64) // 60 * 60
+        exit_ts = entry_ts + stay
+        _hours, amounts = tariff.quote_batch(entry_ts, exit_ts)
+        slots = rng.integers(0, len(codes), n)
+        users = rng.integers(0, len(user_ids), n)
+        rows = [
+            (f"GJ{(lo + i) % 100:02d}AB{(lo + i) % 10000:04d}", codes[s], user_ids[u],
+             to_text(from_epoch(int(a))), to_text(from_epoch(int(b))), int(a), int(b), int(amount))
+            for i, (s, u, a, b, amount) in enumerate(zip(slots, users, entry_ts, exit_ts, amounts))
+        ]
+        with db:
+            db.executemany(
+                "INSERT INTO parkings (vehicle_number, slot, user_id, entry_time, exit_time, "
+                "entry_ts, exit_ts, paid, paid_amount) VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)",
+                rows,
+            )
+
+
+def _open_sessions(db, rng, codes, user_ids, occupancy, now):
+    """Park a car in a random `occupancy` share of the slots"""
+    held = rng.choice(len(codes), size=int(len(codes) * occupancy), replace=False)
+    with db:
+        version = parking_app.current_facility().allocator._bump(db)
+        for i in held:
+            entry_ts = now - int(rng.integers(600, 12 * 3600)) // 60 * 60
+            parking_id = db.execute(
+                "INSERT INTO parkings (vehicle_number, slot, user_id, entry_time, entry_ts, paid, paid_amount) "
+                "VALUES (?, ?, ?, ?, ?, 0, 0)",
+                (f"OPEN{i:05d}", codes[i], user_ids[int(rng.integers(len(user_ids)))],
+                 to_text(from_epoch(entry_ts)), entry_ts),
+            ).lastrowid
+            db.execute("UPDATE slots SET status='occupied', parking_id=?, version=? WHERE code=?",
+                       (parking_id, version, codes[i]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--levels", type=int, default=5)
+    parser.add_argument("--bays", type=int, default=100, help="slots per level")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--parkings", type=int, default=100000, help="paid historical sessions")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--occupancy", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.path, levels=args.levels, bays=args.bays, users=args.users,
+                      parkings=args.parkings, days=args.days, occupancy=args.occupancy, seed=args.seed)
+    print(", ".join(f"{n} {table}" for table, n in counts.items()),
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import queue
+import sqlite3
+import threading
+from time import perf_counter
+
+# Applied to every pooled connection. WAL lets readers run alongside the writer,
+# and synchronous=NORMAL in WAL mode only fsyncs at checkpoints, not per commit.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -32000,       # KiB, i.e. ~32 MB page cache per connection
+    "mmap_size": 268435456,     # 256 MB memory-mapped reads
+    "busy_timeout": 5000,       # ms to wait on a locked database
+    "temp_store": "MEMORY",
+}
+
+_observer = None
+
+
+def set_query_observer(fn):
+    """Call fn(sql, seconds) after every statement run on a TimedConnection"""
+    global _observer
+    _observer = fn
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Times each statement up to its first row; fetching the rest isn't counted."""
+
+    def execute(self, sql, parameters=()):
+        started = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            if _observer is not None:
+                _observer(sql, perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            if _observer is not None:
+                _observer(sql, perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            if _observer is not None:
+                _observer(sql_script, perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose statements, however they're issued, all go through TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+class ConnectionPool:
+    """Long-lived, tuned SQLite connections for one database file.
+
+    Connections are checked out per request and returned afterwards, so a
+    worker ends up with one warm connection per thread it runs. Each keeps its
+    own prepared-statement cache for the lifetime of the process.
+    """
+
+    def __init__(self, path, max_idle=32, cached_statements=256, pragmas=None):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, cached_statements=self.cached_statements,
+                               check_same_thread=False, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, conn):
+        """Return a connection, discarding any transaction the request left open."""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """Shared pool for a database path"""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = ConnectionPool(path)
+    return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
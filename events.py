@@ -0,0 +1,121 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+# What dashboards show changes only when one of these does
+STATE_SQL = ("SELECT (SELECT value FROM app_state WHERE key='slots_version'), "
+             "(SELECT payments FROM rollups WHERE period='total' AND bucket=0 AND scope='all')")
+
+
+class Subscription:
+    """One connected client: a bounded queue of pending events."""
+
+    def __init__(self, feed, max_queue):
+        self.feed = feed
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def stream(self, heartbeat=15):
+        """Yield Server-Sent Events until the client disconnects.
+
+        A client that falls more than max_queue events behind is sent a single
+        `resync` event instead of the backlog, and should re-read full state.
+        """
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event, data = self.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                if self.overflowed:
+                    self.overflowed = False
+                    self._drain()
+                    event, data = "resync", {}
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            self.feed.unsubscribe(self)
+
+    def _drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class ChangeFeed:
+    """In-process fan-out of slot and payment changes to live dashboards.
+
+    Events published in one worker only reach clients connected to that
+    worker. With `path`, a watcher thread also follows the database while
+    anyone is subscribed: when occupancy or payments have changed, in any
+    worker or process, subscribers get a `refresh` event and re-read the
+    full stats. It checks PRAGMA data_version every `interval` seconds, so
+    the state is only read after something was committed.
+    """
+
+    def __init__(self, max_queue=100, path=None, interval=1.0):
+        self.max_queue = max_queue
+        self.path = path
+        self.interval = interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def subscribe(self):
+        sub = Subscription(self, self.max_queue)
+        with self._lock:
+            self._subscribers.add(sub)
+            if self.path and (self._watcher is None or not self._watcher.is_alive()):
+                self._watcher = threading.Thread(target=self._watch, name="feed-watcher", daemon=True)
+                self._watcher.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait((event, data))
+            except queue.Full:
+                # Slow client: drop the event and tell it to resync on its next read
+                sub.overflowed = True
+
+    def _watch(self):
+        """Publish `refresh` when the database's dashboard state changes; stops with the last subscriber"""
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            state = conn.execute(STATE_SQL).fetchone()
+            while True:
+                time.sleep(self.interval)
+                with self._lock:
+                    if not self._subscribers:
+                        self._watcher = None
+                        return
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version == data_version:
+                    continue
+                data_version = version
+                current = conn.execute(STATE_SQL).fetchone()
+                if current != state:
+                    state = current
+                    self.publish("refresh", {})
+        except sqlite3.Error as e:
+            print(f"⚠️ Change feed watcher stopped: {e}")
+            with self._lock:
+                self._watcher = None
+        finally:
+            conn.close()
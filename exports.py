@@ -0,0 +1,70 @@
+"""Streaming CSV export of parking history joined with users.
+
+Rows are read with fetchmany() on a dedicated read-only connection and written
+out batch by batch, so memory stays flat however large the export is. In WAL
+mode the long-running read does not block writers.
+"""
+import csv
+import io
+import sqlite3
+from itertools import islice
+
+from db_pool import TimedConnection
+
+COLUMNS = ["parking_id", "vehicle_number", "slot", "entry_time", "exit_time",
+           "paid", "paid_amount", "user_id", "username", "email"]
+
+
+def parkings_query(date_from=None, date_to=None, slot=None, table="parkings", users="users"):
+    """SQL and args for the export, filtered on entry time [date_from, date_to) and slot.
+
+    Use table="all_parkings" to run it through archive.query(), and e.g.
+    users="home.users" when accounts are in an attached database.
+    """
+    sql = (
+        "SELECT p.id, p.vehicle_number, p.slot, p.entry_time, p.exit_time, p.paid, p.paid_amount, "
+        "p.user_id, u.username, u.email "
+        f"FROM {table} p LEFT JOIN {users} u ON u.id = p.user_id WHERE 1=1"
+    )
+    args = []
+    if date_from is not None:
+        sql += " AND p.entry_ts >= ?"
+        args.append(date_from)
+    if date_to is not None:
+        sql += " AND p.entry_ts < ?"
+        args.append(date_to)
+    if slot:
+        sql += " AND p.slot = ?"
+        args.append(slot)
+    return sql + " ORDER BY p.id", args
+
+
+def stream_csv(database, sql, args, batch_size=5000, attach=None):
+    """Yield CSV text chunks of the query result, one chunk per fetchmany() batch.
+
+    `attach` maps schema names to more databases to open read-only alongside.
+    """
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True, check_same_thread=False,
+                           factory=TimedConnection)
+    try:
+        for name, path in (attach or {}).items():
+            conn.execute("ATTACH DATABASE ? AS ?", (f"file:{path}?mode=ro", name))
+        yield from stream_rows(conn.execute(sql, args), batch_size)
+    finally:
+        conn.close()
+
+
+def stream_rows(rows, batch_size=5000):
+    """CSV text chunks of any row iterable (e.g. archive.query()), batch_size rows at a time."""
+    rows = iter(rows)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    while True:
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        writer.writerows(batch)
@@ -0,0 +1,113 @@
+"""Several garages served by one deployment, each in its own SQLite shard.
+
+Every lot's slots, sessions, reservations and rollups live in its own
+database file, so a busy lot's write lock never holds up another lot.
+Accounts stay in the home database. A Facility is one lot: its shard and
+every cache that describes that shard's data. The FacilityRouter finds a
+lot by key and runs admin-wide queries on all shards at once.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import analytics
+from allocation import SlotAllocator
+from db_pool import ConnectionPool, get_pool
+from events import ChangeFeed
+from group_commit import GroupCommitWriter
+from plates import PlateIndex
+from receipt_cache import ReceiptCache
+from reservations import ReservationBook
+from slot_map import SlotMapCache
+
+
+class Facility:
+    """One lot: its shard's path and the per-shard caches"""
+
+    def __init__(self, key, name, path, archive_dir, max_reservation_hours=24, analytics_cache_days=366):
+        self.key = key
+        self.name = name
+        self.path = path
+        self.archive_dir = archive_dir
+        self.allocator = SlotAllocator()
+        self.reservations = ReservationBook(max_hours=max_reservation_hours)
+        self.slot_map = SlotMapCache()
+        self.plates = PlateIndex()
+        self.occupancy = analytics.OccupancyCache(max_days=analytics_cache_days)
+        self.receipts = ReceiptCache()
+        self.feed = ChangeFeed(path=path)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Facility({self.key!r}, {self.path!r})"
+
+    def writer(self, max_batch, max_wait):
+        """This shard's group-commit writer, started on first use"""
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    # One fsync per group is affordable, so the writer runs fully durable
+                    pool = ConnectionPool(self.path, pragmas={"synchronous": "FULL"})
+                    self._writer = GroupCommitWriter(pool.connect, max_batch=max_batch, max_wait=max_wait)
+        return self._writer
+
+    def shutdown(self):
+        if self._writer is not None:
+            self._writer.shutdown()
+
+
+class FacilityRouter:
+    """Facilities by key, in configuration order, plus a thread pool for fan-out queries"""
+
+    def __init__(self, facilities, workers=8):
+        self._facilities = {f.key: f for f in facilities}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fan-out")
+
+    def __iter__(self):
+        return iter(self._facilities.values())
+
+    def __len__(self):
+        return len(self._facilities)
+
+    def get(self, key):
+        return self._facilities.get(key)
+
+    @property
+    def default(self):
+        return next(iter(self._facilities.values()))
+
+    def fan_out(self, fn, timeout):
+        """Run fn(facility, db) on every shard in parallel, each on its own pooled connection.
+
+        Returns ({key: result}, {key: error message}). A shard that hasn't
+        answered within `timeout` seconds has its query interrupted and is
+        reported as timed out; the others' results are still returned.
+        """
+        jobs = []
+        for facility in self:
+            pool = get_pool(facility.path)
+            db = pool.acquire()
+            jobs.append((facility.key, pool, db, self._executor.submit(fn, facility, db)))
+        done, _pending = wait([future for *_rest, future in jobs], timeout=timeout)
+
+        results, errors = {}, {}
+        for key, pool, db, future in jobs:
+            if future not in done:
+                errors[key] = f"timed out after {timeout:g}s"
+                if future.cancel():
+                    pool.release(db)
+                else:
+                    db.interrupt()
+                    future.add_done_callback(lambda _f, pool=pool, db=db: pool.release(db))
+                continue
+            pool.release(db)
+            if future.exception() is not None:
+                errors[key] = str(future.exception())
+            else:
+                results[key] = future.result()
+        return results, errors
+
+    def shutdown(self):
+        for facility in self:
+            facility.shutdown()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,58 @@
+"""Commands for barrier and display controllers at the gates.
+
+park and confirm_payment add commands to the `gate_commands` table of the
+lot's database: an outbox that any process sharing the database can read.
+The gateway (gateway.py) follows it and pushes new commands to controllers
+over long-poll and streaming connections. Rows are identified by an
+increasing id, so a controller resumes from the last id it saw.
+"""
+import json
+import re
+from datetime import datetime
+
+from timeutil import to_epoch
+
+OPEN_BARRIER = "open_barrier"
+SLOT_ASSIGNED = "slot_assigned"
+KEEP = 10000  # newest commands kept per database; older ones are pruned as new ones arrive
+
+_GATE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+def gate_name(value, default):
+    """A gate name from a form or query value; `default` when missing or malformed"""
+    value = (value or "").strip()
+    return value if _GATE.match(value) else default
+
+
+def command(gate, kind, **payload):
+    return (gate, kind, payload)
+
+
+def enqueue(db, commands):
+    """Add (gate, kind, payload) commands inside the caller's transaction. Returns the last id."""
+    created_ts = to_epoch(datetime.now())
+    last_id = None
+    for gate, kind, payload in commands:
+        last_id = db.execute(
+            "INSERT INTO gate_commands (gate, command, payload, created_ts) VALUES (?, ?, ?, ?)",
+            (gate, kind, json.dumps(payload), created_ts),
+        ).lastrowid
+    if last_id is not None:
+        db.execute("DELETE FROM gate_commands WHERE id <= ?", (last_id - KEEP,))
+    return last_id
+
+
+def latest_id(db):
+    row = db.execute("SELECT MAX(id) FROM gate_commands").fetchone()
+    return row[0] or 0
+
+
+def since(db, after, limit=1000):
+    """Commands with id > after, oldest first, as dicts ready to send"""
+    rows = db.execute(
+        "SELECT id, gate, command, payload, created_ts FROM gate_commands WHERE id > ? ORDER BY id LIMIT ?",
+        (after, limit),
+    ).fetchall()
+    return [dict(json.loads(payload), id=id_, gate=gate, command=kind, created_ts=created_ts)
+            for id_, gate, kind, payload, created_ts in rows]
@@ -0,0 +1,168 @@
+"""Bulk entry/exit events uploaded by ANPR gate controllers.
+
+A batch is validated up front, then planned and written in one transaction
+under the database write lock, so every event sees the effects of the ones
+before it. Events are idempotent on their client `event_id`: a retried event
+returns the result recorded the first time instead of opening a second session.
+"""
+from datetime import datetime
+
+from timeutil import from_epoch, to_epoch
+
+MAX_BATCH = 1000
+KINDS = ("entry", "exit")
+
+
+def parse_timestamp(value):
+    """Epoch seconds or an ISO 8601 local time such as 2025-01-01T10:30:00"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return from_epoch(int(value))
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).replace(tzinfo=None, microsecond=0)
+    raise ValueError("timestamp must be epoch seconds or an ISO 8601 string")
+
+
+def _validate(raw):
+    """Return (event, None) or (None, error message)"""
+    if not isinstance(raw, dict):
+        return None, "event must be an object"
+    event_id = raw.get("event_id")
+    if not isinstance(event_id, str) or not event_id.strip():
+        return None, "event_id is required"
+    kind = raw.get("type")
+    if kind not in KINDS:
+        return None, "type must be 'entry' or 'exit'"
+    plate = raw.get("plate")
+    if not isinstance(plate, str) or not plate.strip():
+        return None, "plate is required"
+    slot = raw.get("slot")
+    if slot in (None, "", "auto"):
+        slot = None
+    elif not isinstance(slot, str):
+        return None, "slot must be a slot code or 'auto'"
+    try:
+        timestamp = parse_timestamp(raw.get("timestamp"))
+    except (TypeError, ValueError) as e:
+        return None, f"invalid timestamp: {e}"
+    return {
+        "event_id": event_id.strip(),
+        "type": kind,
+        "plate": plate.strip().upper(),
+        "slot": slot,
+        "timestamp": timestamp,
+    }, None
+
+
+def _known_events(db, event_ids):
+    rows = db.execute(
+        f"SELECT event_id, kind, slot, parking_id FROM gate_events WHERE event_id IN ({','.join('?' * len(event_ids))})",
+        event_ids,
+    ).fetchall() if event_ids else []
+    return {row["event_id"]: row for row in rows}
+
+
+def ingest(db, allocator, events, user_id=None, reservations=None, hold_seconds=3600):
+    """Apply a batch of gate events. Returns one result dict per input event, in order.
+
+    With `reservations` (a ReservationBook), entries avoid slots reserved for
+    someone else during [entry, entry + hold_seconds), as of the write transaction.
+    """
+    results = [None] * len(events)
+    valid = []
+    seen = set()
+    for i, raw in enumerate(events):
+        event, error = _validate(raw)
+        if event and event["event_id"] in seen:
+            error = "duplicate event_id in batch"
+        if error:
+            event_id = raw.get("event_id") if isinstance(raw, dict) else None
+            results[i] = {"event_id": event_id, "status": "rejected", "error": error}
+            continue
+        seen.add(event["event_id"])
+        valid.append((i, event))
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        known = _known_events(db, [event["event_id"] for _i, event in valid])
+        booked = reservations.refresh(db, to_epoch(datetime.now())) if reservations else None
+        ops, planned = _plan(allocator.refresh(db), valid, known, results, user_id, booked, hold_seconds)
+        parking_ids = allocator.write_batch(db, ops) if ops else []
+
+        received_ts = to_epoch(datetime.now())
+        ledger = []
+        for (i, event, code), parking_id in zip(planned, parking_ids):
+            results[i] = {"event_id": event["event_id"], "status": "accepted",
+                          "type": event["type"], "slot": code, "parking_id": parking_id}
+            ledger.append((event["event_id"], event["type"], event["plate"], code, parking_id,
+                           to_epoch(event["timestamp"]), received_ts))
+        db.executemany("INSERT INTO gate_events VALUES (?, ?, ?, ?, ?, ?, ?)", ledger)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return results
+
+
+def _plan(registry, valid, known, results, user_id, reservations=None, hold_seconds=3600):
+    """Turn validated events into allocator ops, simulating slot state as we go."""
+    plate_at = {s.vehicle: s.code for s in registry if s.status == "occupied"}
+    plate_in = {code: plate for plate, code in plate_at.items()}
+    overlay = {}  # code -> parking id / ("batch", i) / None for slots touched by this batch
+    ops, planned = [], []
+    entries = 0
+
+    def holder(code):
+        if code in overlay:
+            return overlay[code]
+        slot = registry.get(code)
+        return slot.parking_id if slot.status == "occupied" else None
+
+    for i, event in valid:
+        previous = known.get(event["event_id"])
+        if previous:
+            results[i] = {"event_id": event["event_id"], "status": "duplicate", "type": previous["kind"],
+                          "slot": previous["slot"], "parking_id": previous["parking_id"]}
+            continue
+
+        plate, code = event["plate"], event["slot"]
+        if event["type"] == "entry":
+            start = to_epoch(event["timestamp"])
+            busy = reservations.busy_slots(start, start + hold_seconds, plate) if reservations else set()
+            if plate in plate_at:
+                error = f"vehicle already parked in slot {plate_at[plate]}"
+            elif code is not None and code not in registry:
+                error = f"unknown slot {code}"
+            elif code is not None and holder(code) is not None:
+                error = f"slot {code} is occupied"
+            elif code is not None and code in busy:
+                error = f"slot {code} is reserved for that time"
+            else:
+                error = None
+                if code is None:
+                    # Slots freed earlier in this batch are not reused: their exit is not final until commit
+                    nearest = registry.nearest_free(skip=busy | overlay.keys())
+                    code = nearest.code if nearest else None
+                    if code is None:
+                        error = "no free slots"
+            if error:
+                results[i] = {"event_id": event["event_id"], "status": "rejected", "error": error}
+                continue
+            ops.append(("entry", code, plate, user_id, event["timestamp"]))
+            overlay[code] = ("batch", entries)
+            entries += 1
+            plate_at[plate], plate_in[code] = code, plate
+        else:
+            code = code or plate_at.get(plate)
+            if code is None or code not in registry or holder(code) is None:
+                results[i] = {"event_id": event["event_id"], "status": "rejected",
+                              "error": "no open session for this vehicle"}
+                continue
+            if plate_in.get(code) != plate:
+                results[i] = {"event_id": event["event_id"], "status": "rejected",
+                              "error": f"slot {code} holds another vehicle"}
+                continue
+            ops.append(("exit", code, holder(code), event["timestamp"]))
+            overlay[code] = None
+            plate_at.pop(plate_in.pop(code, None), None)
+        planned.append((i, event, code))
+    return ops, planned
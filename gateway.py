@@ -0,0 +1,293 @@
+"""Asyncio gateway for gate controllers: long-poll and streaming gate commands.
+
+A small ASGI app that runs next to the Flask app and shares its databases:
+
+    uvicorn gateway:create_app --factory --port 5001
+
+Each connected controller is a coroutine waiting on an event, not a worker
+thread, so one process holds thousands of mostly idle connections. One
+CommandBus per lot follows that lot's `gate_commands` outbox (see
+gate_commands.py). It checks PRAGMA data_version every GATEWAY_POLL_MS, and
+reads new rows only after another connection has committed. New commands
+are kept in memory and every waiting controller is woken at once.
+
+Every endpoint, health included, needs `Authorization: Bearer <GATE_API_KEY>`.
+Controllers pick their lot with ?facility= (default: the first lot). Commands
+go to a gate by name (?gate=entry); leaving out ?gate= receives every gate's
+commands.
+
+    GET /gate/commands?gate=entry&after=<id>&wait=30
+        Long poll. Answers as soon as there are commands newer than `after`,
+        or with none after `wait` seconds: {"commands": [...], "cursor": id}.
+        Without `after`, waits for the next command. "missed": true means
+        commands between `after` and the oldest one kept were dropped.
+    GET /gate/stream?gate=entry
+        Server-Sent Events, one `command` event per command. Resumes after
+        the Last-Event-ID header (or ?after=) on reconnect.
+    GET /gate/health
+        Connected controllers and the last command id per lot.
+"""
+import asyncio
+import hmac
+import json
+import sqlite3
+from collections import deque
+from urllib.parse import parse_qs
+
+import gate_commands
+
+MAX_WAIT = 60      # longest long poll a controller may ask for, seconds
+HEARTBEAT = 15     # seconds between keep-alive comments on idle streams
+BACKLOG = 1000     # recent commands kept in memory per lot
+
+
+class CommandBus:
+    """One lot's gate commands: follows its outbox and wakes waiting controllers"""
+
+    def __init__(self, key, path, backlog=BACKLOG):
+        self.key = key
+        self.path = path
+        self.last_id = 0
+        self.recent = deque(maxlen=backlog)
+        self._floor = 0            # commands at or below this id are no longer kept
+        self._changed = None
+        self._conn = None
+        self._data_version = None
+
+    # --------- Following the outbox (on a worker thread) --------- #
+    def _open(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _start(self):
+        self._conn = self._open()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return gate_commands.latest_id(self._conn)
+
+    def _poll(self):
+        """Commands committed since the last poll; nothing is read unless another connection committed"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return []
+        self._data_version = version
+        commands, after = [], self.last_id
+        while True:
+            batch = gate_commands.since(self._conn, after)
+            commands.extend(batch)
+            if len(batch) < 1000:
+                return commands
+            after = batch[-1]["id"]
+
+    async def run(self, interval):
+        """Follow the outbox until cancelled. Only commands added after start are delivered."""
+        self._changed = asyncio.Event()
+        self.last_id = self._floor = await asyncio.to_thread(self._start)
+        print(f"✅ Gateway following {self.key} from command {self.last_id}")
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    commands = await asyncio.to_thread(self._poll)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Gateway poll of {self.key} failed: {e}")
+                    continue
+                if commands:
+                    self._add(commands)
+        finally:
+            self._conn.close()
+
+    def _add(self, commands):
+        if len(self.recent) + len(commands) > self.recent.maxlen:
+            dropped = len(self.recent) + len(commands) - self.recent.maxlen
+            self._floor = (list(self.recent) + commands)[dropped - 1]["id"]
+        self.recent.extend(commands)
+        self.last_id = commands[-1]["id"]
+        # Wake everyone waiting on the current event; later waiters get a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    # --------- Reading (on the event loop) --------- #
+    def after(self, cursor, gate=None):
+        """(commands for `gate` newer than `cursor`, whether older ones were dropped)"""
+        missed = cursor < self._floor
+        commands = []
+        # Newest first, stopping at the cursor: a wake-up costs only the new commands
+        for c in reversed(self.recent):
+            if c["id"] <= cursor:
+                break
+            if gate is None or c["gate"] == gate:
+                commands.append(c)
+        commands.reverse()
+        return commands, missed
+
+    async def wait(self, cursor, gate, timeout):
+        """Commands newer than `cursor` for `gate`, waiting up to `timeout` seconds for some"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            changed = self._changed
+            commands, missed = self.after(cursor, gate)
+            remaining = deadline - loop.time()
+            if commands or missed or remaining <= 0:
+                return commands, missed
+            # Commands for other gates move the cursor on without waking this caller
+            cursor = max(cursor, self.last_id)
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+class Gateway:
+    """The ASGI app: routes controller connections to the lots' command buses"""
+
+    def __init__(self, lots, api_key, poll_interval=0.05, max_connections=10000):
+        self.buses = {key: CommandBus(key, path) for key, path in lots.items()}
+        self.default = next(iter(self.buses))
+        self.api_key = api_key
+        self.poll_interval = poll_interval
+        self.max_connections = max_connections
+        self.connections = 0
+        self._tasks = []
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._tasks = [asyncio.create_task(bus.run(self.poll_interval)) for bus in self.buses.values()]
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        path = scope["path"].rstrip("/")
+        if path not in ("/gate/commands", "/gate/stream", "/gate/health"):
+            return await _json(send, 404, {"success": False, "message": "Not found"})
+        if scope["method"] != "GET":
+            return await _json(send, 405, {"success": False, "message": "Method not allowed"})
+        if not self._authorized(scope):
+            return await _json(send, 401, {"success": False, "message": "Missing or invalid gate API key"})
+        if path == "/gate/health":
+            return await _json(send, 200, {
+                "connections": self.connections,
+                "facilities": {key: {"last_id": bus.last_id} for key, bus in self.buses.items()},
+            })
+
+        args = {name: values[-1] for name, values in parse_qs(scope["query_string"].decode()).items()}
+        bus = self.buses.get(args.get("facility") or self.default)
+        if bus is None:
+            return await _json(send, 400, {"success": False, "message": "Unknown facility"})
+        gate = args.get("gate") or None
+        try:
+            cursor = int(args.get("after") or _header(scope, b"last-event-id") or bus.last_id)
+            wait = min(float(args.get("wait", 30)), MAX_WAIT)
+        except ValueError:
+            return await _json(send, 400, {"success": False, "message": "after and wait must be numbers"})
+        if self.connections >= self.max_connections:
+            return await _json(send, 503, {"success": False, "message": "Gateway is at its connection limit"})
+
+        self.connections += 1
+        try:
+            if path == "/gate/commands":
+                await self._long_poll(bus, gate, cursor, wait, receive, send)
+            else:
+                await self._stream(bus, gate, cursor, receive, send)
+        finally:
+            self.connections -= 1
+
+    def _authorized(self, scope):
+        if not self.api_key:
+            return False
+        supplied = _header(scope, b"authorization") or ""
+        return hmac.compare_digest(supplied.encode(), f"Bearer {self.api_key}".encode())
+
+    async def _long_poll(self, bus, gate, cursor, wait, receive, send):
+        waiting = asyncio.create_task(bus.wait(cursor, gate, wait))
+        gone = asyncio.create_task(_disconnected(receive))
+        done, _pending = await asyncio.wait({waiting, gone}, return_when=asyncio.FIRST_COMPLETED)
+        if waiting not in done:  # the controller hung up
+            waiting.cancel()
+            return
+        gone.cancel()
+        commands, missed = waiting.result()
+        body = {"commands": commands, "cursor": commands[-1]["id"] if commands else max(cursor, bus.last_id)}
+        if missed:
+            body["missed"] = True
+        await _json(send, 200, body)
+
+    async def _stream(self, bus, gate, cursor, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        await _chunk(send, "retry: 3000\n\n")
+        gone = asyncio.create_task(_disconnected(receive))
+        try:
+            while not gone.done():
+                waiting = asyncio.create_task(bus.wait(cursor, gate, HEARTBEAT))
+                await asyncio.wait({waiting, gone}, return_when=asyncio.FIRST_COMPLETED)
+                if gone.done():
+                    waiting.cancel()
+                    break
+                commands, missed = waiting.result()
+                if missed:
+                    await _chunk(send, "event: resync\ndata: {}\n\n")
+                if not commands:
+                    cursor = max(cursor, bus.last_id)
+                    await _chunk(send, ": heartbeat\n\n")
+                    continue
+                cursor = commands[-1]["id"]
+                await _chunk(send, "".join(f"id: {c['id']}\nevent: command\ndata: {json.dumps(c)}\n\n"
+                                           for c in commands))
+        finally:
+            gone.cancel()
+
+
+# ------------------ ASGI HELPERS ------------------ #
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _json(send, status, body):
+    data = json.dumps(body).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(data)).encode()),
+        (b"cache-control", b"no-store"),
+    ]})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _chunk(send, text):
+    await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def create_app():
+    """Gateway over the lots configured in the Flask app"""
+    import app as pms
+    config = pms.app.config
+    lots = {key: path for key, (_name, path, _archive_dir) in pms.configured_lots().items()}
+    if not config["GATE_API_KEY"]:
+        print("⚠️ GATE_API_KEY is not set: the gateway will refuse every controller")
+    return Gateway(lots, config["GATE_API_KEY"], poll_interval=config["GATEWAY_POLL_MS"] / 1000,
+                   max_connections=config["GATEWAY_MAX_CONNECTIONS"])
@@ -0,0 +1,139 @@
+"""Group commit: many small write transactions committed as one.
+
+Request handlers submit write operations to a GroupCommitWriter and block on
+the returned future. A single writer thread drains the queue in windows of
+at most `max_batch` operations or `max_wait` seconds. It runs each operation
+in its own savepoint and commits the whole window together, so one commit
+(and, with synchronous=FULL, one fsync) is shared by every write in it.
+
+Operations run one at a time in submission order, so writes to the same
+slot are applied in the order they were submitted.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+_STOP = object()
+
+
+class WriterClosed(Exception):
+    """The writer has been shut down and accepts no more operations."""
+
+
+class WriteTimeout(Exception):
+    """A submitted operation was not committed in time; the caller should retry later."""
+
+
+class GroupCommitWriter:
+    def __init__(self, connect, max_batch=256, max_wait=0.002):
+        """`connect` returns a new sqlite3 connection for the writer thread."""
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.operations = 0
+        self._connect = connect
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(db, *args, **kwargs) in the next group. The future resolves after the commit."""
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise WriterClosed()
+            self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """submit() and wait for the commit.
+
+        Raises WriteTimeout if the operation hasn't started after `timeout`
+        seconds; it is then cancelled and never written, so the caller may
+        safely retry. An operation already running is waited for instead.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise WriteTimeout() from None
+        # Its group is being written: it commits or fails with the group
+        return future.result()
+
+    def shutdown(self, timeout=None):
+        """Stop accepting work, commit everything already queued and stop the thread."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # --------- Writer thread --------- #
+    def _run(self):
+        db = self._connect()
+        db.isolation_level = None  # transactions are managed explicitly below
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._collect()
+                if batch:
+                    self._commit(db, batch)
+        finally:
+            db.close()
+
+    def _collect(self):
+        """Block for the first operation, then take more until the window closes"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, db, batch):
+        results = []
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            for future, fn, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                db.execute("SAVEPOINT op")
+                try:
+                    results.append((future, fn(db, *args, **kwargs), None))
+                    db.execute("RELEASE op")
+                except Exception as e:
+                    # Undo just this operation; the rest of the group still commits
+                    db.execute("ROLLBACK TO op")
+                    db.execute("RELEASE op")
+                    results.append((future, None, e))
+            db.execute("COMMIT")
+        except Exception as e:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            print(f"⚠️ Group commit failed: {e}")
+            # BEGIN itself may have failed, before any future was set running
+            for future, _fn, _args, _kwargs in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.operations += len(results)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,46 @@
+"""Keyset-paginated parking history.
+
+Pages are ordered newest first and continue from the last id seen
+(`WHERE id < ?`) instead of OFFSET, so with the (user_id, id) and (slot, id)
+indexes every page costs the same however deep into the history it is.
+"""
+from itertools import islice
+
+import archive
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+COLUMNS = "id, vehicle_number, slot, entry_time, exit_time, entry_ts, exit_ts, paid, paid_amount, user_id"
+
+
+def page(db, user_id=None, slot=None, date_from=None, date_to=None, paid=None, plate=None,
+         before=None, limit=PAGE_SIZE, archived=None):
+    """One page of sessions matching the filters. Returns (rows, cursor for the next page or None).
+
+    Pass archived=(database path, archive dir) when the date range reaches
+    into archived months, to read the page across the partitions too.
+    """
+    sql = f"SELECT {COLUMNS} FROM {'all_parkings' if archived else 'parkings'} WHERE 1=1"
+    args = []
+    for clause, value in (
+        ("user_id = ?", user_id),
+        ("slot = ?", slot),
+        ("entry_ts >= ?", date_from),
+        ("entry_ts < ?", date_to),
+        ("paid = ?", paid),
+        ("vehicle_number = ?", plate),
+        ("id < ?", before),
+    ):
+        if value is not None:
+            sql += f" AND {clause}"
+            args.append(value)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    sql += " ORDER BY id DESC LIMIT ?"
+    args.append(limit + 1)
+    if archived:
+        rows = list(islice(archive.query(*archived, sql, args, date_from, date_to, descending=True), limit + 1))
+    else:
+        rows = db.execute(sql, args).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1]["id"]
+    return rows, None
@@ -0,0 +1,76 @@
+"""Garage layout files: the levels, zones and slots to create.
+
+JSON, either a list of slots:
+
+    [{"code": "1-1A", "level": 1, "zone": "A"}, ...]
+
+or levels of zones, with generated or explicit codes:
+
+    {"levels": [{"level": 1, "zones": [{"zone": "A", "slots": 50},
+                                       {"zone": "B", "codes": ["1-51B", "1-52B"]}]}]}
+
+CSV, with a header row: code,level,zone (level and zone optional).
+
+Slots are ranked in file order, so list them nearest to the entrance first.
+Generated codes look like "2-15B" (level 2, bay 15, zone B).
+"""
+import csv
+import json
+import os
+
+from slot_registry import parse_code
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def load(path):
+    """(code, level, zone) for every slot in the file, in rank order"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="") as f:
+        if ext == ".json":
+            slots = _from_json(json.load(f))
+        elif ext == ".csv":
+            slots = _from_csv(csv.DictReader(f))
+        else:
+            raise LayoutError(f"Layout must be a .json or .csv file, not {path}")
+    seen = set()
+    for code, _level, _zone in slots:
+        if code in seen:
+            raise LayoutError(f"Duplicate slot code {code}")
+        seen.add(code)
+    return slots
+
+
+def _slot(code, level=None, zone=None):
+    code = str(code).strip()
+    if not code:
+        raise LayoutError("Slot code is empty")
+    parsed_level, _bay, parsed_zone = parse_code(code)
+    return (code, int(level) if level not in (None, "") else parsed_level,
+            str(zone).strip().upper() if zone not in (None, "") else parsed_zone)
+
+
+def _from_json(data):
+    if isinstance(data, list):
+        return [_slot(item["code"], item.get("level"), item.get("zone")) for item in data]
+    slots = []
+    for level in data.get("levels", []):
+        number = int(level["level"])
+        bay = 0
+        for zone in level.get("zones", []):
+            name = str(zone.get("zone", "")).upper()
+            if "codes" in zone:
+                slots.extend(_slot(code, number, name) for code in zone["codes"])
+            else:
+                for _ in range(int(zone["slots"])):
+                    bay += 1
+                    slots.append((f"{number}-{bay}{name}", number, name))
+    return slots
+
+
+def _from_csv(reader):
+    if not reader.fieldnames or "code" not in reader.fieldnames:
+        raise LayoutError("CSV layout needs a header row with a 'code' column")
+    return [_slot(row["code"], row.get("level"), row.get("zone")) for row in reader]
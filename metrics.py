@@ -0,0 +1,131 @@
+"""Request and query instrumentation, rendered in the Prometheus text format.
+
+Counters live in this process only; with several workers each one serves its
+own numbers, so scrape every worker or aggregate by instance.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Query text with literals replaced by ?, so one label covers every call of a statement."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.total}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+class Metrics:
+    def __init__(self, slow_query_seconds=0.1, slow_log_size=100):
+        self.slow_query_seconds = slow_query_seconds
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._routes = {}      # (endpoint, method, status) -> Histogram of seconds
+        self._route_sql = {}   # endpoint -> Histogram of statements per request
+        self._sql = {}         # normalized sql -> [count, seconds]
+        self._gauges = []
+        self._lock = threading.Lock()
+
+    # --------- Recording --------- #
+    def observe_request(self, endpoint, method, status, seconds, sql_count):
+        with self._lock:
+            key = (endpoint, method, status)
+            if key not in self._routes:
+                self._routes[key] = Histogram(LATENCY_BUCKETS)
+            self._routes[key].observe(seconds)
+            if endpoint not in self._route_sql:
+                self._route_sql[endpoint] = Histogram(QUERY_COUNT_BUCKETS)
+            self._route_sql[endpoint].observe(sql_count)
+
+    def observe_query(self, sql, seconds, endpoint=None):
+        statement = normalize_sql(sql)
+        with self._lock:
+            totals = self._sql.setdefault(statement, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+        if seconds >= self.slow_query_seconds:
+            self.slow_queries.append((endpoint, statement, seconds))
+            print(f"🐢 Slow query ({seconds * 1000:.0f} ms) in {endpoint}: {statement}")
+
+    def gauge(self, name, help_text, read):
+        """Report read() as a gauge on every scrape; read may return a number or {label: number}."""
+        self._gauges.append((name, help_text, read))
+
+    # --------- Exposition --------- #
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items(), key=lambda item: tuple(map(str, item[0])))
+            route_sql = sorted(self._route_sql.items(), key=lambda item: str(item[0]))
+            sql = sorted(self._sql.items())
+            lines = [
+                "# HELP pms_request_duration_seconds Request latency by route",
+                "# TYPE pms_request_duration_seconds histogram",
+            ]
+            for (endpoint, method, status), hist in routes:
+                labels = f'endpoint="{_escape(endpoint)}",method="{method}",status="{status}"'
+                lines.extend(hist.lines("pms_request_duration_seconds", labels))
+            lines += [
+                "# HELP pms_request_sql_queries SQL statements issued per request",
+                "# TYPE pms_request_sql_queries histogram",
+            ]
+            for endpoint, hist in route_sql:
+                lines.extend(hist.lines("pms_request_sql_queries", f'endpoint="{_escape(endpoint)}"'))
+            lines += [
+                "# HELP pms_sql_queries_total SQL statements executed, by normalized text",
+                "# TYPE pms_sql_queries_total counter",
+            ]
+            lines += [f'pms_sql_queries_total{{query="{_escape(q)}"}} {count}' for q, (count, _s) in sql]
+            lines += [
+                "# HELP pms_sql_seconds_total Time spent in SQL statements, by normalized text",
+                "# TYPE pms_sql_seconds_total counter",
+            ]
+            lines += [f'pms_sql_seconds_total{{query="{_escape(q)}"}} {seconds}' for q, (_c, seconds) in sql]
+            lines += [
+                "# HELP pms_slow_queries Slow queries kept in the in-memory log",
+                "# TYPE pms_slow_queries gauge",
+                f"pms_slow_queries {len(self.slow_queries)}",
+            ]
+        for name, help_text, read in self._gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            value = read()
+            if isinstance(value, dict):
+                lines += [f'{name}{{kind="{kind}"}} {v}' for kind, v in value.items()]
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
@@ -0,0 +1,18 @@
+"""Database-backed slot occupancy: open session per slot and the slots_version counter."""
+from migrations import add_column, execute_all
+
+
+def upgrade(db):
+    add_column(db, "slots", "parking_id", "INTEGER")  # open session holding the slot
+    add_column(db, "slots", "version", "INTEGER NOT NULL DEFAULT 0")  # slots_version of the last change
+    execute_all(db, [
+        "CREATE INDEX IF NOT EXISTS idx_slots_version ON slots(version)",
+        "CREATE TABLE IF NOT EXISTS app_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO app_state (key, value) VALUES ('slots_version', 0)",
+    ])
+    # Occupancy used to live only in memory: cars parked before the upgrade hold their slots
+    db.execute(
+        "UPDATE slots SET status='occupied', version=0, parking_id=("
+        "  SELECT MAX(p.id) FROM parkings p WHERE p.slot = slots.code AND p.paid = 0) "
+        "WHERE status='free' AND EXISTS (SELECT 1 FROM parkings p WHERE p.slot = slots.code AND p.paid = 0)"
+    )
@@ -0,0 +1,17 @@
+"""Integer epoch copies of parkings entry/exit times, backfilled from the TEXT columns.
+
+Times are naive local wall-clock values, stored as if they were UTC (see timeutil).
+The TEXT columns are still written for readability.
+"""
+from migrations import add_column, execute_all
+
+
+def upgrade(db):
+    add_column(db, "parkings", "entry_ts", "INTEGER")
+    add_column(db, "parkings", "exit_ts", "INTEGER")
+    execute_all(db, [
+        "UPDATE parkings SET entry_ts = CAST(strftime('%s', entry_time) AS INTEGER) "
+        "WHERE entry_ts IS NULL AND entry_time IS NOT NULL",
+        "UPDATE parkings SET exit_ts = CAST(strftime('%s', exit_time) AS INTEGER) "
+        "WHERE exit_ts IS NULL AND exit_time IS NOT NULL",
+    ])
@@ -0,0 +1,13 @@
+"""Secondary indexes for the per-slot, revenue, per-user and plate lookups on parkings."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        # Latest session for a slot: WHERE slot=? ORDER BY id DESC LIMIT 1
+        "CREATE INDEX IF NOT EXISTS idx_parkings_slot_id ON parkings(slot, id)",
+        # Covers SUM(paid_amount) ... WHERE paid=1 without touching the table
+        "CREATE INDEX IF NOT EXISTS idx_parkings_paid ON parkings(paid, paid_amount)",
+        "CREATE INDEX IF NOT EXISTS idx_parkings_user_entry ON parkings(user_id, entry_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_parkings_vehicle ON parkings(vehicle_number)",
+    ])
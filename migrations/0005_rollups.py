@@ -0,0 +1,21 @@
+"""Precomputed entry/exit/revenue rollups for the dashboard (see rollups.py)."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        """CREATE TABLE IF NOT EXISTS rollups (
+            period TEXT NOT NULL,           -- 'total', 'day' or 'hour'
+            bucket INTEGER NOT NULL,        -- bucket start (epoch seconds), 0 for totals
+            scope TEXT NOT NULL,            -- 'all', 'level:<n>' or 'slot:<code>'
+            entries INTEGER NOT NULL DEFAULT 0,
+            exits INTEGER NOT NULL DEFAULT 0,
+            payments INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket, scope)
+        ) WITHOUT ROWID""",
+    ])
+    # Existing databases start with rollups matching their history
+    from rollups import rebuild
+    # slots.level only arrives in 0010, so levels come from the slot codes here
+    rebuild(db, commit=False, levels={})
@@ -0,0 +1,16 @@
+"""Ledger of processed gate controller events, keyed by the client's event id."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        """CREATE TABLE IF NOT EXISTS gate_events (
+            event_id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,             -- 'entry' or 'exit'
+            plate TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            parking_id INTEGER NOT NULL,
+            event_ts INTEGER NOT NULL,
+            received_ts INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+    ])
@@ -0,0 +1,8 @@
+"""Index parkings by entry time for date-range exports and reports."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        "CREATE INDEX IF NOT EXISTS idx_parkings_entry_ts ON parkings(entry_ts)",
+    ])
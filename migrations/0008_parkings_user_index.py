@@ -0,0 +1,8 @@
+"""Index parkings by (user_id, id) for keyset-paginated history."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        "CREATE INDEX IF NOT EXISTS idx_parkings_user_id ON parkings(user_id, id)",
+    ])
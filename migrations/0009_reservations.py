@@ -0,0 +1,22 @@
+"""Advance bookings: one row per reservation, versioned like slots for worker caches."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        """CREATE TABLE IF NOT EXISTS reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            slot TEXT NOT NULL,
+            vehicle_number TEXT NOT NULL,
+            user_id INTEGER,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active',   -- 'active' or 'cancelled'
+            version INTEGER NOT NULL DEFAULT 0,      -- reservations_version of the last change
+            created_ts INTEGER NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_version ON reservations(version)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_end ON reservations(end_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_user ON reservations(user_id, start_ts)",
+        "INSERT OR IGNORE INTO app_state (key, value) VALUES ('reservations_version', 0)",
+    ])
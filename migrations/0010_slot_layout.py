@@ -0,0 +1,20 @@
+"""Store each slot's level, zone and rank instead of deriving them from its code.
+
+Also indexes unpaid sessions per slot, which startup recovery reads.
+"""
+from migrations import add_column, execute_all
+from slot_registry import parse_code
+
+
+def upgrade(db):
+    add_column(db, "slots", "level", "INTEGER NOT NULL DEFAULT 1")
+    add_column(db, "slots", "zone", "TEXT NOT NULL DEFAULT ''")
+    add_column(db, "slots", "rank", "INTEGER")  # distance from the entrance; lower is nearer
+    codes = [row[0] for row in db.execute("SELECT code FROM slots")]
+    db.executemany(
+        "UPDATE slots SET level=?, zone=?, rank=id WHERE code=?",
+        [(level, zone, code) for code, (level, _bay, zone) in ((c, parse_code(c)) for c in codes)],
+    )
+    execute_all(db, [
+        "CREATE INDEX IF NOT EXISTS idx_parkings_unpaid ON parkings(slot, id) WHERE paid = 0",
+    ])
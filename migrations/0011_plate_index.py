@@ -0,0 +1,9 @@
+"""Index parkings by normalized plate, so plate lookups are prefix range scans."""
+from migrations import execute_all
+from plates import NORM_SQL
+
+
+def upgrade(db):
+    execute_all(db, [
+        f"CREATE INDEX IF NOT EXISTS idx_parkings_plate ON parkings({NORM_SQL}, id)",
+    ])
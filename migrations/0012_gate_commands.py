@@ -0,0 +1,15 @@
+"""Outbox of commands for barrier and display controllers, read by the gateway (gateway.py)."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        # AUTOINCREMENT: controllers resume from the last id they saw, so ids are never reused
+        """CREATE TABLE IF NOT EXISTS gate_commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gate TEXT NOT NULL,             -- 'entry', 'exit' or a lane name
+            command TEXT NOT NULL,          -- 'open_barrier' or 'slot_assigned'
+            payload TEXT NOT NULL,          -- JSON
+            created_ts INTEGER NOT NULL
+        )""",
+    ])
@@ -0,0 +1,8 @@
+"""Index parkings by exit time, so occupancy reports read only sessions that reach into their range."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        "CREATE INDEX IF NOT EXISTS idx_parkings_exit_ts ON parkings(exit_ts, entry_ts)",
+    ])
@@ -0,0 +1,12 @@
+"""Log of session writes that reach into past days, so every worker drops those days from its occupancy cache."""
+from migrations import execute_all
+
+
+def upgrade(db):
+    execute_all(db, [
+        # AUTOINCREMENT: caches remember the last seq they applied, so seqs are never reused
+        """CREATE TABLE IF NOT EXISTS occupancy_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            day INTEGER NOT NULL            -- first day (epoch seconds) whose occupancy changed
+        )""",
+    ])
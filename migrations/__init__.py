@@ -0,0 +1,54 @@
+"""Versioned schema migrations, tracked in the database's PRAGMA user_version.
+
+Each module named NNNN_description.py in this package has an upgrade(db)
+function. migrate() applies every migration newer than the database, each in
+its own transaction, so a failed step leaves the database at the previous version.
+"""
+import importlib
+import pkgutil
+
+
+def available():
+    """(version, module name) for every migration, oldest first"""
+    names = sorted(m.name for m in pkgutil.iter_modules(__path__) if m.name[:4].isdigit())
+    return [(int(name[:4]), name) for name in names]
+
+
+def current_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db):
+    """Bring the database up to the latest schema. Returns the applied migration names."""
+    applied = []
+    start = current_version(db)
+    for version, name in available():
+        if version <= start:
+            continue
+        module = importlib.import_module(f"{__name__}.{name}")
+        db.execute("BEGIN")
+        try:
+            module.upgrade(db)
+            db.execute(f"PRAGMA user_version = {version:d}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append(name)
+    return applied
+
+
+# ------------------ HELPERS FOR MIGRATIONS ------------------ #
+def columns(db, table):
+    return {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+
+
+def add_column(db, table, name, decl):
+    """ALTER TABLE ADD COLUMN, skipped if an older ad-hoc upgrade already added it."""
+    if name not in columns(db, table):
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+def execute_all(db, statements):
+    for statement in statements:
+        db.execute(statement)
@@ -0,0 +1,110 @@
+"""Plate lookup: where a vehicle is parked now, and when it was here before.
+
+Plates are compared normalized: upper case, without spaces or dashes, so
+"gj 01 ab 1234" finds GJ-01-AB-1234. Parked vehicles are looked up in a
+PlateIndex built from the slot registry. Past sessions are read through the
+idx_parkings_plate expression index, which only matches queries that spell
+the expression exactly as NORM_SQL does.
+"""
+import threading
+from bisect import bisect_left, insort
+
+NORM_SQL = "UPPER(REPLACE(REPLACE(vehicle_number, '-', ''), ' ', ''))"
+
+
+def normalize(plate):
+    """Python twin of NORM_SQL"""
+    return (plate or "").replace("-", "").replace(" ", "").upper()
+
+
+def prefix_range(prefix):
+    """[low, high) of the strings starting with `prefix`"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PlateIndex:
+    """Parked vehicles as sorted (normalized plate, slot code) pairs for prefix lookups.
+
+    sync() follows the registry's change log, so after the first build only
+    slots that changed since the last lookup are re-indexed.
+    """
+
+    def __init__(self):
+        self._entries = []   # (plate, code), sorted
+        self._by_code = {}   # code -> plate
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sync(self, registry):
+        with self._lock:
+            generation, seq = self._version or (None, 0)
+            codes = registry.changed_since(seq) if generation == registry.generation else None
+            if codes is None:
+                self._entries, self._by_code = [], {}
+                codes = [slot.code for slot in registry]
+            for code in codes:
+                self._reindex(registry.get(code))
+            self._version = (registry.generation, registry.seq)
+
+    def _reindex(self, slot):
+        old = self._by_code.pop(slot.code, None)
+        if old is not None:
+            del self._entries[bisect_left(self._entries, (old, slot.code))]
+        if slot.status == "occupied" and slot.vehicle:
+            plate = normalize(slot.vehicle)
+            self._by_code[slot.code] = plate
+            insort(self._entries, (plate, slot.code))
+
+    def search(self, prefix, limit=10):
+        """Codes of slots whose vehicle's plate starts with `prefix`, in plate order"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        low, high = prefix_range(prefix)
+        with self._lock:
+            i = bisect_left(self._entries, (low,))
+            found = []
+            while i < len(self._entries) and len(found) < limit and self._entries[i][0] < high:
+                found.append(self._entries[i][1])
+                i += 1
+        return found
+
+
+# Latest session and number of visits per plate, in plate order. The
+# plate range is scanned in index order, so LIMIT stops it early.
+_HISTORY_SQL = (
+    f"SELECT {NORM_SQL} AS plate, MAX(id) AS id, vehicle_number, slot, entry_ts, exit_ts, paid, "
+    "COUNT(*) AS visits FROM {table} "
+    f"WHERE {NORM_SQL} >= ? AND {NORM_SQL} < ? "
+    f"GROUP BY {NORM_SQL} ORDER BY {NORM_SQL} LIMIT ?"
+)
+
+
+def history(db, prefix, limit=10, read_archive=None):
+    """Past sessions of plates starting with `prefix`: the latest per plate, with its visit count.
+
+    With `read_archive`, a callable that runs a query against `all_parkings`
+    the way archive.query does, archived sessions are counted too.
+    """
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    args = prefix_range(prefix) + (limit,)
+    if read_archive is None:
+        return [dict(row) for row in db.execute(_HISTORY_SQL.format(table="parkings"), args)]
+    # Each connection groups its own partitions; merge the groups plate by plate
+    merged = {}
+    for row in read_archive(_HISTORY_SQL.format(table="all_parkings"), args, order_by="plate"):
+        if row["plate"] not in merged:
+            if len(merged) == limit:
+                break
+            merged[row["plate"]] = dict(row)
+            continue
+        seen = merged[row["plate"]]
+        seen["visits"] += row["visits"]
+        if row["id"] > seen["id"]:
+            seen.update({k: row[k] for k in ("id", "vehicle_number", "slot", "entry_ts", "exit_ts", "paid")})
+    return list(merged.values())
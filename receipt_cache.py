@@ -0,0 +1,41 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+class ClosedReceipt:
+    """A paid session's receipt. Paid sessions never change, so neither does this."""
+    __slots__ = ("parking_id", "user_id", "receipt", "etag", "last_modified")
+
+    def __init__(self, parking_id, user_id, receipt, last_modified):
+        self.parking_id = parking_id
+        self.user_id = user_id
+        self.receipt = receipt
+        self.last_modified = last_modified
+        digest = hashlib.sha1(json.dumps(receipt, sort_keys=True, default=str).encode()).hexdigest()
+        self.etag = f"{parking_id}-{digest[:16]}"
+
+
+class ReceiptCache:
+    """Bounded LRU of closed receipts by parking id."""
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, parking_id):
+        with self._lock:
+            entry = self._entries.get(parking_id)
+            if entry is not None:
+                self._entries.move_to_end(parking_id)
+            return entry
+
+    def put(self, entry):
+        with self._lock:
+            self._entries[entry.parking_id] = entry
+            self._entries.move_to_end(entry.parking_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
@@ -0,0 +1,220 @@
+"""Advance bookings: holding a slot for a future [start, end) window.
+
+Times are epoch seconds from timeutil. The `reservations` table is the source
+of truth. Each worker keeps a ReservationIndex as a read cache and catches
+up on changes through `app_state.reservations_version`, the same way
+SlotAllocator syncs slots.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+MAX_HOURS = 24
+
+
+class SlotReserved(Exception):
+    """The slot is reserved for someone else over the requested stay."""
+
+
+def expected_exit(exit_ts, now_ts, hold_seconds):
+    """When a parked car is expected to leave: its exit time if still ahead, else `hold_seconds` from now"""
+    return exit_ts if exit_ts is not None and exit_ts > now_ts else now_ts + hold_seconds
+
+
+def occupied_until(db, now_ts, hold_seconds):
+    """{code: expected exit} of the slots occupied right now, read in the caller's transaction"""
+    rows = db.execute(
+        "SELECT s.code, p.exit_ts FROM slots s JOIN parkings p ON p.id = s.parking_id WHERE s.status = 'occupied'")
+    return {code: expected_exit(exit_ts, now_ts, hold_seconds) for code, exit_ts in rows}
+
+
+class ReservationIndex:
+    """Active reservations as sorted, non-overlapping intervals per slot.
+
+    A slot's reservations never overlap, so its start times and end times are
+    sorted the same way, and two bisects find everything overlapping [a, b).
+    No reservation is longer than max_seconds, so any reservation overlapping
+    [a, b) in any slot starts inside (a - max_seconds, b). One bisect on the
+    global start-ordered list therefore bounds a search across all slots.
+    """
+
+    def __init__(self, max_seconds=MAX_HOURS * 3600):
+        self.max_seconds = max_seconds
+        self._slots = {}   # code -> ([starts], [ends], [ids])
+        self._all = []     # (start, end, id, code), sorted
+        self._by_id = {}   # id -> (start, end, code, vehicle)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, res_id):
+        return res_id in self._by_id
+
+    def add(self, res_id, code, start, end, vehicle):
+        if res_id in self._by_id:
+            self.remove(res_id)
+        starts, ends, ids = self._slots.setdefault(code, ([], [], []))
+        i = bisect_left(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        ids.insert(i, res_id)
+        insort(self._all, (start, end, res_id, code))
+        self._by_id[res_id] = (start, end, code, vehicle)
+
+    def remove(self, res_id):
+        entry = self._by_id.pop(res_id, None)
+        if entry is None:
+            return
+        start, end, code, _vehicle = entry
+        starts, ends, ids = self._slots[code]
+        i = ids.index(res_id, bisect_left(starts, start))
+        del starts[i], ends[i], ids[i]
+        del self._all[bisect_left(self._all, (start, end, res_id, code))]
+
+    def overlapping(self, code, start, end):
+        """Ids of reservations in `code` that overlap [start, end)"""
+        if code not in self._slots:
+            return []
+        starts, ends, ids = self._slots[code]
+        return ids[bisect_right(ends, start):bisect_left(starts, end)]
+
+    def is_free(self, code, start, end, vehicle=None):
+        """No reservation holds `code` over [start, end), other than ones for `vehicle`."""
+        return all(self._by_id[i][3] == vehicle for i in self.overlapping(code, start, end))
+
+    def busy_slots(self, start, end, vehicle=None):
+        """Codes held by some reservation overlapping [start, end)"""
+        lo = bisect_left(self._all, (start - self.max_seconds,))
+        hi = bisect_left(self._all, (end,))
+        return {code for _s, e, res_id, code in self._all[lo:hi]
+                if e > start and self._by_id[res_id][3] != vehicle}
+
+    def find_free(self, codes, start, end, vehicle=None):
+        """First of `codes` (e.g. in nearest-first order) free over [start, end), or None"""
+        if len(codes) == 1:
+            return codes[0] if self.is_free(codes[0], start, end, vehicle) else None
+        busy = self.busy_slots(start, end, vehicle)
+        return next((code for code in codes if code not in busy), None)
+
+    def upcoming(self, code, now):
+        """(start, end, id) of the next reservation in `code` still running at `now`, or None"""
+        if code not in self._slots:
+            return None
+        starts, ends, ids = self._slots[code]
+        i = bisect_right(ends, now)
+        return (starts[i], ends[i], ids[i]) if i < len(ids) else None
+
+
+class ReservationBook:
+    """Reservations shared by every worker, with conflict checks under the write lock."""
+
+    def __init__(self, max_hours=MAX_HOURS):
+        self.max_seconds = max_hours * 3600
+        self.index = None
+        self.version = None
+        self.loaded_ts = None
+        self._lock = threading.RLock()
+
+    # --------- Read cache --------- #
+    @staticmethod
+    def current_version(db):
+        row = db.execute("SELECT value FROM app_state WHERE key='reservations_version'").fetchone()
+        return row[0] if row else 0
+
+    def refresh(self, db, now_ts):
+        """Return the index, applying only reservations changed since the last refresh."""
+        version = self.current_version(db)
+        with self._lock:
+            # Reload now and then so reservations that have ended drop out of memory
+            if self.index is None or now_ts - self.loaded_ts > self.max_seconds:
+                self.index = ReservationIndex(self.max_seconds)
+                self.loaded_ts = now_ts
+                rows = db.execute(
+                    self._SELECT + " WHERE status='active' AND end_ts > ?", (now_ts,)
+                ).fetchall()
+                self._apply(rows)
+                self.version = version
+            elif version != self.version:
+                self._apply(db.execute(self._SELECT + " WHERE version > ?", (self.version,)).fetchall())
+                self.version = version
+            return self.index
+
+    def invalidate(self):
+        with self._lock:
+            self.index = None
+            self.version = None
+
+    _SELECT = "SELECT id, slot, vehicle_number, start_ts, end_ts, status FROM reservations"
+
+    def _apply(self, rows):
+        for row in rows:
+            if row["status"] == "active":
+                self.index.add(row["id"], row["slot"], row["start_ts"], row["end_ts"], row["vehicle_number"])
+            else:
+                self.index.remove(row["id"])
+
+    # --------- Writes --------- #
+    def validate(self, start_ts, end_ts, now_ts):
+        """Error message for an unacceptable window, or None"""
+        if end_ts <= start_ts:
+            return "Reservation must end after it starts"
+        if end_ts <= now_ts:
+            return "Reservation is already over"
+        if end_ts - start_ts > self.max_seconds:
+            return f"Reservations are limited to {self.max_seconds // 3600} hours"
+        return None
+
+    def reserve(self, db, codes, vehicle, user_id, start_ts, end_ts, now_ts, hold_seconds=3600):
+        """Book the first of `codes` free over [start_ts, end_ts).
+
+        Pass one code to book a specific slot, or every slot in preference order
+        to take any. A slot occupied now is taken until its car is expected to
+        leave (see expected_exit). Returns (reservation id, code), or (None, None)
+        if all are taken.
+        """
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            index = self.refresh(db, now_ts)
+            parked = occupied_until(db, now_ts, hold_seconds)
+            codes = [code for code in codes if start_ts >= parked.get(code, start_ts)]
+            code = index.find_free(codes, start_ts, end_ts)
+            if code is None:
+                db.rollback()
+                return None, None
+            version = self._bump(db)
+            res_id = db.execute(
+                "INSERT INTO reservations (slot, vehicle_number, user_id, start_ts, end_ts, version, created_ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (code, vehicle, user_id, start_ts, end_ts, version, now_ts),
+            ).lastrowid
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        with self._lock:
+            if self.index is not None and version == self.version + 1:
+                self.index.add(res_id, code, start_ts, end_ts, vehicle)
+                self.version = version
+        return res_id, code
+
+    def cancel(self, db, res_id, user_id=None):
+        """Cancel an active reservation (only the owner's, when user_id is given). Returns success."""
+        sql = "UPDATE reservations SET status='cancelled', version=? WHERE id=? AND status='active'"
+        args = [res_id]
+        if user_id is not None:
+            sql += " AND user_id=?"
+            args.append(user_id)
+        with db:
+            version = self._bump(db)
+            if not db.execute(sql, [version] + args).rowcount:
+                db.rollback()
+                return False
+        with self._lock:
+            if self.index is not None and version == self.version + 1:
+                self.index.remove(res_id)
+                self.version = version
+        return True
+
+    @staticmethod
+    def _bump(db):
+        db.execute("UPDATE app_state SET value = value + 1 WHERE key='reservations_version'")
+        return db.execute("SELECT value FROM app_state WHERE key='reservations_version'").fetchone()[0]
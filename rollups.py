@@ -0,0 +1,150 @@
+"""Running totals plus hourly and daily buckets of entries, exits and revenue.
+
+Rows are keyed by (period, bucket, scope) so every dashboard number is a single
+primary-key read. They are updated in the same transaction as the parkings
+write that changes them; rebuild() recomputes everything from parkings if they
+ever drift.
+"""
+import sqlite3
+
+from slot_registry import parse_code
+
+PERIODS = (("total", None), ("day", 86400), ("hour", 3600))
+
+_ON_CONFLICT_ADD = (
+    " ON CONFLICT (period, bucket, scope) DO UPDATE SET"
+    " entries = entries + excluded.entries, exits = exits + excluded.exits,"
+    " payments = payments + excluded.payments, revenue = revenue + excluded.revenue"
+)
+
+_UPSERT = (
+    "INSERT INTO rollups (period, bucket, scope, entries, exits, payments, revenue)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?)" + _ON_CONFLICT_ADD
+)
+
+
+def _scopes(slot, level):
+    return ("all", f"level:{level}", f"slot:{slot}")
+
+
+def _levels(db, codes=None):
+    """{code: level} as stored in `slots` (imported layouts need not follow the code pattern)"""
+    if codes is None:
+        return dict(db.execute("SELECT code, level FROM slots").fetchall())
+    codes = list(codes)
+    return dict(db.execute(
+        f"SELECT code, level FROM slots WHERE code IN ({','.join('?' * len(codes))})", codes).fetchall())
+
+
+def _level(levels, code):
+    level = levels.get(code)
+    return level if level is not None else parse_code(code)[0]
+
+
+def _bucket(ts, width):
+    return ts - ts % width if width else 0
+
+
+def _add(db, slot, ts, entries=0, exits=0, payments=0, revenue=0):
+    record_many(db, [(slot, ts, entries, exits, payments, revenue)])
+
+
+# ------------------ WRITES (call inside the parkings transaction) ------------------ #
+def record_many(db, changes):
+    """Apply (slot, ts, entries, exits, payments, revenue) changes with one executemany."""
+    levels = _levels(db, {change[0] for change in changes})
+    db.executemany(_UPSERT, [
+        (period, _bucket(ts, width), scope, entries, exits, payments, revenue)
+        for slot, ts, entries, exits, payments, revenue in changes
+        for period, width in PERIODS
+        for scope in _scopes(slot, _level(levels, slot))
+    ])
+
+
+def record_entry(db, slot, entry_ts):
+    _add(db, slot, entry_ts, entries=1)
+
+
+def record_exit(db, slot, exit_ts):
+    _add(db, slot, exit_ts, exits=1)
+
+
+def record_payment(db, slot, exit_ts, amount):
+    _add(db, slot, exit_ts, payments=1, revenue=amount)
+
+
+# ------------------ READS ------------------ #
+def get(db, period="total", bucket=0, scope="all"):
+    row = db.execute(
+        "SELECT entries, exits, payments, revenue FROM rollups WHERE period=? AND bucket=? AND scope=?",
+        (period, bucket, scope),
+    ).fetchone()
+    stats = dict(row) if row else {"entries": 0, "exits": 0, "payments": 0, "revenue": 0}
+    stats["occupied"] = stats["entries"] - stats["exits"]
+    return stats
+
+
+def today(db, now_ts):
+    return get(db, "day", _bucket(now_ts, 86400))
+
+
+def series(db, period, start, end, scope="all"):
+    """Buckets in [start, end) for one scope, oldest first."""
+    return [dict(row) for row in db.execute(
+        "SELECT bucket, entries, exits, payments, revenue FROM rollups "
+        "WHERE period=? AND scope=? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+        (period, scope, start, end),
+    )]
+
+
+# ------------------ REBUILD ------------------ #
+def _bucket_sql(column, width):
+    return f"({column} - {column} % {width})" if width else "0"
+
+
+def rebuild(db, commit=True, partitions=(), levels=None):
+    """Recompute all rollups from parkings and slots in one transaction.
+
+    `partitions` are archive files (see archive.py) whose sessions are added in too.
+    `levels` overrides the {code: level} map read from `slots`; codes missing
+    from it get the level their code spells.
+    """
+    if levels is None:
+        levels = _levels(db)
+
+    def slot_level(code):
+        return _level(levels, code)
+
+    db.create_function("slot_level", 1, slot_level, deterministic=True)
+    if commit and not db.in_transaction:
+        db.execute("BEGIN")
+    db.execute("DELETE FROM rollups")
+    held = "id IN (SELECT parking_id FROM slots WHERE parking_id IS NOT NULL)"
+    for period, sql in _rebuild_queries(exited=f"NOT {held}"):
+        db.execute(
+            "INSERT INTO rollups (period, bucket, scope, entries, exits, payments, revenue) "
+            f"SELECT '{period}', * FROM ({sql}) WHERE true" + _ON_CONFLICT_ADD
+        )
+    for path in partitions:
+        # Archived sessions are all closed and paid
+        part = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            part.create_function("slot_level", 1, slot_level, deterministic=True)
+            for period, sql in _rebuild_queries(exited="1"):
+                db.executemany(_UPSERT, ((period, *row) for row in part.execute(sql)))
+        finally:
+            part.close()
+    if commit:
+        db.commit()
+
+
+def _rebuild_queries(exited):
+    """(period, aggregate SQL over parkings) pairs; `exited` selects sessions that have left"""
+    for period, width in PERIODS:
+        entry_bucket = _bucket_sql("entry_ts", width)
+        exit_bucket = _bucket_sql("COALESCE(exit_ts, entry_ts)", width)
+        for scope in ("'all'", "'level:' || slot_level(slot)", "'slot:' || slot"):
+            # Every session is an entry; sessions no longer holding a slot have exited
+            yield period, f"SELECT {entry_bucket}, {scope}, COUNT(*), 0, 0, 0 FROM parkings GROUP BY 1, 2"
+            yield period, f"SELECT {exit_bucket}, {scope}, 0, COUNT(*), 0, 0 FROM parkings WHERE {exited} GROUP BY 1, 2"
+            yield period, f"SELECT {exit_bucket}, {scope}, 0, 0, COUNT(*), SUM(paid_amount) FROM parkings WHERE paid=1 GROUP BY 1, 2"
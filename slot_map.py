@@ -0,0 +1,83 @@
+"""The park page's slot map: a view model, its cached rendering and deltas.
+
+The map is laid out as levels of rows, one row per bay, holding that bay's
+zones as cells. build() computes it from the registry once per registry
+state, and SlotMapCache keeps the rendered fragment until the state moves
+on. Pages then poll delta() with the version they rendered and patch only
+the cells that changed since.
+"""
+import threading
+from collections import defaultdict
+
+from slot_registry import parse_code
+
+
+def cell(slot):
+    return {"code": slot.code, "status": slot.status}
+
+
+def build(registry):
+    """[{"level", "rows": [{"label", "cells"}]}], levels and rows in order"""
+    levels = defaultdict(dict)
+    for slot in registry:
+        _level, bay, zone = parse_code(slot.code)
+        # Codes from an imported layout may not follow the bay/zone pattern
+        key = (bay, "") if bay else (0, slot.code)
+        levels[slot.level].setdefault(key, []).append((zone, slot.code, slot))
+    model = []
+    for level in sorted(levels):
+        rows = []
+        for (bay, code), cells in sorted(levels[level].items()):
+            rows.append({
+                "label": f"SLOT {bay}" if bay else code,
+                "cells": [cell(slot) for _zone, _code, slot in sorted(cells, key=lambda c: c[:2])],
+            })
+        model.append({"level": level, "rows": rows})
+    return model
+
+
+def version(registry):
+    """Token for the registry state a map was rendered from"""
+    return f"{registry.generation}:{registry.seq}"
+
+
+def delta(registry, since):
+    """Cells changed since the `since` version token.
+
+    Returns None when the changes can't be worked out: the token is from
+    another registry (a reload, or another worker) or older than its change
+    log. The client then needs the whole map again.
+    """
+    generation, _, seq = (since or "").partition(":")
+    if generation != registry.generation or not seq.isdigit():
+        return None
+    codes = registry.changed_since(int(seq))
+    if codes is None:
+        return None
+    return [cell(registry.get(code)) for code in sorted(codes)]
+
+
+class SlotMapCache:
+    """The rendered slot map for the most recent registry state"""
+
+    def __init__(self):
+        self.renders = 0
+        self._key = None
+        self._html = None
+        self._lock = threading.Lock()
+
+    def get(self, registry, render):
+        """Rendered map of `registry`; render(model, version) is called only when its state has changed"""
+        key = version(registry)
+        with self._lock:
+            if key == self._key:
+                return self._html
+        html = render(build(registry), key)
+        with self._lock:
+            self._key, self._html = key, html
+            self.renders += 1
+        return html
+
+    def invalidate(self):
+        with self._lock:
+            self._key = self._html = None
@@ -0,0 +1,232 @@
+import heapq
+import re
+import secrets
+import threading
+from collections import deque
+
+# Slot codes look like "3B" (level 1) or "2-15A" (level 2, bay 15, zone A)
+CODE_RE = re.compile(r"^(?:(\d+)-)?(\d+)([A-Za-z]*)$")
+
+
+def parse_code(code):
+    """Split a slot code into (level, bay, zone). Unknown formats land on level 1."""
+    m = CODE_RE.match(code)
+    if not m:
+        return 1, 0, ""
+    level, bay, zone = m.groups()
+    return int(level or 1), int(bay), zone.upper()
+
+
+class Slot:
+    """Compact live record for one parking slot."""
+    __slots__ = ("code", "level", "zone", "rank", "status", "vehicle",
+                 "entry_time", "exit_time", "paid", "paid_amount", "parking_id")
+
+    def __init__(self, code, level=1, zone="", rank=0):
+        self.code = code
+        self.level = level
+        self.zone = zone
+        self.rank = rank
+        self.clear()
+
+    def clear(self):
+        self.status = "free"
+        self.vehicle = None
+        self.entry_time = None
+        self.exit_time = None
+        self.paid = False
+        self.paid_amount = 0
+        self.parking_id = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"Slot({self.to_dict()!r})"
+
+
+class SlotRegistry:
+    """In-memory slot index: O(1) lookup by code and O(log n) nearest-free allocation.
+
+    Free slots are kept in min-heaps ordered by rank (distance from the entrance),
+    one for the whole garage plus one per level and per (level, zone). Heaps use
+    lazy deletion: stale entries are discarded when they reach the top, and a
+    heap that has doubled since it was last rebuilt is compacted, so repeated
+    occupy/release cycles can't grow it without bound.
+    """
+
+    # Changes remembered for changed_since(); older readers start over
+    CHANGE_LOG_SIZE = 10000
+
+    def __init__(self):
+        self._by_code = {}
+        self._free = set()
+        self._heaps = {}
+        self._compacted = {}  # heap key -> its size after the last rebuild
+        self._last_session = {}  # code -> id of the latest session seen in that slot
+        self._lock = threading.RLock()
+        self.occupied_count = 0
+        # (generation, seq) identifies this registry's state: seq counts its
+        # changes, and every registry (in any worker) has its own generation
+        self.generation = secrets.token_hex(6)
+        self.seq = 0
+        self._changes = deque(maxlen=self.CHANGE_LOG_SIZE)
+
+    @classmethod
+    def from_codes(cls, codes):
+        """Build a registry from slot codes, ranking them in the given order."""
+        registry = cls()
+        for code in codes:
+            level, _bay, zone = parse_code(code)
+            registry.add(code, level=level, zone=zone)
+        return registry
+
+    # --------- Layout --------- #
+    def add(self, code, level=1, zone="", rank=None):
+        with self._lock:
+            if code in self._by_code:
+                raise ValueError(f"Duplicate slot code {code}")
+            slot = Slot(code, level, zone, len(self._by_code) if rank is None else rank)
+            self._by_code[code] = slot
+            self._mark_free(slot)
+            self._changed(code)
+            return slot
+
+    def levels(self):
+        return sorted({s.level for s in self._by_code.values()})
+
+    def zones(self, level):
+        return sorted({s.zone for s in self._by_code.values() if s.level == level})
+
+    # --------- Lookup --------- #
+    def get(self, code):
+        return self._by_code.get(code)
+
+    def __contains__(self, code):
+        return code in self._by_code
+
+    def __iter__(self):
+        return iter(self._by_code.values())
+
+    def __len__(self):
+        return len(self._by_code)
+
+    @property
+    def free_count(self):
+        return len(self._free)
+
+    def free_slots(self):
+        """Free slots ordered nearest first."""
+        with self._lock:
+            free = list(self._free)
+        return sorted((self._by_code[c] for c in free), key=lambda s: s.rank)
+
+    def nearest_free(self, level=None, zone=None, skip=()):
+        """Return the free slot closest to the entrance, optionally within a level/zone.
+
+        Free slots in `skip` (e.g. reserved ones) are passed over; they are set
+        aside while searching and pushed back afterwards.
+        """
+        with self._lock:
+            heap = self._heaps.get(self._heap_key(level, zone))
+            passed = []
+            try:
+                while heap:
+                    entry = heap[0]
+                    if entry[1] not in self._free:
+                        heapq.heappop(heap)
+                    elif entry[1] in skip:
+                        passed.append(heapq.heappop(heap))
+                    else:
+                        return self._by_code[entry[1]]
+                return None
+            finally:
+                for entry in passed:
+                    heapq.heappush(heap, entry)
+
+    # --------- State changes --------- #
+    def occupy(self, code, vehicle=None, entry_time=None, exit_time=None, parking_id=None):
+        with self._lock:
+            slot = self._by_code[code]
+            if slot.status != "occupied":
+                self._free.discard(code)
+                self.occupied_count += 1
+            slot.status = "occupied"
+            slot.vehicle = vehicle
+            slot.entry_time = entry_time
+            slot.exit_time = exit_time
+            slot.paid = False
+            slot.paid_amount = 0
+            slot.parking_id = parking_id
+            if parking_id is not None:
+                self._last_session[code] = parking_id
+            self._changed(code)
+            return slot
+
+    def release(self, code):
+        with self._lock:
+            slot = self._by_code[code]
+            if slot.status == "occupied":
+                self.occupied_count -= 1
+            slot.clear()
+            self._mark_free(slot)
+            self._changed(code)
+            return slot
+
+    # --------- Latest session per slot (for receipts) --------- #
+    def last_session(self, code):
+        """Id of the latest session known to have used `code`, or None if not known"""
+        with self._lock:
+            return self._last_session.get(code)
+
+    def remember_session(self, code, parking_id):
+        """Record a slot's latest session as read from the database, unless a newer one was seen meanwhile"""
+        with self._lock:
+            if code in self._by_code:
+                self._last_session.setdefault(code, parking_id)
+
+    def forget_session(self, code):
+        with self._lock:
+            self._last_session.pop(code, None)
+
+    def changed_since(self, seq):
+        """Codes changed after change number `seq`, or None if the log no longer goes back that far"""
+        with self._lock:
+            if seq >= self.seq:
+                return set()
+            if not self._changes or self._changes[0][0] > seq + 1:
+                return None
+            codes = set()
+            for n, code in reversed(self._changes):
+                if n <= seq:
+                    break
+                codes.add(code)
+            return codes
+
+    def _changed(self, code):
+        self.seq += 1
+        self._changes.append((self.seq, code))
+
+    def _mark_free(self, slot):
+        if slot.code in self._free:
+            return
+        self._free.add(slot.code)
+        entry = (slot.rank, slot.code)
+        for key in (None, (slot.level, None), (slot.level, slot.zone)):
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, entry)
+            if len(heap) > 2 * max(self._compacted.get(key, 0), 32):
+                self._compact(key)
+
+    def _compact(self, key):
+        """Rebuild a heap from its live entries, dropping stale and duplicate ones"""
+        heap = self._heaps[key]
+        heap[:] = {entry for entry in heap if entry[1] in self._free}
+        heapq.heapify(heap)
+        self._compacted[key] = len(heap)
+
+    @staticmethod
+    def _heap_key(level, zone):
+        if level is None:
+            return None
+        return (level, zone or None)
@@ -0,0 +1,125 @@
+"""Parking fares: one rate table, a scalar path for the routes and a vectorized
+batch path for re-pricing historical sessions.
+
+A stay is billed in whole hours, rounded down, with a minimum charge. Billed
+hour k starts k hours after entry and costs the night rate when it starts in the
+night window. Each 24-hour block from entry is capped at the daily cap. Stays
+shorter than the grace period are free.
+"""
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+
+DEFAULT_TARIFF = {
+    "hourly_rate": 50,
+    "min_hours": 1,
+    "grace_minutes": 0,
+    "daily_cap": None,
+    "night_rate": None,
+    "night_start": 22,   # hour of day the night rate starts
+    "night_end": 6,      # hour of day it ends (exclusive)
+}
+
+
+class Tariff:
+    def __init__(self, hourly_rate=50, min_hours=1, grace_minutes=0, daily_cap=None,
+                 night_rate=None, night_start=22, night_end=6):
+        self.hourly_rate = hourly_rate
+        self.min_hours = min_hours
+        self.grace_seconds = grace_minutes * 60
+        self.daily_cap = daily_cap
+        self.night_rate = hourly_rate if night_rate is None else night_rate
+
+        # night[h]: does an hour starting at h o'clock bill at the night rate?
+        self.night = [
+            night_rate is not None and (
+                night_start <= h < night_end if night_start <= night_end
+                else h >= night_start or h < night_end
+            )
+            for h in range(24)
+        ]
+        # nights_in[h][r]: night hours among the r consecutive hours starting at h o'clock
+        self.nights_in = [[sum(self.night[(h + k) % 24] for k in range(r)) for r in range(25)]
+                          for h in range(24)]
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**dict(DEFAULT_TARIFF, **(config or {})))
+
+    # ------------------ SCALAR ------------------ #
+    def billable_hours(self, seconds):
+        return max(self.min_hours, int(seconds // 3600))
+
+    def quote(self, entry_time, exit_time=None):
+        """(billed hours, amount) for a stay; an open stay is priced up to now."""
+        exit_time = exit_time or datetime.now()
+        if not entry_time:
+            hours = self.min_hours
+            return hours, self._block_cost(hours, self.nights_in[exit_time.hour][min(hours, 24)])
+        seconds = max(0, (exit_time - entry_time).total_seconds())
+        hours = self.billable_hours(seconds)
+        if self.grace_seconds and seconds < self.grace_seconds:
+            return hours, 0
+        days, rest = divmod(hours, 24)
+        nights = self.nights_in[entry_time.hour]
+        amount = days * self._block_cost(24, nights[24]) + self._block_cost(rest, nights[rest])
+        return hours, amount
+
+    def _block_cost(self, hours, night_hours):
+        cost = (hours - night_hours) * self.hourly_rate + night_hours * self.night_rate
+        return min(cost, self.daily_cap) if self.daily_cap is not None else cost
+
+    # ------------------ BATCH ------------------ #
+    def quote_batch(self, entry_ts, exit_ts):
+        """Vectorized quote() over epoch-second arrays. Returns (hours, amounts) arrays."""
+        entry_ts = np.asarray(entry_ts, dtype=np.int64)
+        seconds = np.maximum(np.asarray(exit_ts, dtype=np.int64) - entry_ts, 0)
+        hours = np.maximum(self.min_hours, seconds // 3600)
+        days, rest = np.divmod(hours, 24)
+
+        nights_in = np.asarray(self.nights_in, dtype=np.int64)
+        start_hour = (entry_ts % 86400) // 3600
+        full_day = self._block_cost_batch(24, nights_in[start_hour, 24])
+        partial = self._block_cost_batch(rest, nights_in[start_hour, rest])
+        amounts = days * full_day + partial
+        if self.grace_seconds:
+            amounts = np.where(seconds < self.grace_seconds, 0, amounts)
+        return hours, amounts
+
+    def _block_cost_batch(self, hours, night_hours):
+        cost = (hours - night_hours) * self.hourly_rate + night_hours * self.night_rate
+        return np.minimum(cost, self.daily_cap) if self.daily_cap is not None else cost
+
+
+def reprice_query(start_ts=None, end_ts=None, table="parkings"):
+    """SQL and args selecting paid sessions that ended in [start_ts, end_ts), for reprice()"""
+    sql = f"SELECT id, entry_ts, exit_ts, paid_amount FROM {table} WHERE paid=1 AND entry_ts IS NOT NULL AND exit_ts IS NOT NULL"
+    args = []
+    if start_ts is not None:
+        sql += " AND exit_ts >= ?"
+        args.append(start_ts)
+    if end_ts is not None:
+        sql += " AND exit_ts < ?"
+        args.append(end_ts)
+    return sql + " ORDER BY id", args
+
+
+def reprice(db, tariff, start_ts=None, end_ts=None, batch_size=200000, rows=None):
+    """Re-price paid sessions that ended in [start_ts, end_ts) under `tariff`.
+
+    Streams parkings in batches and prices each batch in one vectorized pass.
+    Yields (ids, charged, repriced) arrays per batch so callers can total or export them.
+    `rows` replaces the read from db, e.g. with archive.query() over reprice_query().
+    """
+    if rows is None:
+        rows = db.execute(*reprice_query(start_ts, end_ts))
+    rows = iter(rows)
+    while True:
+        batch = [tuple(row) for row in islice(rows, batch_size)]
+        if not batch:
+            return
+        ids, entries, exits, charged = np.array(batch, dtype=np.float64).T
+        _hours, amounts = tariff.quote_batch(entries, exits)
+        yield ids.astype(np.int64), charged, amounts
+
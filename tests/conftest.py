@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocation import SlotAllocator  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+def connect(path):
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    return db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fully migrated lot database with slots 1A..5B"""
+    path = str(tmp_path / "lot.db")
+    db = connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    migrate(db)
+    SlotAllocator().add_slots(db, [f"{i}{sub}" for i in range(1, 6) for sub in "AB"])
+    db.close()
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    conn = connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def pms(tmp_path, monkeypatch):
+    """The Flask app on a fresh, seeded database"""
+    import app as pms
+    monkeypatch.setattr(pms, "DATABASE", str(tmp_path / "pms.db"))
+    monkeypatch.setitem(pms.app.config, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(pms.hasher, "workers", 0)
+    with pms.app.app_context():
+        pms.init_db()
+        pms.seed_data()
+    return pms
+
+
+def login(client, user_id=1, role="admin", username="admin"):
+    with client.session_transaction() as sess:
+        sess.update(user_id=user_id, role=role, username=username)
+    return client
+
+
+@pytest.fixture
+def admin(pms):
+    return login(pms.app.test_client())
@@ -0,0 +1,81 @@
+import threading
+from datetime import datetime
+
+from allocation import SlotAllocator
+from conftest import connect
+
+NOW = datetime(2024, 5, 1, 8, 0)
+
+
+def test_claim_and_release_keep_the_cache_in_step(db):
+    allocator = SlotAllocator()
+    registry = allocator.refresh(db)
+    parking_id = allocator.claim(db, "1A", "KA01", None, NOW)
+    assert parking_id is not None
+    assert allocator.claim(db, "1A", "KA02", None, NOW) is None
+    assert registry.get("1A").parking_id == parking_id
+    # A second worker sees the claim through refresh()
+    other = SlotAllocator()
+    assert other.refresh(db).get("1A").vehicle == "KA01"
+    assert allocator.release(db, "1A", parking_id, 40, NOW)
+    assert not allocator.release(db, "1A", parking_id, 40, NOW)
+    assert other.refresh(db).get("1A").status == "free"
+
+
+def test_workers_racing_for_a_slot_open_one_session(db_path):
+    barrier = threading.Barrier(8)
+    won = []
+
+    def worker(n):
+        db = connect(db_path)
+        db.execute("PRAGMA busy_timeout=5000")
+        allocator = SlotAllocator()
+        allocator.refresh(db)
+        barrier.wait()
+        if allocator.claim(db, "1A", f"KA{n:02d}", None, NOW) is not None:
+            won.append(n)
+        db.close()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(won) == 1
+    db = connect(db_path)
+    assert db.execute("SELECT COUNT(*) FROM parkings WHERE slot='1A'").fetchone()[0] == 1
+    db.close()
+
+
+def test_recover_repairs_occupancy_from_open_sessions(db):
+    allocator = SlotAllocator()
+    paid = allocator.claim(db, "1A", "KA01", None, NOW)
+    allocator.release(db, "1A", paid, 40, NOW)
+    open_id = allocator.claim(db, "1B", "KA02", None, NOW)
+    with db:
+        # An old backup: 1B lost its occupancy, 1A still claims the paid session, 2A holds nothing
+        db.execute("UPDATE slots SET status='free', parking_id=NULL WHERE code='1B'")
+        db.execute("UPDATE slots SET status='occupied', parking_id=? WHERE code='1A'", (paid,))
+        db.execute("UPDATE slots SET status='occupied', parking_id=NULL WHERE code='2A'")
+    assert allocator.recover(db) > 0
+    rows = {r["code"]: (r["status"], r["parking_id"]) for r in db.execute("SELECT code, status, parking_id FROM slots")}
+    assert rows["1A"] == ("free", None)
+    assert rows["1B"] == ("occupied", open_id)
+    assert rows["2A"] == ("free", None)
+    registry = allocator.refresh(db)
+    assert registry.occupied_count == 1 and registry.get("1B").vehicle == "KA02"
+    assert allocator.recover(db) == 0
+
+
+def test_recover_leaves_cars_that_left_at_the_exit_gate_out(db):
+    import gate_events
+    at = datetime.now().replace(microsecond=0)
+    gate_events.ingest(db, SlotAllocator(), [
+        {"event_id": "in", "type": "entry", "plate": "KA01", "slot": "1A", "timestamp": at.isoformat()},
+        {"event_id": "out", "type": "exit", "plate": "KA01", "timestamp": at.isoformat()},
+    ])
+    # A restart: a new worker repairs occupancy before serving
+    allocator = SlotAllocator()
+    assert allocator.recover(db) == 0
+    assert allocator.refresh(db).get("1A").status == "free"
+    assert db.execute("SELECT paid, exit_ts IS NOT NULL FROM parkings").fetchone()[:] == (0, 1)
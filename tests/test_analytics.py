@@ -0,0 +1,102 @@
+import random
+from datetime import datetime
+
+import numpy as np
+
+import analytics
+from allocation import SlotAllocator
+from analytics import DAY
+from timeutil import from_epoch, to_epoch
+
+START = to_epoch(datetime(2024, 5, 1))
+
+
+def _brute_force(sessions, n_groups, start, end, width):
+    grid = np.zeros((n_groups, (end - start) // width))
+    for entry, exit_, group in sessions:
+        for b in range(grid.shape[1]):
+            lo, hi = start + b * width, start + (b + 1) * width
+            grid[group, b] += max(0, min(exit_, hi) - max(entry, lo))
+    return grid / width
+
+
+def test_sweep_matches_a_brute_force_count():
+    rng = random.Random(11)
+    sessions = []
+    for _ in range(300):
+        entry = START + rng.randrange(-DAY, 3 * DAY)
+        sessions.append((entry, entry + rng.randrange(0, 2 * DAY), rng.randrange(4)))
+    entry, exit_, group = (np.array(col, dtype=np.int64) for col in zip(*sessions))
+    for width in analytics.WIDTHS:
+        got = analytics.occupancy(entry, exit_, group, 4, START, START + 2 * DAY, width)
+        assert np.allclose(got, _brute_force(sessions, 4, START, START + 2 * DAY, width), atol=1e-4)
+
+
+def _insert(db, rows):
+    db.executemany("INSERT INTO parkings (vehicle_number, slot, entry_time, entry_ts, exit_ts) "
+                   "VALUES ('KA01', ?, '', ?, ?)", rows)
+    db.commit()
+
+
+def test_sessions_skip_those_that_ended_before_the_range(db):
+    _insert(db, [("1A", START - DAY, START - 1), ("1A", START - 60, START + 60),
+                 ("1B", START + 10, None), ("2A", START + DAY, START + DAY + 5)])
+    entry, exit_, closed, slot = analytics.sessions(db, START, START + DAY, now_ts=START + 500)
+    assert sorted(zip(entry.tolist(), exit_.tolist(), closed.tolist(), slot.tolist())) == [
+        (START - 60, START + 60, True, "1A"), (START + 10, START + 500, False, "1B")]
+    plan = " ".join(row[3] for row in db.execute(
+        "EXPLAIN QUERY PLAN " + analytics._SESSIONS_SQL.format(table="parkings"), (0, 0, 0, 0)))
+    assert "idx_parkings_exit_ts" in plan and "idx_parkings_entry_ts" not in plan
+
+
+def test_finished_days_are_cached(db):
+    _insert(db, [("1A", START + 3600, START + 7200), ("1B", START + DAY + 3600, None)])
+    cache = analytics.OccupancyCache()
+    now_ts = START + DAY + 7200
+    loads = []
+
+    def load(start, end):
+        loads.append((start, end))
+        return analytics.sessions(db, start, end, now_ts)
+
+    days = cache.days(load, START, START + DAY, 3600, now_ts)
+    labels, grid, _count, _seconds = days[START]
+    assert grid[labels.index("1A")].tolist()[:3] == [0, 1, 0]  # occupied 01:00-02:00
+    cache.days(load, START, START + DAY, 3600, now_ts)
+    # The first day is over and cached; today is recomputed
+    assert loads == [(START, START + 2 * DAY), (START + DAY, START + 2 * DAY)]
+    assert (cache.hits, cache.misses) == (1, 3)
+    report = analytics.report(days, 3600, by="slot")
+    assert report["dwell"]["1A"] == {"sessions": 1, "avg_minutes": 60.0}
+    assert len(report["series"]["1B"]) == 48
+
+
+def test_backdated_writes_drop_their_days_from_every_cache(db):
+    now_ts = START + 3 * DAY
+    caches = [analytics.OccupancyCache(), analytics.OccupancyCache()]  # e.g. two workers
+
+    def load(start, end):
+        return analytics.sessions(db, start, end, now_ts)
+
+    for cache in caches:
+        cache.sync(db)
+        cache.days(load, START, START + DAY, 3600, now_ts)
+    # A late gate event: a car parked in 1A on the second day, 01:00-02:00
+    allocator = SlotAllocator()
+    parking_id = allocator.claim(db, "1A", "KA01", None, from_epoch(START + DAY + 3600))
+    allocator.release(db, "1A", parking_id, 50, from_epoch(START + DAY + 7200))
+
+    for cache in caches:
+        cache.sync(db)
+        days = cache.days(load, START, START + DAY, 3600, now_ts)
+        assert (cache.hits, cache.misses) == (1, 3)  # the first day is still cached
+        labels, grid, _count, _seconds = days[START + DAY]
+        assert grid[labels.index("1A")].tolist()[:3] == [0, 1, 0]
+
+
+def test_occupancy_api(pms, admin):
+    body = admin.get("/api/analytics/occupancy?by=level&width=30").get_json()
+    assert body["success"] and body["width_minutes"] == 30
+    assert len(body["heatmap"]) == 7 and len(body["heatmap"][0]) == 24
+    assert admin.get("/api/analytics/occupancy?width=7").status_code == 400
+    assert admin.get("/api/analytics/occupancy?from=2024-05-02&to=2024-05-01").status_code == 400
@@ -0,0 +1,53 @@
+import os
+from datetime import datetime
+
+import archive
+import history
+from timeutil import to_epoch
+
+MAY, JUNE, JULY = (to_epoch(datetime(2024, m, 10)) for m in (5, 6, 7))
+
+
+def _insert(db):
+    db.executemany(
+        "INSERT INTO parkings (vehicle_number, slot, entry_time, entry_ts, exit_ts, paid, paid_amount) "
+        "VALUES (?, '1A', '', ?, ?, ?, 50)",
+        [("KA01", MAY, MAY + 3600, 1), ("KA02", MAY + 7200, MAY + 9000, 1), ("KA03", JUNE, JUNE + 3600, 1),
+         ("KA04", JUNE, JUNE + 3600, 0), ("KA05", JULY, JULY + 3600, 1)])
+    db.commit()
+
+
+def test_paid_sessions_move_into_monthly_partitions(db, tmp_path):
+    _insert(db)
+    archive_dir = str(tmp_path / "archive")
+    assert archive.archive(db, archive_dir, JULY) == {"2024-05": 2, "2024-06": 1}
+    assert [r[0] for r in db.execute("SELECT vehicle_number FROM parkings ORDER BY id")] == ["KA04", "KA05"]
+    assert [os.path.basename(p) for p in archive.partitions(archive_dir)] == ["parkings-2024-05.db", "parkings-2024-06.db"]
+    assert archive.partitions(archive_dir, JUNE, JULY) == [archive.partition_path(archive_dir, "2024-06")]
+    assert archive.reaches(db, None) and archive.reaches(db, MAY) and not archive.reaches(db, JULY)
+    # Nothing left to move
+    assert archive.archive(db, archive_dir, JULY) == {}
+
+
+def test_query_reads_hot_and_archived_sessions_in_order(db_path, db, tmp_path):
+    _insert(db)
+    archive_dir = str(tmp_path / "archive")
+    archive.archive(db, archive_dir, JULY)
+    rows = archive.query(db_path, archive_dir, "SELECT id, vehicle_number FROM all_parkings ORDER BY id")
+    assert [r["vehicle_number"] for r in rows] == ["KA01", "KA02", "KA03", "KA04", "KA05"]
+    june = archive.query(db_path, archive_dir, "SELECT id FROM all_parkings WHERE entry_ts >= ? ORDER BY id",
+                         (JUNE,), date_from=JUNE)
+    assert [r["id"] for r in june] == [3, 4, 5]
+    rows, before = history.page(db, limit=2, archived=(db_path, archive_dir))
+    assert [r["id"] for r in rows] == [5, 4] and before == 4
+    rows, _ = history.page(db, limit=2, before=before, archived=(db_path, archive_dir))
+    assert [r["id"] for r in rows] == [3, 2]
+
+
+def test_spreads_partitions_over_several_connections(db_path, db, tmp_path, monkeypatch):
+    _insert(db)
+    archive_dir = str(tmp_path / "archive")
+    archive.archive(db, archive_dir, JULY)
+    monkeypatch.setattr(archive, "MAX_ATTACHED", 1)
+    rows = archive.query(db_path, archive_dir, "SELECT id FROM all_parkings ORDER BY id DESC", descending=True)
+    assert [r["id"] for r in rows] == [5, 4, 3, 2, 1]
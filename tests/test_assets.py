@@ -0,0 +1,24 @@
+import os
+
+import assets
+
+
+def test_vendored_files_are_committed_and_match_their_pins():
+    static = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+    for filename, (_url, pin) in assets.VENDOR.items():
+        with open(os.path.join(static, filename), "rb") as f:
+            assert assets.integrity(f.read()) == pin
+
+
+def test_pages_load_bootstrap_from_the_app(pms):
+    page = pms.app.test_client().get("/login").get_data(as_text=True)
+    assert "cdn.jsdelivr.net" not in page
+    assert "/assets/vendor/bootstrap." in page
+
+
+def test_assets_are_served_precompressed(pms):
+    with pms.app.test_request_context():
+        url = pms.asset_url("vendor/bootstrap.min.css")
+    response = pms.app.test_client().get(url, headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["Content-Encoding"] == assets.AVAILABLE[0]
+    assert "immutable" in response.headers["Cache-Control"]
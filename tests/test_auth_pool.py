@@ -0,0 +1,47 @@
+import os
+import signal
+
+import pytest
+from werkzeug.security import check_password_hash
+
+from auth_pool import HashingPool, TokenBucketLimiter
+
+
+@pytest.fixture
+def pool():
+    pool = HashingPool(workers=1, timeout=30)
+    yield pool
+    pool.shutdown()
+
+
+def test_hash_and_verify_on_the_pool(pool):
+    pw_hash = pool.hash("secret")
+    assert check_password_hash(pw_hash, "secret")
+    assert pool.verify(pw_hash, "secret")
+    assert not pool.verify(pw_hash, "wrong")
+
+
+def test_pool_is_rebuilt_after_its_worker_dies(pool):
+    pw_hash = pool.hash("secret")
+    broken = pool._executor
+    for pid in list(broken._processes):
+        os.kill(pid, signal.SIGKILL)
+    assert pool.verify(pw_hash, "secret")
+    assert pool._executor is not broken
+
+
+def test_falls_back_to_hashing_inline_when_the_pool_cannot_start(pool, monkeypatch):
+    def fail(*_args):
+        raise OSError("cannot spawn")
+    monkeypatch.setattr(pool, "_call", fail)
+    assert pool.verify(pool.hash("secret"), "secret")
+
+
+def test_token_bucket():
+    limiter = TokenBucketLimiter(rate=0.001, burst=2)
+    assert limiter.allow("ip")
+    assert limiter.allow("ip")
+    assert not limiter.allow("ip")
+    assert limiter.allow("other")
+    # Every key must have a token
+    assert not limiter.allow("other", "ip")
@@ -0,0 +1,59 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+from allocation import SlotAllocator
+from events import ChangeFeed
+from conftest import connect
+
+
+def test_publish_fans_out_and_overflow_turns_into_resync():
+    feed = ChangeFeed(max_queue=2)
+    fast, slow = feed.subscribe(), feed.subscribe()
+    feed.publish("slot", {"code": "1A"})
+    assert fast.queue.get_nowait() == ("slot", {"code": "1A"})
+    for n in range(3):
+        feed.publish("slot", {"n": n})
+    assert slow.overflowed
+    stream = slow.stream(heartbeat=0.01)
+    assert next(stream).startswith("retry:")
+    assert next(stream) == "event: resync\ndata: {}\n\n"
+    stream.close()
+    assert feed.subscriber_count == 1
+
+
+def test_watcher_publishes_refresh_for_commits_from_another_connection(db_path):
+    feed = ChangeFeed(path=db_path, interval=0.02)
+    sub = feed.subscribe()
+    time.sleep(0.1)  # let the watcher read the starting state
+    other = connect(db_path)
+    try:
+        # A claim in another worker: bumps slots_version on its own connection
+        SlotAllocator().claim(other, "1A", "KA01", None, datetime.now())
+        assert sub.queue.get(timeout=2) == ("refresh", {})
+        # Commits that leave the dashboard state alone publish nothing
+        with other:
+            other.execute("INSERT INTO gate_commands (gate, command, payload, created_ts) VALUES ('entry', 'x', '{}', 0)")
+        try:
+            event = sub.queue.get(timeout=0.2)
+        except queue.Empty:
+            event = None
+        assert event is None
+    finally:
+        other.close()
+        feed.unsubscribe(sub)
+
+
+def test_watcher_stops_with_the_last_subscriber(db_path):
+    feed = ChangeFeed(path=db_path, interval=0.02)
+    sub = feed.subscribe()
+    watcher = feed._watcher
+    assert isinstance(watcher, threading.Thread) and watcher.is_alive()
+    feed.unsubscribe(sub)
+    watcher.join(2)
+    assert not watcher.is_alive()
+    # A new subscriber starts a new watcher
+    sub = feed.subscribe()
+    assert feed._watcher is not watcher and feed._watcher.is_alive()
+    feed.unsubscribe(sub)
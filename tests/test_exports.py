@@ -0,0 +1,45 @@
+import csv
+import io
+
+import exports
+from conftest import login
+
+SESSIONS = [
+    ("KA01", "1A", "2024-05-01 08:00:00", 1714550400),
+    ("KA02", "1B", "2024-05-02 09:00:00", 1714640400),
+    ("KA03", "1A", "2024-05-03 10:00:00", 1714730400),
+]
+
+
+def _insert(db):
+    db.executemany("INSERT INTO parkings (vehicle_number, slot, entry_time, entry_ts, user_id, paid, paid_amount) "
+                   "VALUES (?, ?, ?, ?, 1, 1, 50)", SESSIONS)
+    db.commit()
+
+
+def test_stream_csv_writes_one_chunk_per_batch(db_path, db):
+    db.executemany("INSERT INTO parkings (vehicle_number, slot, entry_time, entry_ts) VALUES (?, '1A', '', ?)",
+                   [(f"KA{n:02d}", n) for n in range(12)])
+    db.commit()
+    sql, args = exports.parkings_query(slot="1A")
+    chunks = [chunk for chunk in exports.stream_csv(db_path, sql, args, batch_size=5) if chunk]
+    assert len(chunks) == 4  # header, then 5 + 5 + 2 rows
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == exports.COLUMNS
+    assert [row[1] for row in rows[1:]] == [f"KA{n:02d}" for n in range(12)]
+
+
+def test_export_route_filters_and_joins_users(pms, admin):
+    with pms.app.app_context():
+        _insert(pms.get_db())
+    response = admin.get("/admin/export.csv?slot=1A&from=2024-05-02")
+    assert response.mimetype == "text/csv"
+    assert response.is_streamed
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(r["vehicle_number"], r["username"]) for r in rows] == [("KA03", "admin")]
+    assert admin.get("/admin/export.csv?from=May").status_code == 400
+
+
+def test_export_is_for_admins_only(pms):
+    client = login(pms.app.test_client(), user_id=2, role="customer", username="someone")
+    assert client.get("/admin/export.csv").status_code == 302
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def lots(pms, tmp_path, monkeypatch):
+    monkeypatch.setitem(pms.app.config, "FACILITIES", {
+        "main": {"name": "Main", "database": pms.DATABASE},
+        "north": {"name": "North", "database": str(tmp_path / "north.db")},
+    })
+    for _facility in pms.each_facility():
+        pms.init_db()
+        pms.seed_data()
+    return pms
+
+
+def test_each_lot_keeps_its_own_sessions(lots, admin):
+    admin.post("/park", data={"vehicle_number": "KA01", "slot_code": "1A", "entry_time": "2024-05-01T08:00"})
+    admin.post("/facility", data={"facility": "north"})
+    admin.post("/park", data={"vehicle_number": "KA02", "slot_code": "1A", "entry_time": "2024-05-01T08:00"})
+    admin.post("/park", data={"vehicle_number": "KA03", "slot_code": "1B", "entry_time": "2024-05-01T08:00"})
+    body = admin.get("/api/facilities").get_json()
+    assert body["complete"]
+    assert {lot["key"]: lot["occupied"] for lot in body["facilities"]} == {"main": 1, "north": 2}
+    assert body["totals"]["occupied"] == 3 and body["totals"]["available"] == 37
+    # Accounts stay in the home database
+    for facility in lots.each_facility():
+        users = lots.get_db().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        assert users == (1 if facility.key == "main" else 0)
+
+
+def test_a_slow_lot_is_reported_without_holding_up_the_others(lots):
+    router = lots.facilities()
+
+    def summary(facility, db):
+        if facility.key == "north":
+            time.sleep(0.5)
+        return db.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+
+    results, errors = router.fan_out(summary, timeout=0.1)
+    assert results == {"main": 20}
+    assert errors == {"north": "timed out after 0.1s"}
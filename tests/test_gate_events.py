@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import gate_events
+from allocation import SlotAllocator
+from reservations import ReservationBook
+from timeutil import to_epoch
+
+ENTRY = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+
+
+def _event(event_id, kind, plate, slot=None, at=ENTRY):
+    return {"event_id": event_id, "type": kind, "plate": plate, "slot": slot, "timestamp": at.isoformat()}
+
+
+def test_entries_and_exits_in_one_batch(db):
+    allocator = SlotAllocator()
+    results = gate_events.ingest(db, allocator, [
+        _event("e1", "entry", "ka01"),
+        _event("e2", "entry", "KA02", slot="2A"),
+        _event("e3", "exit", "KA01", at=ENTRY + timedelta(minutes=30)),
+    ])
+    assert [r["status"] for r in results] == ["accepted"] * 3
+    assert results[0]["slot"] == "1A" and results[2]["slot"] == "1A"
+    registry = allocator.refresh(db)
+    assert registry.get("1A").status == "free"
+    assert registry.get("2A").vehicle == "KA02"
+    exited = db.execute("SELECT exit_ts, paid FROM parkings WHERE id=?", (results[0]["parking_id"],)).fetchone()
+    assert tuple(exited) == (to_epoch(ENTRY + timedelta(minutes=30)), 0)
+
+
+def test_retried_events_return_the_first_result(db):
+    allocator = SlotAllocator()
+    first = gate_events.ingest(db, allocator, [_event("e1", "entry", "KA01")])
+    again = gate_events.ingest(db, allocator, [_event("e1", "entry", "KA01")])
+    assert again[0]["status"] == "duplicate"
+    assert again[0]["parking_id"] == first[0]["parking_id"]
+    assert db.execute("SELECT COUNT(*) FROM parkings").fetchone()[0] == 1
+
+
+def test_invalid_and_conflicting_events_are_rejected(db):
+    allocator = SlotAllocator()
+    results = gate_events.ingest(db, allocator, [
+        {"event_id": "bad", "type": "wave", "plate": "KA01", "timestamp": 0},
+        _event("e1", "entry", "KA01", slot="1A"),
+        _event("e1", "entry", "KA09"),
+        _event("e2", "entry", "KA02", slot="1A"),
+        _event("e3", "entry", "KA01"),
+        _event("e4", "exit", "KA02", slot="1A"),
+        _event("e5", "exit", "KA03"),
+        _event("e6", "entry", "KA04", slot="9Z"),
+    ])
+    assert [r["status"] for r in results] == ["rejected", "accepted"] + ["rejected"] * 6
+    assert results[3]["error"] == "slot 1A is occupied"
+    assert results[4]["error"] == "vehicle already parked in slot 1A"
+    assert results[5]["error"] == "slot 1A holds another vehicle"
+    assert results[6]["error"] == "no open session for this vehicle"
+    assert allocator.refresh(db).get("1A").vehicle == "KA01"
+
+
+def test_entries_avoid_slots_reserved_for_someone_else(db):
+    allocator, book = SlotAllocator(), ReservationBook()
+    now = to_epoch(datetime.now())
+    start = to_epoch(ENTRY)
+    book.reserve(db, ["1A"], "KA09", None, start, start + 7200, now)
+    results = gate_events.ingest(db, allocator, [
+        _event("e1", "entry", "KA01"),
+        _event("e2", "entry", "KA02", slot="1A"),
+        _event("e3", "entry", "KA09", slot="1A"),
+    ], reservations=book)
+    assert results[0]["slot"] == "1B"
+    assert results[1]["error"] == "slot 1A is reserved for that time"
+    assert results[2]["status"] == "accepted"
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import gate_commands
+from conftest import connect
+from gateway import CommandBus, Gateway
+
+
+def _enqueue(path, *commands):
+    db = connect(path)
+    with db:
+        gate_commands.enqueue(db, commands)
+    db.close()
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_one_commit_wakes_every_waiting_controller(db_path):
+    bus = CommandBus("main", db_path)
+
+    async def scenario():
+        follower = asyncio.create_task(bus.run(0.01))
+        await asyncio.sleep(0.05)
+        waiters = [asyncio.create_task(bus.wait(bus.last_id, "entry", 5)) for _ in range(500)]
+        exit_waiter = asyncio.create_task(bus.wait(bus.last_id, "exit", 0.3))
+        await asyncio.sleep(0.05)
+        _enqueue(db_path, gate_commands.command("entry", gate_commands.OPEN_BARRIER, vehicle="KA01"))
+        results = await asyncio.gather(*waiters)
+        exit_result = await exit_waiter
+        follower.cancel()
+        return results, exit_result
+
+    results, (exit_commands, missed) = _run(scenario())
+    assert all(len(commands) == 1 and not missed for commands, missed in results)
+    assert results[0][0][0]["vehicle"] == "KA01"
+    # Commands for another gate don't wake this one; it times out with nothing
+    assert exit_commands == [] and not missed
+
+
+def test_only_commands_after_the_cursor_are_returned(db_path):
+    bus = CommandBus("main", db_path, backlog=3)
+    bus.last_id = bus._floor = 0
+    bus._changed = asyncio.Event()
+    bus._add([{"id": n, "gate": "entry"} for n in range(1, 6)])
+    assert [c["id"] for c in bus.after(3)[0]] == [4, 5]
+    commands, missed = bus.after(1)
+    assert missed and [c["id"] for c in commands] == [3, 4, 5]
+
+
+async def _request(app, path, headers=()):
+    scope = {"type": "http", "method": "GET", "path": path.split("?")[0],
+             "query_string": path.partition("?")[2].encode(), "headers": list(headers)}
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return sent[0]["status"], json.loads(body)
+
+
+def test_endpoints_need_the_api_key(db_path):
+    app = Gateway({"main": db_path}, "k3y")
+    auth = [(b"authorization", b"Bearer k3y")]
+
+    async def scenario():
+        return [
+            await _request(app, "/gate/health"),
+            await _request(app, "/gate/commands?wait=0", [(b"authorization", b"Bearer nope")]),
+            await _request(app, "/gate/health", auth),
+            await _request(app, "/gate/commands?wait=0", auth),
+            await _request(app, "/gate/commands?facility=nowhere", auth),
+        ]
+
+    (s1, _), (s2, _), (s3, health), (s4, body), (s5, _) = _run(scenario())
+    assert (s1, s2, s3, s4, s5) == (401, 401, 200, 200, 400)
+    assert health == {"connections": 0, "facilities": {"main": {"last_id": 0}}}
+    assert body == {"commands": [], "cursor": 0}
+
+
+def test_gateway_without_a_key_refuses_everyone(db_path):
+    app = Gateway({"main": db_path}, None)
+    status, _ = _run(_request(app, "/gate/health", [(b"authorization", b"Bearer ")]))
+    assert status == 401
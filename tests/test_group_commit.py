@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from group_commit import GroupCommitWriter, WriterClosed, WriteTimeout
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "gc.db")
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE t (n INTEGER UNIQUE)")
+    db.commit()
+    db.close()
+    return path
+
+
+def _connect(path, busy_timeout=5000):
+    def connect():
+        return sqlite3.connect(path, timeout=busy_timeout / 1000, check_same_thread=False)
+    return connect
+
+
+def _insert(db, n):
+    return db.execute("INSERT INTO t (n) VALUES (?)", (n,)).lastrowid
+
+
+def test_concurrent_writes_are_grouped_and_committed(path):
+    writer = GroupCommitWriter(_connect(path), max_wait=0.01)
+    try:
+        threads = [threading.Thread(target=writer.run, args=(_insert, n)) for n in range(200)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        writer.shutdown()
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 200
+    assert writer.operations == 200
+    assert writer.batches < 200
+
+
+def test_a_failing_operation_is_rolled_back_alone(path):
+    writer = GroupCommitWriter(_connect(path), max_wait=0.05)
+    try:
+        futures = [writer.submit(_insert, 1), writer.submit(_insert, 1), writer.submit(_insert, 2)]
+        assert futures[0].result(5) is not None
+        with pytest.raises(sqlite3.IntegrityError):
+            futures[1].result(5)
+        assert futures[2].result(5) is not None
+    finally:
+        writer.shutdown()
+    db = sqlite3.connect(path)
+    assert [r[0] for r in db.execute("SELECT n FROM t ORDER BY n")] == [1, 2]
+
+
+def test_begin_failure_fails_every_future_in_the_group(path):
+    blocker = sqlite3.connect(path)
+    blocker.execute("BEGIN IMMEDIATE")
+    writer = GroupCommitWriter(_connect(path, busy_timeout=50), max_wait=0.05)
+    try:
+        futures = [writer.submit(_insert, n) for n in range(3)]
+        for future in futures:
+            with pytest.raises(sqlite3.OperationalError):
+                future.result(5)
+        blocker.rollback()
+        # The writer keeps going once the lock is released
+        assert writer.run(_insert, 10, timeout=5) is not None
+    finally:
+        blocker.close()
+        writer.shutdown()
+
+
+def test_run_times_out_while_the_database_is_locked(path):
+    blocker = sqlite3.connect(path)
+    blocker.execute("BEGIN IMMEDIATE")
+    writer = GroupCommitWriter(_connect(path), max_wait=0.001)
+    try:
+        with pytest.raises(WriteTimeout):
+            writer.run(_insert, 1, timeout=0.2)
+        blocker.rollback()
+        # The timed-out write was cancelled, so a retry doesn't write it twice
+        assert writer.run(_insert, 2, timeout=5) is not None
+    finally:
+        blocker.close()
+        writer.shutdown()
+    db = sqlite3.connect(path)
+    assert [r[0] for r in db.execute("SELECT n FROM t")] == [2]
+
+
+def test_run_waits_for_an_operation_already_running(path):
+    def slow_insert(db, n):
+        time.sleep(0.3)
+        return _insert(db, n)
+
+    writer = GroupCommitWriter(_connect(path), max_wait=0.001)
+    try:
+        assert writer.run(slow_insert, 1, timeout=0.1) is not None
+    finally:
+        writer.shutdown()
+
+
+def test_shutdown_commits_queued_work_and_refuses_more(path):
+    writer = GroupCommitWriter(_connect(path), max_wait=0.05)
+    futures = [writer.submit(_insert, n) for n in range(10)]
+    writer.shutdown()
+    assert all(f.done() and f.exception() is None for f in futures)
+    with pytest.raises(WriterClosed):
+        writer.submit(_insert, 99)
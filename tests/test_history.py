@@ -0,0 +1,47 @@
+import history
+from conftest import login
+
+
+def _insert(db, n, user_id=1):
+    db.executemany("INSERT INTO parkings (vehicle_number, slot, entry_time, entry_ts, user_id, paid) "
+                   "VALUES (?, ?, '', ?, ?, ?)",
+                   [(f"KA{i:02d}", "1A" if i % 2 else "1B", 1714550400 + i * 3600, user_id, i % 3 == 0)
+                    for i in range(n)])
+    db.commit()
+
+
+def test_pages_walk_the_history_newest_first(db):
+    _insert(db, 23)
+    seen, before = [], None
+    while True:
+        rows, before = history.page(db, before=before, limit=10)
+        seen.extend(row["id"] for row in rows)
+        if before is None:
+            break
+    assert seen == list(range(23, 0, -1))
+
+
+def test_filters_apply_to_every_page(db):
+    _insert(db, 40)
+    rows, before = history.page(db, slot="1A", paid=0, limit=5)
+    assert len(rows) == 5 and before == rows[-1]["id"]
+    more, _ = history.page(db, slot="1A", paid=0, before=before, limit=5)
+    assert all(r["slot"] == "1A" and r["paid"] == 0 for r in rows + more)
+    assert more[0]["id"] < before
+    rows, before = history.page(db, plate="KA07", date_from=1714550400, date_to=1714550400 + 86400)
+    assert [r["vehicle_number"] for r in rows] == ["KA07"] and before is None
+    assert len(history.page(db, limit=0)[0]) == 1
+    assert len(history.page(db, limit=10 ** 6)[0]) == 40
+
+
+def test_customers_page_through_their_own_sessions(pms):
+    with pms.app.app_context():
+        db = pms.get_db()
+        _insert(db, 5, user_id=1)
+        _insert(db, 30, user_id=2)
+    client = login(pms.app.test_client(), user_id=2, role="customer", username="someone")
+    body = client.get("/api/history?limit=20&user_id=1").get_json()
+    assert len(body["sessions"]) == 20 and {s["user_id"] for s in body["sessions"]} == {2}
+    rest = client.get(body["next"]).get_json()
+    assert len(rest["sessions"]) == 10 and rest["next"] is None
+    assert client.get("/history").status_code == 200
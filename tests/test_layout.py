@@ -0,0 +1,40 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import layout
+from allocation import SlotAllocator
+
+
+def test_json_levels_and_csv_layouts(tmp_path):
+    levels = tmp_path / "garage.json"
+    levels.write_text(json.dumps({"levels": [
+        {"level": 1, "zones": [{"zone": "a", "slots": 2}, {"zone": "B", "codes": ["1-9B"]}]},
+        {"level": 2, "zones": [{"zone": "A", "slots": 1}]},
+    ]}))
+    assert layout.load(str(levels)) == [("1-1A", 1, "A"), ("1-2A", 1, "A"), ("1-9B", 1, "B"), ("2-1A", 2, "A")]
+    flat = tmp_path / "garage.csv"
+    flat.write_text("code,level,zone\nP1,3,\n4C,,\n")
+    assert layout.load(str(flat)) == [("P1", 3, ""), ("4C", 1, "C")]
+
+
+def test_bad_layouts_are_refused(tmp_path):
+    dup = tmp_path / "dup.json"
+    dup.write_text(json.dumps([{"code": "1A"}, {"code": "1A"}]))
+    with pytest.raises(layout.LayoutError):
+        layout.load(str(dup))
+    text = tmp_path / "garage.txt"
+    text.write_text("1A\n")
+    with pytest.raises(layout.LayoutError):
+        layout.load(str(text))
+
+
+def test_import_adds_new_slots_and_relevels_existing_ones(db):
+    allocator = SlotAllocator()
+    parking_id = allocator.claim(db, "1A", "KA01", None, datetime(2024, 5, 1, 8))
+    assert allocator.import_layout(db, [("1A", 2, "Z"), ("2-1A", 2, "A")]) == 1
+    registry = allocator.refresh(db)
+    assert (registry.get("1A").level, registry.get("1A").zone) == (2, "Z")
+    assert registry.get("1A").parking_id == parking_id
+    assert registry.nearest_free(level=2).code == "2-1A"
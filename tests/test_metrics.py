@@ -0,0 +1,32 @@
+import re
+
+import db_pool
+from tests.conftest import login
+
+
+def test_statements_outside_query_db_are_counted(admin):
+    assert admin.get("/dashboard").status_code == 200
+    body = admin.get("/metrics").get_data(as_text=True)
+    # The allocator reads the version row with db.execute, not through query_db
+    assert re.search(r'pms_sql_queries_total\{query="SELECT value FROM app_state[^"]*"\} [1-9]', body)
+    assert re.search(r'pms_request_sql_queries_count\{endpoint="dashboard"\} [1-9]', body)
+
+
+def test_timed_connection_reports_every_statement(tmp_path, monkeypatch):
+    seen = []
+    monkeypatch.setattr(db_pool, "_observer", lambda sql, seconds: seen.append(sql))
+    conn = db_pool.ConnectionPool(str(tmp_path / "t.db")).connect()
+    seen.clear()
+    conn.execute("CREATE TABLE t (x)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,)])
+    conn.cursor().execute("SELECT x FROM t").fetchall()
+    assert seen == ["CREATE TABLE t (x)", "INSERT INTO t VALUES (?)", "SELECT x FROM t"]
+
+
+def test_metrics_need_an_admin_or_the_token(pms, monkeypatch):
+    client = pms.app.test_client()
+    assert client.get("/metrics").status_code == 401
+    login(client, user_id=2, role="customer", username="someone")
+    assert client.get("/metrics").status_code == 401
+    monkeypatch.setitem(pms.app.config, "METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
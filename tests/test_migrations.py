@@ -0,0 +1,75 @@
+import importlib
+import sys
+import types
+from datetime import datetime
+
+import pytest
+
+import migrations
+from allocation import SlotAllocator
+from migrations import available, current_version, migrate
+from conftest import connect
+from timeutil import to_epoch
+
+
+def test_fresh_database_reaches_the_latest_version(tmp_path):
+    db = connect(str(tmp_path / "fresh.db"))
+    applied = migrate(db)
+    assert applied == [name for _version, name in available()]
+    assert current_version(db) == available()[-1][0]
+    assert migrate(db) == []
+    indexes = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {"idx_parkings_slot_id", "idx_parkings_user_entry"} <= indexes
+
+
+def test_epoch_columns_are_backfilled_from_text_times(tmp_path):
+    db = connect(str(tmp_path / "old.db"))
+    importlib.import_module("migrations.0001_initial").upgrade(db)
+    db.execute("PRAGMA user_version = 1")
+    db.execute("INSERT INTO parkings (vehicle_number, slot, entry_time, exit_time, paid, paid_amount) "
+               "VALUES ('KA01', '1A', '2024-05-01 08:00:00', '2024-05-01 10:30:00', 1, 100)")
+    db.commit()
+    migrate(db)
+    row = db.execute("SELECT entry_ts, exit_ts FROM parkings").fetchone()
+    assert tuple(row) == (to_epoch(datetime(2024, 5, 1, 8)), to_epoch(datetime(2024, 5, 1, 10, 30)))
+
+
+def test_a_failing_migration_leaves_the_previous_version(tmp_path, monkeypatch):
+    db = connect(str(tmp_path / "lot.db"))
+    migrate(db)
+    latest = current_version(db)
+
+    def upgrade(db):
+        db.execute("CREATE TABLE half_done (n INTEGER)")
+        raise RuntimeError("boom")
+
+    broken = types.ModuleType("migrations.9999_broken")
+    broken.upgrade = upgrade
+    monkeypatch.setitem(sys.modules, "migrations.9999_broken", broken)
+    everything = available()
+    monkeypatch.setattr(migrations, "available", lambda: everything + [(9999, "9999_broken")])
+    with pytest.raises(RuntimeError):
+        migrate(db)
+    assert current_version(db) == latest
+    assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name='half_done'").fetchone()[0] == 0
+
+
+def test_upgrade_occupies_slots_of_cars_parked_before_0002(tmp_path):
+    db = connect(str(tmp_path / "old.db"))
+    importlib.import_module("migrations.0001_initial").upgrade(db)
+    db.execute("PRAGMA user_version = 1")
+    db.executemany("INSERT INTO slots (code) VALUES (?)", [("1A",), ("1B",), ("2A",)])
+    db.executemany(
+        "INSERT INTO parkings (vehicle_number, slot, entry_time, exit_time, paid, paid_amount) VALUES (?, ?, ?, ?, ?, ?)",
+        [("KA01", "1A", "2024-05-01 08:00:00", None, 0, 0),
+         ("KA02", "1B", "2024-05-01 08:00:00", "2024-05-01 09:00:00", 1, 40),
+         ("KA03", "2A", "2024-05-01 07:00:00", None, 0, 0),
+         ("KA04", "2A", "2024-05-01 08:30:00", "2024-05-01 12:00:00", 0, 0)],
+    )
+    db.commit()
+    migrate(db)
+    rows = {r["code"]: (r["status"], r["parking_id"]) for r in db.execute("SELECT code, status, parking_id FROM slots")}
+    assert rows == {"1A": ("occupied", 1), "1B": ("free", None), "2A": ("occupied", 4)}
+    registry = SlotAllocator().refresh(db)
+    assert registry.get("2A").vehicle == "KA04"
+    assert registry.occupied_count == 2
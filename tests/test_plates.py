@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import plates
+from allocation import SlotAllocator
+from slot_registry import SlotRegistry
+
+ENTRY = datetime(2024, 5, 1, 8)
+
+
+def test_index_follows_the_registry_change_log():
+    registry = SlotRegistry.from_codes(["1A", "1B", "2A"])
+    index = plates.PlateIndex()
+    registry.occupy("1A", vehicle="GJ-01-AB-1234")
+    registry.occupy("1B", vehicle="gj 01 ab 9")
+    index.sync(registry)
+    assert index.search("gj01ab") == ["1A", "1B"]
+    assert index.search("GJ 01 AB 9") == ["1B"]
+    assert index.search("gj", limit=1) == ["1A"]
+    registry.release("1A")
+    registry.occupy("2A", vehicle="KA01")
+    index.sync(registry)
+    assert index.search("GJ") == ["1B"] and index.search("ka0") == ["2A"]
+    assert len(index) == 2
+    assert index.search("") == []
+
+
+def test_history_returns_the_latest_visit_per_plate(db):
+    allocator = SlotAllocator()
+    for code, vehicle in [("1A", "GJ-01-AB-1234"), ("1B", "KA01"), ("2A", "gj01ab1234")]:
+        parking_id = allocator.claim(db, code, vehicle, None, ENTRY)
+        allocator.release(db, code, parking_id, 50, ENTRY)
+    found = plates.history(db, "GJ 01")
+    assert [(row["plate"], row["slot"], row["visits"]) for row in found] == [("GJ01AB1234", "2A", 2)]
+    plan = " ".join(row[3] for row in db.execute(
+        "EXPLAIN QUERY PLAN " + plates._HISTORY_SQL.format(table="parkings"), ("GJ", "GK", 10)))
+    assert "idx_parkings_plate" in plan
+
+
+def test_plate_search_api(pms, admin):
+    admin.post("/park", data={"vehicle_number": "MH-12-XY-0001", "slot_code": "1A",
+                              "entry_time": "2024-05-01T08:00"})
+    body = admin.get("/api/plates?q=mh12&limit=0").get_json()
+    assert [p["slot"] for p in body["parked"]] == ["1A"]
+    assert body["history"][0]["visits"] == 1
+    assert admin.get("/api/plates?q=m").status_code == 400
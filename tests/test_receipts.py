@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import db_pool
+from allocation import SlotAllocator
+from conftest import login
+
+
+def _park_and_pay(pms, admin):
+    entry = (datetime.now() - timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M")
+    admin.post("/park", data={"vehicle_number": "KA01", "slot_code": "1A", "entry_time": entry})
+    assert admin.post("/confirm_payment/1A").get_json()["success"]
+    with pms.app.app_context():
+        return pms.get_db().execute("SELECT id FROM parkings").fetchone()[0]
+
+
+def test_viewing_an_open_receipt_writes_nothing(pms, admin):
+    entry = (datetime.now() - timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M")
+    admin.post("/park", data={"vehicle_number": "KA01", "slot_code": "1A", "entry_time": entry})
+    with pms.app.app_context():
+        before = pms.get_db().execute("SELECT * FROM parkings").fetchall()
+    response = admin.get("/receipt_by_slot/1A")
+    assert response.status_code == 200 and b"KA01" in response.data
+    assert "ETag" not in response.headers
+    with pms.app.app_context():
+        assert [tuple(r) for r in pms.get_db().execute("SELECT * FROM parkings")] == [tuple(r) for r in before]
+
+
+def test_paid_receipts_revalidate_with_304(pms, admin):
+    parking_id = _park_and_pay(pms, admin)
+    first = admin.get(f"/receipt/{parking_id}")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and b"KA01" in first.data
+    assert admin.get(f"/receipt/{parking_id}", headers={"If-None-Match": etag}).status_code == 304
+    by_slot = admin.get("/receipt_by_slot/1A", headers={"If-None-Match": etag})
+    assert by_slot.status_code == 304
+
+
+def test_slot_receipt_revalidation_skips_the_database(pms, admin, monkeypatch):
+    _park_and_pay(pms, admin)
+    etag = admin.get("/receipt_by_slot/1A").headers["ETag"]
+    statements = []
+    monkeypatch.setattr(db_pool, "_observer", lambda sql, seconds: statements.append(sql))
+    assert admin.get("/receipt_by_slot/1A", headers={"If-None-Match": etag}).status_code == 304
+    assert statements == []
+    # Another worker parks a car in 1A; once this worker's slot view is too old to trust, it shows up
+    with pms.app.app_context():
+        SlotAllocator().claim(pms.get_db(), "1A", "KA02", None, datetime.now())
+    monkeypatch.setitem(pms.app.config, "SLOT_RECEIPT_MAX_AGE", 0)
+    response = admin.get("/receipt_by_slot/1A", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and b"KA02" in response.data
+
+
+def test_receipts_are_only_shown_to_their_owner(pms, admin):
+    parking_id = _park_and_pay(pms, admin)
+    stranger = login(pms.app.test_client(), user_id=2, role="customer", username="someone")
+    response = stranger.get(f"/receipt/{parking_id}")
+    assert response.status_code == 302 and "ETag" not in response.headers
@@ -0,0 +1,80 @@
+import random
+from datetime import datetime, timedelta
+
+from allocation import SlotAllocator
+from conftest import login
+from reservations import ReservationBook, ReservationIndex
+from timeutil import from_epoch, to_epoch
+
+NOW = to_epoch(datetime.now())
+HOUR = 3600
+
+
+def test_index_agrees_with_a_brute_force_overlap_check():
+    rng = random.Random(5)
+    index, booked = ReservationIndex(max_seconds=6 * HOUR), []
+    for res_id in range(300):
+        code = f"{rng.randrange(10)}A"
+        start = rng.randrange(0, 200 * HOUR, 900)
+        end = start + rng.randrange(900, 6 * HOUR, 900)
+        if index.is_free(code, start, end):
+            index.add(res_id, code, start, end, f"KA{res_id}")
+            booked.append((res_id, code, start, end))
+    for res_id, code, start, end in booked[::3]:
+        index.remove(res_id)
+    booked = [b for b in booked if b[0] in index]
+    for _ in range(500):
+        start = rng.randrange(0, 200 * HOUR, 900)
+        end = start + rng.randrange(900, 12 * HOUR, 900)
+        assert index.busy_slots(start, end) == {c for _i, c, s, e in booked if s < end and e > start}
+
+
+def test_reserve_refuses_overlaps_and_skips_to_the_next_slot(db):
+    book = ReservationBook()
+    start = NOW + HOUR
+    assert book.reserve(db, ["1A"], "KA01", 1, start, start + 2 * HOUR, NOW)[1] == "1A"
+    assert book.reserve(db, ["1A"], "KA02", 1, start + HOUR, start + 3 * HOUR, NOW) == (None, None)
+    assert book.reserve(db, ["1A", "1B"], "KA02", 1, start + HOUR, start + 3 * HOUR, NOW)[1] == "1B"
+    # Back to back is not an overlap
+    assert book.reserve(db, ["1A"], "KA03", 1, start + 2 * HOUR, start + 3 * HOUR, NOW)[1] == "1A"
+    # Another worker's book catches up from the database
+    assert ReservationBook().refresh(db, NOW).busy_slots(start, start + HOUR) == {"1A"}
+
+
+def test_cancelled_reservations_free_the_slot(db):
+    book = ReservationBook()
+    start = NOW + HOUR
+    res_id, _code = book.reserve(db, ["1A"], "KA01", 1, start, start + HOUR, NOW)
+    other = ReservationBook()
+    other.refresh(db, NOW)
+    assert not book.cancel(db, res_id, user_id=2)
+    assert book.cancel(db, res_id, user_id=1)
+    assert other.refresh(db, NOW).is_free("1A", start, start + HOUR)
+
+
+def test_occupied_slots_are_not_reserved_before_their_car_leaves(db):
+    SlotAllocator().claim(db, "1A", "KA01", None, datetime.now(),
+                          exit_time=datetime.now() + timedelta(hours=3))
+    book = ReservationBook()
+    assert book.reserve(db, ["1A"], "KA02", 1, NOW + HOUR, NOW + 2 * HOUR, NOW) == (None, None)
+    assert book.reserve(db, ["1A"], "KA02", 1, NOW + 4 * HOUR, NOW + 5 * HOUR, NOW)[1] == "1A"
+
+
+def _window(start_ts, end_ts):
+    fmt = "%Y-%m-%dT%H:%M"
+    return {"from": from_epoch(start_ts).strftime(fmt),
+            "to": from_epoch(end_ts).strftime(fmt)}
+
+
+def test_park_and_availability_respect_reservations(pms):
+    client = login(pms.app.test_client(), user_id=2, role="customer", username="someone")
+    start = NOW - NOW % 60 + HOUR
+    client.post("/reservations", data=dict(_window(start, start + 2 * HOUR), vehicle_number="KA09", slot_code="1A"))
+    assert client.get("/api/availability", query_string=dict(_window(start, start + HOUR), slot="1A")).get_json()["free"] is False
+    assert client.get("/api/availability", query_string=_window(start, start + HOUR)).get_json()["slot"] == "1B"
+    walk_in = from_epoch(start - 30 * 60).strftime("%Y-%m-%dT%H:%M")
+    client.post("/park", data={"vehicle_number": "KA01", "slot_code": "1A", "entry_time": walk_in})
+    client.post("/park", data={"vehicle_number": "KA02", "slot_code": "auto", "entry_time": walk_in})
+    with pms.app.app_context():
+        parked = dict(pms.get_db().execute("SELECT vehicle_number, slot FROM parkings").fetchall())
+    assert parked == {"KA02": "1B"}
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+
+import rollups
+from allocation import SlotAllocator
+from timeutil import to_epoch
+
+ENTRY = datetime(2024, 5, 1, 8, 15)
+EXIT = datetime(2024, 5, 1, 10, 40)
+
+
+def _all_rollups(db):
+    return sorted(tuple(row) for row in db.execute("SELECT * FROM rollups"))
+
+
+def test_claims_and_payments_keep_rollups_up_to_date(db):
+    allocator = SlotAllocator()
+    first = allocator.claim(db, "1A", "KA01", None, ENTRY)
+    allocator.claim(db, "2B", "KA02", None, ENTRY)
+    allocator.release(db, "1A", first, 100, EXIT)
+
+    assert rollups.get(db) == {"entries": 2, "exits": 1, "payments": 1, "revenue": 100, "occupied": 1}
+    assert rollups.today(db, to_epoch(EXIT))["revenue"] == 100
+    assert rollups.get(db, scope="slot:2B")["occupied"] == 1
+    assert rollups.get(db, scope="level:1")["entries"] == 2
+    hours = rollups.series(db, "hour", to_epoch(datetime(2024, 5, 1)), to_epoch(datetime(2024, 5, 2)))
+    assert [(h["bucket"], h["entries"], h["exits"]) for h in hours] == [
+        (to_epoch(datetime(2024, 5, 1, 8)), 2, 0), (to_epoch(datetime(2024, 5, 1, 10)), 0, 1)]
+
+
+def test_record_reads_stored_levels_in_one_query(db):
+    db.execute("UPDATE slots SET level=7 WHERE code='1A'")
+    statements = []
+    db.set_trace_callback(statements.append)
+    rollups.record_entry(db, "1A", to_epoch(ENTRY))
+    db.set_trace_callback(None)
+    # One level lookup, then the upserts (traced once per executemany row)
+    assert [sql.split()[0] for sql in statements] == ["SELECT"] + ["INSERT"] * 9
+    assert rollups.get(db, scope="level:7")["entries"] == 1
+
+
+def test_rebuild_matches_the_incremental_rollups(db):
+    allocator = SlotAllocator()
+    for n, code in enumerate(["1A", "1B", "2A"]):
+        parking_id = allocator.claim(db, code, f"KA{n}", None, ENTRY)
+        if n:
+            allocator.release(db, code, parking_id, 50 * n, EXIT)
+    incremental = _all_rollups(db)
+    rollups.rebuild(db)
+    assert _all_rollups(db) == incremental
+
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_a_gate_exited_session_is_paid_once(pms, admin, monkeypatch, group_commit):
+    import gate_events
+    monkeypatch.setitem(pms.app.config, "GROUP_COMMIT", group_commit)
+    now = datetime.now().replace(microsecond=0)
+    with pms.app.app_context():
+        gate_events.ingest(pms.get_db(), pms.current_facility().allocator, [
+            {"event_id": "in", "type": "entry", "plate": "KA01", "slot": "1A", "timestamp": now.isoformat()},
+            {"event_id": "out", "type": "exit", "plate": "KA01", "timestamp": now.isoformat()},
+        ])
+    # Both confirmations read the session before either pays it, as concurrent requests would
+    read_session = pms.query_db
+    with pms.app.app_context():
+        unpaid = read_session("SELECT * FROM parkings WHERE slot='1A'", one=True)
+    monkeypatch.setattr(pms, "query_db", lambda sql, *args, **kwargs: unpaid if "FROM parkings WHERE slot=?" in sql
+                        else read_session(sql, *args, **kwargs))
+    responses = [admin.post("/confirm_payment/1A").get_json() for _ in range(2)]
+    assert [r["success"] for r in responses] == [True, False]
+    with pms.app.app_context():
+        db = pms.get_db()
+        assert rollups.get(db)["payments"] == 1
+        assert db.execute("SELECT COUNT(*) FROM gate_commands WHERE gate='exit'").fetchone()[0] == 1
+
+
+def test_pay_in_takes_payment_once(db):
+    allocator = SlotAllocator()
+    parking_id = allocator.claim(db, "1A", "KA01", None, ENTRY)
+    with db:
+        allocator.write_batch(db, [("exit", "1A", parking_id, EXIT)])
+    with db:
+        assert allocator.pay_in(db, "1A", parking_id, 100, EXIT)
+    with db:
+        assert not allocator.pay_in(db, "1A", parking_id, 100, EXIT)
+    assert rollups.get(db)["revenue"] == 100
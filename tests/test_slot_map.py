@@ -0,0 +1,29 @@
+import slot_map
+from slot_registry import SlotRegistry
+
+
+def test_model_groups_bays_into_rows():
+    registry = SlotRegistry.from_codes(["2B", "1A", "1B", "2-1A"])
+    registry.add("P1", level=1)
+    model = slot_map.build(registry)
+    assert [level["level"] for level in model] == [1, 2]
+    assert [(row["label"], [c["code"] for c in row["cells"]]) for row in model[0]["rows"]] == [
+        ("P1", ["P1"]), ("SLOT 1", ["1A", "1B"]), ("SLOT 2", ["2B"])]
+
+
+def test_deltas_and_cached_renders():
+    registry = SlotRegistry.from_codes(["1A", "1B"])
+    cache, renders = slot_map.SlotMapCache(), []
+
+    def render(model, version):
+        renders.append(version)
+        return f"<map {version}>"
+
+    html = cache.get(registry, render)
+    assert cache.get(registry, render) == html and len(renders) == 1
+    since = slot_map.version(registry)
+    registry.occupy("1B", vehicle="KA01")
+    assert slot_map.delta(registry, since) == [{"code": "1B", "status": "occupied"}]
+    assert slot_map.delta(registry, slot_map.version(registry)) == []
+    assert slot_map.delta(registry, "other:0") is None
+    assert cache.get(registry, render) != html and len(renders) == 2
@@ -0,0 +1,100 @@
+import threading
+
+from slot_registry import SlotRegistry, parse_code
+
+
+def test_parse_code():
+    assert parse_code("3B") == (1, 3, "B")
+    assert parse_code("2-15a") == (2, 15, "A")
+    assert parse_code("gate") == (1, 0, "")
+
+
+def test_nearest_free_follows_rank_level_and_zone():
+    registry = SlotRegistry()
+    for code, level, zone, rank in [("1A", 1, "A", 5), ("2A", 1, "A", 1), ("1B", 1, "B", 0), ("2-1A", 2, "A", 2)]:
+        registry.add(code, level=level, zone=zone, rank=rank)
+    assert registry.nearest_free().code == "1B"
+    assert registry.nearest_free(level=1, zone="A").code == "2A"
+    assert registry.nearest_free(level=2).code == "2-1A"
+    assert registry.nearest_free(skip={"1B", "2A"}).code == "2-1A"
+    # Skipped entries are put back
+    assert registry.nearest_free().code == "1B"
+    registry.occupy("1B", vehicle="KA01")
+    assert registry.nearest_free().code == "2A"
+    assert [s.code for s in registry.free_slots()] == ["2A", "2-1A", "1A"]
+    registry.release("1B")
+    assert registry.nearest_free().code == "1B"
+    assert registry.occupied_count == 0
+
+
+def test_heaps_stay_bounded_over_occupy_release_cycles():
+    registry = SlotRegistry.from_codes([f"{i}A" for i in range(1, 11)])
+    for n in range(10000):
+        code = f"{n % 10 + 1}A"
+        registry.occupy(code, vehicle="KA01")
+        registry.release(code)
+    assert all(len(heap) <= 2 * max(len(registry), 32) for heap in registry._heaps.values())
+    assert registry.free_count == 10
+    assert registry.nearest_free().code == "1A"
+
+
+def test_concurrent_claims_hand_out_each_slot_once():
+    registry = SlotRegistry.from_codes([f"{i}A" for i in range(200)])
+    claim_lock = threading.Lock()
+    claimed = []
+
+    def worker():
+        while True:
+            with claim_lock:
+                slot = registry.nearest_free()
+                if slot is None:
+                    return
+                registry.occupy(slot.code, vehicle="KA01")
+            claimed.append(slot.code)
+            # Readers run alongside the writers without the claim lock
+            registry.free_slots()
+            registry.changed_since(0)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(s.code for s in registry)
+    assert registry.occupied_count == 200 and registry.free_count == 0
+
+
+def test_concurrent_occupy_release_keeps_counts_consistent():
+    registry = SlotRegistry.from_codes([f"{i}A" for i in range(16)])
+    errors = []
+
+    def worker(codes):
+        try:
+            for _ in range(2000):
+                for code in codes:
+                    registry.occupy(code, vehicle="KA01")
+                    registry.free_slots()
+                    registry.release(code)
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=([f"{i}A", f"{i + 8}A"],)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert registry.occupied_count == 0 and registry.free_count == 16
+
+
+def test_changed_since_and_sessions():
+    registry = SlotRegistry.from_codes(["1A", "2A"])
+    seq = registry.seq
+    registry.occupy("1A", vehicle="KA01", parking_id=7)
+    assert registry.changed_since(seq) == {"1A"}
+    assert registry.changed_since(registry.seq) == set()
+    assert registry.last_session("1A") == 7
+    registry.remember_session("1A", 3)  # older than what was seen
+    assert registry.last_session("1A") == 7
+    registry.forget_session("1A")
+    assert registry.last_session("1A") is None
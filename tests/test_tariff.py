@@ -0,0 +1,58 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from tariff import Tariff, reprice
+from timeutil import to_epoch
+
+TARIFFS = [
+    {},
+    {"hourly_rate": 40, "min_hours": 2, "grace_minutes": 15},
+    {"hourly_rate": 60, "daily_cap": 500, "night_rate": 20, "night_start": 22, "night_end": 6},
+    {"hourly_rate": 30, "night_rate": 10, "night_start": 1, "night_end": 5, "daily_cap": 300},
+]
+
+
+def _stays(n, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    stays = []
+    for _ in range(n):
+        entry = start + timedelta(seconds=rng.randrange(365 * 86400))
+        stays.append((entry, entry + timedelta(seconds=rng.choice([0, 60, 899, 3599, 3600, 86399, 86400])
+                                               + rng.randrange(4 * 86400))))
+    return stays
+
+
+@pytest.mark.parametrize("config", TARIFFS)
+def test_batch_quotes_match_scalar_quotes(config):
+    tariff = Tariff.from_config(config)
+    stays = _stays(2000)
+    hours, amounts = tariff.quote_batch([to_epoch(e) for e, _x in stays], [to_epoch(x) for _e, x in stays])
+    expected = [tariff.quote(entry, exit_time) for entry, exit_time in stays]
+    assert hours.tolist() == [h for h, _a in expected]
+    assert np.allclose(amounts, [a for _h, a in expected])
+
+
+def test_night_hours_and_daily_cap():
+    tariff = Tariff.from_config(TARIFFS[2])
+    # 21:00-01:00: one day hour, three night hours
+    assert tariff.quote(datetime(2024, 5, 1, 21), datetime(2024, 5, 2, 1)) == (4, 60 + 3 * 20)
+    # Two full days, each capped
+    assert tariff.quote(datetime(2024, 5, 1, 8), datetime(2024, 5, 3, 8)) == (48, 1000)
+
+
+def test_reprice_streams_paid_sessions_in_batches(db):
+    stays = _stays(50, seed=3)
+    db.executemany(
+        "INSERT INTO parkings (vehicle_number, slot, entry_time, entry_ts, exit_ts, paid, paid_amount) "
+        "VALUES ('KA01', '1A', '', ?, ?, 1, 0)",
+        [(to_epoch(e), to_epoch(x)) for e, x in stays])
+    db.commit()
+    tariff = Tariff.from_config(TARIFFS[1])
+    batches = list(reprice(db, tariff, batch_size=20))
+    assert [len(ids) for ids, _charged, _amounts in batches] == [20, 20, 10]
+    repriced = np.concatenate([amounts for _ids, _charged, amounts in batches])
+    assert repriced.tolist() == [tariff.quote(e, x)[1] for e, x in stays]
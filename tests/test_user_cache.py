@@ -0,0 +1,28 @@
+from user_cache import UserCache
+
+
+def test_hits_misses_and_invalidation():
+    loads = []
+
+    def load(user_id):
+        loads.append(user_id)
+        return {"id": user_id} if user_id != 404 else None
+
+    cache = UserCache(max_size=2, ttl=60)
+    assert cache.get(1, load) == {"id": 1}
+    assert cache.get(1, load) == {"id": 1}
+    assert cache.get(404, load) is None and cache.get(404, load) is None
+    cache.get(2, load)
+    cache.get(3, load)  # evicts 1, the least recently used
+    cache.get(1, load)
+    cache.invalidate(1)
+    cache.get(1, load)
+    assert loads == [1, 404, 404, 2, 3, 1, 1]
+    assert cache.stats() == {"hits": 1, "misses": 7, "size": 2}
+
+
+def test_entries_expire_after_the_ttl():
+    cache = UserCache(ttl=0)
+    cache.get(1, lambda user_id: {"id": user_id})
+    cache.get(1, lambda user_id: {"id": user_id})
+    assert cache.stats()["misses"] == 2
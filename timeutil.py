@@ -0,0 +1,29 @@
+import calendar
+from datetime import datetime, timedelta
+
+# Format of the TEXT time columns in the database
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(dt):
+    """Naive local datetime -> integer seconds, treating wall-clock time as UTC.
+
+    Matches SQLite's strftime('%s', ...) on the TEXT columns, so the two
+    representations always agree.
+    """
+    return calendar.timegm(dt.timetuple()) if dt else None
+
+
+def from_epoch(ts):
+    return _EPOCH + timedelta(seconds=ts) if ts is not None else None
+
+
+def to_text(dt):
+    return dt.strftime(TIME_FORMAT) if dt else None
+
+
+def date_to_epoch(date_str):
+    """'YYYY-MM-DD' -> epoch seconds at local midnight"""
+    return to_epoch(datetime.strptime(date_str, "%Y-%m-%d")) if date_str else None